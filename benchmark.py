@@ -0,0 +1,653 @@
+import argparse
+import asyncio
+import copy
+import cProfile
+import io
+import json
+import logging
+import os
+import platform
+import pstats
+import sys
+import threading
+import tempfile
+import tracemalloc
+from random import Random
+from time import perf_counter, perf_counter_ns
+
+from order_book import BookManager, ConcurrentOrderBook, Gateway, OrderBook, ShardedBookManager
+from order_book.gateway import measure_latency
+from order_book.journal import Journal
+from order_book.replay import ASK, BID, EventWriter, Replay
+
+
+DEPTHS = [1000, 10000, 50000]
+OPERATIONS = ('set_ask', 'set_bid', 'del_ask', 'del_bid', 'report_market_data')
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+# генераторы потока заявок: последовательности (операция, *аргументы) с заранее известными id,
+# так как стакан нумерует заявки каждой стороны подряд
+class Flow:
+    def __init__(self, seed: int, resting_asks: list = (), resting_bids: list = ()):
+        self.rnd = Random(seed)
+        self.resting = {'ask': list(resting_asks), 'bid': list(resting_bids)}
+        self.next_id = {'ask': len(resting_asks) + 1, 'bid': len(resting_bids) + 1}
+
+    def add(self, side: str, price: float, quantity: int) -> tuple:
+        self.resting[side].append(self.next_id[side])
+        self.next_id[side] += 1
+        return f'set_{side}', round(price, 2), quantity
+
+    # снятие случайной стоящей заявки, иначе постановка
+    def cancel(self, side: str, price: float, quantity: int) -> tuple:
+        orders = self.resting[side]
+        if not orders:
+            return self.add(side, price, quantity)
+        i = self.rnd.randrange(len(orders))
+        orders[i], orders[-1] = orders[-1], orders[i]
+        return f'del_{side}', orders.pop()
+
+    def generate(self, count: int, price, cancel_share: float, report_share: float = 0.01,
+                 depth: int = 10) -> list:
+        rnd = self.rnd
+        flow = []
+        for _ in range(count):
+            side = 'ask' if rnd.random() < 0.5 else 'bid'
+            roll = rnd.random()
+            if roll < report_share:
+                flow.append(('report_market_data', depth))
+            elif roll < report_share + cancel_share:
+                flow.append(self.cancel(side, price(side), rnd.randint(1, 100)))
+            else:
+                flow.append(self.add(side, price(side), rnd.randint(1, 100)))
+        return flow
+
+
+# равномерно распределенные цены по широкому диапазону
+def uniform_flow(count: int, seed: int) -> tuple:
+    flow = Flow(seed)
+    return OrderBook(), flow.generate(count, lambda side: flow.rnd.uniform(1, 1000), cancel_share=0.3)
+
+
+# цены скучены у лучших цен: asks выше, bids ниже середины на несколько шагов цены
+def clustered_flow(count: int, seed: int) -> tuple:
+    flow = Flow(seed)
+
+    def price(side: str) -> float:
+        offset = abs(flow.rnd.gauss(0, 5)) * 0.01 + 0.01
+        return 100 + offset if side == 'ask' else 100 - offset
+
+    return OrderBook(), flow.generate(count, price, cancel_share=0.3)
+
+
+# большая часть потока - снятия
+def cancel_heavy_flow(count: int, seed: int) -> tuple:
+    flow = Flow(seed)
+    return OrderBook(), flow.generate(count, lambda side: flow.rnd.uniform(90, 110), cancel_share=0.6)
+
+
+# тот же поток поверх заранее загруженного глубокого стакана
+def deep_book_flow(count: int, seed: int, depth: int = 100000) -> tuple:
+    rnd = Random(seed + 1)
+    book = OrderBook()
+    book.set_asks([rnd.randint(1, 100000) / 100 for _ in range(depth)], [rnd.randint(1, 100) for _ in range(depth)])
+    book.set_bids([rnd.randint(1, 100000) / 100 for _ in range(depth)], [rnd.randint(1, 100) for _ in range(depth)])
+    flow = Flow(seed, range(1, depth + 1), range(1, depth + 1))
+    return book, flow.generate(count, lambda side: flow.rnd.uniform(1, 1000), cancel_share=0.4)
+
+
+SCENARIOS = {
+    'uniform': uniform_flow,
+    'clustered': clustered_flow,
+    'cancel_heavy': cancel_heavy_flow,
+    'deep_book': deep_book_flow
+}
+
+
+def percentile(ordered: list, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+# прогон потока через стакан: пропускная способность и перцентили задержки каждой операции
+def run_scenario(name: str, count: int, seed: int) -> dict:
+    book, flow = SCENARIOS[name](count, seed)
+    methods = {operation: getattr(book, operation) for operation in OPERATIONS}
+    latencies = {operation: [] for operation in OPERATIONS}
+    start = perf_counter()
+    for operation, *args in flow:
+        method = methods[operation]
+        began = perf_counter_ns()
+        method(*args)
+        latencies[operation].append(perf_counter_ns() - began)
+    seconds = perf_counter() - start
+
+    operations = {}
+    for operation, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        operations[operation] = {
+            "count": len(values),
+            "mean_us": sum(values) / len(values) / 1000,
+            **{f"p{p:g}_us": percentile(values, p) / 1000 for p in PERCENTILES}
+        }
+    return {"ops": count, "seconds": seconds, "throughput": count / seconds, "operations": operations}
+
+
+def run_suite(scenarios: list, count: int, seed: int) -> dict:
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "count": count,
+            "seed": seed
+        },
+        "results": {name: run_scenario(name, count, seed) for name in scenarios}
+    }
+
+
+# сравнение с базовым прогоном: падение пропускной способности или рост p50/p99 больше порога
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if result['throughput'] < base['throughput'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['throughput']:,.0f} -> {result['throughput']:,.0f} ops/s")
+        for operation, stats in result['operations'].items():
+            base_stats = base['operations'].get(operation)
+            if base_stats is None:
+                continue
+            for key in ('p50_us', 'p99_us'):
+                if stats[key] > base_stats[key] * (1 + threshold):
+                    regressions.append(f"{name}.{operation}: {key} {base_stats[key]:.2f} -> {stats[key]:.2f}")
+    return regressions
+
+
+def print_suite(suite: dict) -> None:
+    for name, result in suite['results'].items():
+        print(f"{name}: {result['throughput']:,.0f} ops/s")
+        for operation, stats in result['operations'].items():
+            print(f"  {operation:<20} n={stats['count']:<7} p50={stats['p50_us']:8.2f} us  "
+                  f"p99={stats['p99_us']:8.2f} us  p99.9={stats['p99.9_us']:8.2f} us")
+
+
+# стакан заданной глубины с уникальными ценами на каждой стороне
+def filled_book(depth: int, seed: int = 0, **book_options) -> tuple:
+    rnd = Random(seed)
+    book = OrderBook(**book_options)
+    prices = rnd.sample(range(1, depth * 10), depth)
+    ask_ids = [book.set_ask(price / 100, rnd.randint(1, 1000)) for price in prices]
+    bid_ids = [book.set_bid(price / 100, rnd.randint(1, 1000)) for price in prices]
+    return book, ask_ids, bid_ids
+
+
+# средняя задержка снятия заявки в микросекундах в зависимости от глубины стакана; на каждом уровне одна
+# заявка, поэтому каждое снятие удаляет уровень из отсортированного списка цен
+def bench_cancel(depth: int, cancels: int = 1000) -> float:
+    book, ask_ids, _ = filled_book(depth)
+    ids = Random(1).sample(ask_ids, min(cancels, depth))
+    start = perf_counter()
+    for ask_id in ids:
+        book.del_ask(ask_id)
+    return (perf_counter() - start) / len(ids) * 1e6
+
+
+# пропускная способность постановки заявок, заявок в секунду
+def bench_insert(count: int = 100000, metrics: bool = False, trusted: bool = False) -> float:
+    rnd = Random(2)
+    orders = [(rnd.randint(1, 100000) / 100, rnd.randint(1, 1000)) for _ in range(count)]
+    book = OrderBook(trusted=trusted)
+    if metrics:
+        book.enable_metrics()
+    start = perf_counter()
+    for price, quantity in orders:
+        book.set_ask(price, quantity)
+    return count / (perf_counter() - start)
+
+
+# отклоненных заявок в секунду на потоке из некорректных цен и количеств
+def bench_rejects(count: int = 100000) -> float:
+    junk = [('1', 1), (1, 0), (-1.5, 1), (1, True), (None, 1)]
+    orders = [junk[i % len(junk)] for i in range(count)]
+    book = OrderBook()
+    start = perf_counter()
+    for price, quantity in orders:
+        try:
+            book.set_ask(price, quantity)
+        except ValueError:
+            pass
+    return count / (perf_counter() - start)
+
+
+# память в мегабайтах, занимаемая стаканом на миллион заявок
+def bench_memory(count: int = 100000) -> float:
+    rnd = Random(3)
+    orders = [(rnd.randint(1, 100000) / 100, rnd.randint(1, 1000)) for _ in range(count)]
+    tracemalloc.start()
+    book = OrderBook()
+    for price, quantity in orders:
+        book.set_ask(price, quantity)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del book
+    return used / count * 1000000 / 2 ** 20
+
+
+# задержка снапшота рыночных данных в микросекундах: без вывода и с форматированием в лог
+def bench_snapshot(depth: int, calls: int = 5) -> tuple:
+    book, _, _ = filled_book(depth)
+    best = book.asks.prices[0]
+    start = perf_counter()
+    for _ in range(calls):
+        # изменение лучшего уровня сбрасывает кэш снапшота
+        book.del_ask(book.set_ask(best, 1))
+        book.report_market_data()
+    silent = (perf_counter() - start) / calls * 1e6
+
+    logger = logging.getLogger('order_book')
+    handler = logging.StreamHandler(io.StringIO())
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        start = perf_counter()
+        for _ in range(calls):
+            book.del_ask(book.set_ask(best, 1))
+            book.report_market_data()
+        formatted = (perf_counter() - start) / calls * 1e6
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(logging.NOTSET)
+    return silent, formatted
+
+
+# задержка опроса лучших 10 уровней, когда между опросами меняются глубокие уровни
+def bench_top_of_book(depth: int, calls: int = 10000) -> float:
+    book, _, _ = filled_book(depth)
+    worst = book.asks.prices[-1]
+    start = perf_counter()
+    for i in range(calls):
+        book.del_ask(book.set_ask(worst + 1, 1))
+        book.report_market_data(depth=10)
+        book.best_bid()
+    return (perf_counter() - start) / calls * 1e6
+
+
+# пропускная способность сведения, заявок в секунду
+# sweep - почти каждая заявка пересекает спред и снимает несколько уровней,
+# passive - большинство заявок встает в стакан вне спреда
+def bench_matching(mix: str, count: int = 100000) -> float:
+    rnd = Random(4)
+    orders = []
+    for _ in range(count):
+        is_bid = rnd.random() < 0.5
+        if mix == 'sweep':
+            offset = rnd.randint(-5, 20)
+        else:
+            offset = rnd.randint(-100, 1) if rnd.random() < 0.9 else rnd.randint(1, 5)
+        price = 1000 + offset if is_bid else 1000 - offset
+        orders.append((is_bid, price / 100, rnd.randint(1, 100)))
+
+    book = OrderBook(matching=True)
+    start = perf_counter()
+    for i, (is_bid, price, quantity) in enumerate(orders):
+        if is_bid:
+            book.set_bid(price, quantity)
+        else:
+            book.set_ask(price, quantity)
+        if not i % 1000:
+            book.drain_trades()
+    return count / (perf_counter() - start)
+
+
+# загрузка стакана пакетом и по одной заявке, заявок в секунду
+def bench_bulk_load(count: int = 100000) -> tuple:
+    rnd = Random(5)
+    prices = [rnd.randint(1, 100000) / 100 for _ in range(count)]
+    quantities = [rnd.randint(1, 1000) for _ in range(count)]
+
+    book = OrderBook()
+    start = perf_counter()
+    for price, quantity in zip(prices, quantities):
+        book.set_ask(price, quantity)
+    single = count / (perf_counter() - start)
+
+    book = OrderBook()
+    start = perf_counter()
+    ids = book.set_asks(prices, quantities)
+    batch = count / (perf_counter() - start)
+
+    start = perf_counter()
+    book.del_asks(ids[::2])
+    cancel = len(ids[::2]) / (perf_counter() - start)
+    return single, batch, cancel
+
+
+# запрос накопленной глубины после изменения уровня, микросекунд на запрос:
+# индекс Фенвика против суммы по снапшоту. С new_levels между запросами появляется и снимается новый уровень
+def bench_depth_query(depth: int, calls: int = 1000, new_levels: bool = False, tick_size: float = None) -> tuple:
+    book, ids, _ = filled_book(depth, tick_size=tick_size)
+    rnd = Random(8)
+    limits = [rnd.randint(1, depth * 10) / 100 for _ in range(calls)]
+    taken = {round(level['price'] * 100) for level in book.report_market_data()['asks']}
+    free = [price / 100 for price in range(1, depth * 10) if price not in taken]
+    fresh = [rnd.choice(free) for _ in range(calls)]
+    results = []
+    book.depth_up_to(limits[0])
+    for indexed in (True, False):
+        start = perf_counter()
+        for i, limit in enumerate(limits):
+            if new_levels:
+                book.del_ask(book.set_ask(fresh[i], i % 50 + 1))
+            book.amend_ask(ids[i], quantity=i % 50 + 1)
+            if indexed:
+                book.depth_up_to(limit)
+            else:
+                sum(level['quantity'] for level in book.report_market_data()['asks'] if level['price'] <= limit)
+        results.append((perf_counter() - start) / calls * 1e6)
+    return tuple(results)
+
+
+# постановка и снятие заявок в пределах span тиков от лучшей цены, операций в секунду:
+# плотный массив уровней против отсортированного списка цен
+def bench_dense(span: int, count: int = 100000) -> tuple:
+    rnd = Random(9)
+    flow = [(1000 + rnd.randrange(span)) / 100 for _ in range(count)]
+    results = []
+    for dense in (span, None):
+        book = OrderBook(tick_size=0.01, dense=dense)
+        ids = [book.set_ask((1000 + tick) / 100, 1) for tick in range(0, span, 2)]
+        start = perf_counter()
+        for i, price in enumerate(flow):
+            ids.append(book.set_ask(price, 1))
+            book.del_ask(ids[i])
+        results.append(2 * count / (perf_counter() - start))
+    return tuple(results)
+
+
+# снятие всех заявок одного участника среди depth заявок других: cancel_all против цикла del_ask, мс
+def bench_cancel_all(depth: int, owned: int = 1000) -> tuple:
+    results = []
+    for mass in (True, False):
+        book, _, _ = filled_book(depth)
+        rnd = Random(10)
+        ids = [book.set_ask(rnd.randint(1, depth * 10) / 100, 1, owner='client') for _ in range(owned)]
+        start = perf_counter()
+        if mass:
+            book.cancel_all('client')
+        else:
+            for by_id in ids:
+                book.del_ask(by_id)
+        results.append((perf_counter() - start) * 1e3)
+    return tuple(results)
+
+
+# копия стакана из count заявок: миллисекунды clone() и copy.deepcopy и мегабайты, которые занимает копия
+# после изменения changes заявок (копии общих уровней и словари сторон)
+def bench_clone(count: int = 100000, changes: int = 1000) -> tuple:
+    book, ask_ids, _ = filled_book(count // 2)
+    start = perf_counter()
+    copy.deepcopy(book)
+    deep = (perf_counter() - start) * 1e3
+    start = perf_counter()
+    book.clone()
+    cloned = (perf_counter() - start) * 1e3
+    tracemalloc.start()
+    fork = book.clone()
+    for by_id in ask_ids[:changes]:
+        fork.amend_ask(by_id, quantity=1)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return cloned, deep, used / 2 ** 20
+
+
+# упакованный снапшот стакана из count заявок: миллисекунды dumps и loads, байт на заявку
+def bench_binary_snapshot(count: int = 100000) -> tuple:
+    book, _, _ = filled_book(count // 2)
+    start = perf_counter()
+    data = book.dumps()
+    dumped = perf_counter()
+    OrderBook.loads(data)
+    return (dumped - start) * 1e3, (perf_counter() - dumped) * 1e3, len(data) / count
+
+
+# снятие истекших заявок GTD шагами по времени, микросекунд на снятую заявку
+def bench_expiry(count: int = 100000, steps: int = 100) -> float:
+    rnd = Random(6)
+    book = OrderBook()
+    for _ in range(count):
+        book.set_ask(rnd.randint(1, 100000) / 100, 1, tif='GTD', expires=rnd.randint(1, steps))
+    start = perf_counter()
+    expired = sum(len(book.expire(now)) for now in range(1, steps + 1))
+    return (perf_counter() - start) / expired * 1e6
+
+
+# пропускная способность менеджера инструментов, команд в секунду:
+# workers=0 - все стаканы в текущем процессе, иначе шардирование по процессам пакетами по batch команд
+def bench_sharding(workers: int, count: int = 200000, symbols: int = 100, batch: int = 5000) -> float:
+    rnd = Random(6)
+    commands = [('set_ask' if rnd.random() < 0.5 else 'set_bid', f'SYM{rnd.randrange(symbols)}',
+                 rnd.randint(1, 10000) / 100, rnd.randint(1, 100)) for _ in range(count)]
+    if not workers:
+        manager = BookManager()
+        start = perf_counter()
+        for i in range(0, count, batch):
+            manager.execute_many(commands[i:i + batch])
+        return count / (perf_counter() - start)
+
+    with ShardedBookManager(workers=workers) as manager:
+        start = perf_counter()
+        for i in range(0, count, batch):
+            for command in commands[i:i + batch]:
+                manager.submit(*command)
+            manager.flush()
+        return count / (perf_counter() - start)
+
+
+# задержка запроса к шлюзу через локальный TCP, микросекунды
+def bench_gateway(count: int = 5000) -> dict:
+    async def run():
+        gateway = Gateway()
+        server = await gateway.start('127.0.0.1', 0)
+        try:
+            return await measure_latency(port=server.sockets[0].getsockname()[1], count=count)
+        finally:
+            server.close()
+            await server.wait_closed()
+            await gateway.stop()
+
+    return asyncio.run(run())
+
+
+# восстановление стакана, заявок в секунду: повтор через публичный API,
+# загрузка снапшота через mmap и повтор журнала
+def bench_recovery(count: int = 100000) -> tuple:
+    rnd = Random(7)
+    orders = [(rnd.randint(1, 100000) / 100, rnd.randint(1, 1000)) for _ in range(count)]
+
+    start = perf_counter()
+    book = OrderBook()
+    for price, quantity in orders:
+        book.set_ask(price, quantity)
+    public = count / (perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as path:
+        wal, snap = os.path.join(path, 'book.wal'), os.path.join(path, 'book.snap')
+        journal = Journal(wal, snap, group_size=4096)
+        book = journal.recover()
+        for price, quantity in orders:
+            book.set_ask(price, quantity)
+        journal.close()
+
+        start = perf_counter()
+        Journal(wal, snap).recover()
+        replay = count / (perf_counter() - start)
+
+        journal = Journal(wal, snap)
+        journal.recover()
+        journal.checkpoint()
+        journal.close()
+        start = perf_counter()
+        Journal(wal, snap).recover()
+        snapshot = count / (perf_counter() - start)
+
+    return public, replay, snapshot
+
+
+# повтор файла событий: события в секунду (постановки и снятия вперемешку)
+def bench_replay(count: int = 300000) -> float:
+    rnd = Random(8)
+    with tempfile.TemporaryDirectory() as path:
+        path = os.path.join(path, 'events.bin')
+        resting = {ASK: [], BID: []}
+        with EventWriter(path) as writer:
+            for i in range(count):
+                side = ASK if rnd.random() < 0.5 else BID
+                if resting[side] and rnd.random() < 0.4:
+                    orders = resting[side]
+                    j = rnd.randrange(len(orders))
+                    orders[j], orders[-1] = orders[-1], orders[j]
+                    writer.delete(i, side, orders.pop())
+                else:
+                    writer.add(i, side, i + 1, rnd.randint(1, 10000) / 100, rnd.randint(1, 100))
+                    resting[side].append(i + 1)
+        return Replay(OrderBook(), path, snapshot_every=50000, depth=10).run()['events_per_sec']
+
+
+# смешанная нагрузка на ConcurrentOrderBook: операций записи и чтения снапшота в секунду
+def bench_concurrent(writers: int, readers: int, seconds: float = 1.0) -> tuple:
+    book = ConcurrentOrderBook()
+    stop = threading.Event()
+    counts = {'write': 0, 'read': 0}
+
+    def write(seed: int):
+        rnd = Random(seed)
+        done = 0
+        while not stop.is_set():
+            price = rnd.randint(1, 10000) / 100
+            if done % 2:
+                book.del_ask(book.set_ask(price, 1))
+            else:
+                book.set_bid(price, 1)
+            done += 1
+        counts['write'] += done
+
+    def read():
+        done = 0
+        while not stop.is_set():
+            book.report_market_data(depth=10)
+            done += 1
+        counts['read'] += done
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=read) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts['write'] / seconds, counts['read'] / seconds
+
+
+# отдельные замеры возможностей стакана
+def features():
+    print('cancel latency (each cancel removes a level), us/op')
+    for depth in DEPTHS:
+        print(f'  depth={depth:>7}: {bench_cancel(depth):8.2f}')
+    print('snapshot latency, us/op (silent / debug-formatted)')
+    for depth in DEPTHS:
+        silent, formatted = bench_snapshot(depth)
+        print(f'  depth={depth:>7}: {silent:10.1f} / {formatted:10.1f}')
+    print('top-10 poll with deep updates, us/op')
+    for depth in DEPTHS:
+        print(f'  depth={depth:>7}: {bench_top_of_book(depth):8.2f}')
+    for mix in ('sweep', 'passive'):
+        print(f'matching throughput ({mix}): {bench_matching(mix):,.0f} orders/s')
+    single, batch, cancel = bench_bulk_load()
+    print(f'bulk load: {batch:,.0f} orders/s (single inserts {single:,.0f} orders/s), '
+          f'bulk cancel: {cancel:,.0f} orders/s')
+    print('depth_up_to after an update, us/op (indexed / summed snapshot)')
+    for depth in DEPTHS:
+        indexed, summed = bench_depth_query(depth)
+        print(f'  depth={depth:>7}: {indexed:10.2f} / {summed:10.1f}')
+    for tick_size, mode in ((None, 'prices'), (0.01, 'ticks')):
+        print(f'depth_up_to after a new level and an update ({mode}), us/op (indexed / summed snapshot)')
+        for depth in DEPTHS:
+            indexed, summed = bench_depth_query(depth, new_levels=True, tick_size=tick_size)
+            print(f'  depth={depth:>7}: {indexed:10.2f} / {summed:10.1f}')
+    print('tick ladder insert+cancel near the touch, ops/s (dense array / sorted list)')
+    for span in (1000, 10000, 100000):
+        dense, sorted_list = bench_dense(span)
+        print(f'  span={span:>7}: {dense:12,.0f} / {sorted_list:12,.0f}')
+    print('cancel 1000 orders of one owner, ms (cancel_all / del_ask loop)')
+    for depth in DEPTHS:
+        mass, loop = bench_cancel_all(depth)
+        print(f'  depth={depth:>7}: {mass:8.2f} / {loop:8.2f}')
+    print(f'GTD expiry: {bench_expiry():.2f} us per expired order')
+    cloned, deep, used = bench_clone()
+    print(f'fork of 100k orders: clone {cloned:.1f} ms (deepcopy {deep:.1f} ms), '
+          f'{used:.1f} MB after 1000 amends in the fork')
+    dumps_ms, loads_ms, size = bench_binary_snapshot()
+    print(f'binary snapshot of 100k orders: dumps {dumps_ms:.1f} ms, loads {loads_ms:.1f} ms, {size:.0f} bytes/order')
+    print(f'sharding throughput, commands/s ({os.cpu_count()} cpu)')
+    for workers in (0, 1, 2, 4):
+        print(f'  workers={workers}: {bench_sharding(workers):12,.0f}')
+    latency = bench_gateway()
+    print(f'gateway round trip: p50={latency["p50"]:.1f} us, p99={latency["p99"]:.1f} us')
+    public, replay, snapshot = bench_recovery()
+    print(f'recovery: snapshot {snapshot:,.0f} orders/s, journal replay {replay:,.0f} orders/s, '
+          f'public API {public:,.0f} orders/s')
+    print(f'replay: {bench_replay():,.0f} events/s')
+    print('concurrent book, ops/s (writes / top-10 reads)')
+    for writers, readers in ((1, 0), (1, 1), (1, 4), (2, 2)):
+        writes, reads = bench_concurrent(writers, readers)
+        print(f'  writers={writers} readers={readers}: {writes:10,.0f} / {reads:10,.0f}')
+    print(f'insert throughput: {bench_insert():,.0f} orders/s '
+          f'({bench_insert(metrics=True):,.0f} orders/s with metrics enabled)')
+    print(f'trusted insert throughput: {bench_insert(trusted=True):,.0f} orders/s, '
+          f'rejected input: {bench_rejects():,.0f} orders/s')
+    print(f'memory: {bench_memory():,.1f} MB per 1M resting orders')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OrderBook benchmark suite')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, may be repeated (default: all)')
+    parser.add_argument('--count', type=int, default=200000, help='operations per scenario')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results to a JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown')
+    parser.add_argument('--profile', action='store_true', help='print cProfile hot spots of the run')
+    parser.add_argument('--features', action='store_true', help='run feature benchmarks instead')
+    args = parser.parse_args()
+
+    if args.features:
+        features()
+        return 0
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    suite = run_suite(args.scenario or list(SCENARIOS), args.count, args.seed)
+    if profiler is not None:
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats('tottime').print_stats(15)
+    print_suite(suite)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(suite, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(suite, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
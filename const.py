@@ -3,5 +3,11 @@ class Errors:
     QUANTITY_ZERO = '<quantity> must be bigger than Zero'
     PRICE_TYPE = '<price> must be Float or Integer'
     PRICE_ZERO = '<price> must be bigger than Zero'
+    PRICE_RANGE = '<price> is out of range'
     ID_TYPE = '<id> must be Integer'
     ID_ZERO = '<id> must be bigger than Zero'
+    AMEND_EMPTY = '<quantity> or <price> must be set'
+    TIF_VALUE = '<tif> must be one of GTC, IOC, FOK, GTD'
+    TIF_MATCHING = '<tif> IOC and FOK require OrderBook(matching=True)'
+    EXPIRES_MISSING = '<expires> must be set for GTD'
+    EXPIRES_UNEXPECTED = '<expires> is allowed only for GTD'
@@ -1 +1,4 @@
 from order_book.order_book import OrderBook, Ask, Bid
+from order_book.manager import BookManager, ShardedBookManager
+from order_book.gateway import Gateway, GatewayClient
+from order_book.concurrent import ConcurrentOrderBook
@@ -0,0 +1,141 @@
+import threading
+
+from .ladder import Ladder
+from .order_book import OrderBook
+from .utils import format_market_data, market_data_array
+from .validator import check_int
+
+
+# методы, меняющие состояние стакана
+WRITERS = (
+    'set_ask', 'set_bid', 'del_ask', 'del_bid',
+    'set_asks', 'set_bids', 'del_asks', 'del_bids',
+    'amend_ask', 'amend_bid', 'expire', 'cancel_all', 'drain_deltas', 'drain_trades'
+)
+READ_ATTEMPTS = 16
+
+
+def _locked(method):
+    def writer(self, *args, **kwargs):
+        with self._lock:
+            # нечетная версия означает, что запись в процессе (seqlock)
+            self._version += 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._version += 1
+
+    writer.__name__ = method.__name__
+    writer.__doc__ = method.__doc__
+    return writer
+
+
+# стакан для нескольких потоков: записи выполняются под одной блокировкой,
+# читатели собирают снапшот без блокировки и проверяют, что версия не изменилась за время чтения;
+# готовый снапшот публикуется для других читателей до следующей записи
+class ConcurrentOrderBook(OrderBook):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._version = 0
+        self._published = {}
+
+    @property
+    def version(self):
+        return self._version
+
+    # копия собирается под блокировкой и получает свою блокировку и версию
+    def clone(self) -> 'ConcurrentOrderBook':
+        with self._lock:
+            other = super().clone()
+        other._lock = threading.Lock()
+        other._version = 0
+        other._published = {}
+        return other
+
+    def _read(self, build):
+        for _ in range(READ_ATTEMPTS):
+            version = self._version
+            if version % 2:
+                continue
+            try:
+                result = build()
+            except (KeyError, IndexError, RuntimeError):
+                continue
+            if self._version == version:
+                return version, result
+        with self._lock:
+            return self._version, build()
+
+    def _build_side(self, side: Ladder, depth: int) -> list:
+        prices = side.prices[:] if depth is None else side.top(depth)[:]
+        levels = side.levels
+        to_price = None if self.tick_size is None else self.to_price
+        return format_market_data([levels[price] for price in prices], to_price)
+
+    def _build(self, depth: int) -> dict:
+        return {
+            "seq": self._seq,
+            "asks": self._build_side(self._asks, depth),
+            "bids": self._build_side(self._bids, depth)
+        }
+
+    def _published_snapshot(self, depth: int) -> dict:
+        if depth is not None:
+            check_int('depth', depth)
+        published = self._published.get(depth)
+        if published is not None and published[0] == self._version:
+            return published[1]
+        version, snapshot = self._read(lambda: self._build(depth))
+        self._published[depth] = version, snapshot
+
+        return snapshot
+
+    # возвращаемые снапшоты общие для всех читателей, изменять их нельзя
+    def report_market_data(self, depth: int = None) -> dict:
+        snapshot = self._published_snapshot(depth)
+        return {"asks": snapshot['asks'], "bids": snapshot['bids']}
+
+    def snapshot(self, depth: int = None) -> dict:
+        return dict(self._published_snapshot(depth))
+
+    def _build_arrays(self, depth: int) -> dict:
+        return {
+            side_name: market_data_array(side.levels, side.prices[:] if depth is None else side.top(depth)[:],
+                                         self._tick_size, self._tick_digits)
+            for side_name, side in (("asks", self._asks), ("bids", self._bids))
+        }
+
+    def market_data_arrays(self, depth: int = None) -> dict:
+        if depth is not None:
+            check_int('depth', depth)
+        return self._read(lambda: self._build_arrays(depth))[1]
+
+    # снапшот всех заявок собирается долго и почти всегда пересекся бы с записью, поэтому он идет под блокировкой
+    def dumps(self, position: int = 0) -> bytes:
+        with self._lock:
+            return super().dumps(position)
+
+    # индекс накопленной глубины достраивается при запросе, поэтому такие запросы идут под блокировкой
+    def depth_up_to(self, *args, **kwargs):
+        with self._lock:
+            return super().depth_up_to(*args, **kwargs)
+
+    def price_for_quantity(self, *args, **kwargs):
+        with self._lock:
+            return super().price_for_quantity(*args, **kwargs)
+
+    def sweep_vwap(self, *args, **kwargs):
+        with self._lock:
+            return super().sweep_vwap(*args, **kwargs)
+
+    def best_ask(self):
+        return self._read(lambda: self._best(self._asks))[1]
+
+    def best_bid(self):
+        return self._read(lambda: self._best(self._bids))[1]
+
+
+for _name in WRITERS:
+    setattr(ConcurrentOrderBook, _name, _locked(getattr(OrderBook, _name)))
+del _name
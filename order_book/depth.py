@@ -0,0 +1,278 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from .ladder import Ladder
+
+
+# размер блока уровней: новый уровень вставляется в список блока, блок больше 2 * BLOCK делится пополам
+BLOCK = 128
+# в режиме тиков окно дерева не больше SPARSE позиций на живой уровень (и не меньше MIN_WINDOW),
+# иначе стакан слишком разрежен и индексируется блоками
+SPARSE = 16
+MIN_WINDOW = 1 << 16
+
+
+def _fenwick(values: list) -> list:
+    tree = [0] + values
+    size = len(tree)
+    for position in range(1, size):
+        parent = position + (position & -position)
+        if parent < size:
+            tree[parent] += tree[position]
+    return tree
+
+
+def _add(tree: list, position: int, delta) -> None:
+    size = len(tree)
+    while position < size:
+        tree[position] += delta
+        position += position & -position
+
+
+def _prefix(tree: list, position: int):
+    total = 0
+    while position:
+        total += tree[position]
+        position &= position - 1
+    return total
+
+
+# первая позиция, на которой накопленное количество достигает quantity, и остаток quantity на ней
+def _search(tree: list, quantity: int) -> tuple:
+    position, step = 0, 1 << (len(tree) - 1).bit_length()
+    while step:
+        following = position + step
+        if following < len(tree) and tree[following] < quantity:
+            position = following
+            quantity -= tree[following]
+        step >>= 1
+    return position + 1, quantity
+
+
+# накопленная глубина одной стороны: уровни от лучшей цены лежат блоками (ключи сортировки, количества,
+# объемы в деньгах), над суммами блоков - деревья Фенвика по количеству и объему. Индекс строится при первом
+# запросе, затем каждое изменение уровня, в том числе появление нового, обновляет его за O(log блоков + BLOCK)
+# без перестроения. У заявок на покупку ключ сортировки - цена со знаком минус
+class DepthIndex:
+    __slots__ = ('_ladder', 'tree', '_notional', '_keys', '_firsts', '_quantities', '_amounts')
+
+    def __init__(self, ladder: Ladder):
+        self._ladder = ladder
+        self.tree = None
+        self._notional = None
+        self._keys = None
+        self._firsts = None  # первый ключ каждого блока
+        self._quantities = None
+        self._amounts = None
+
+    def reset(self) -> None:
+        self.tree = None
+
+    def _fresh(self) -> None:
+        if self.tree is None:
+            self._build()
+
+    def _build(self) -> None:
+        ladder = self._ladder
+        levels = ladder.levels
+        prices = list(ladder.walk())
+        keys = [-price for price in prices] if ladder.is_bid else prices
+        quantities = [levels[price].quantity for price in prices]
+        amounts = [quantity * price for quantity, price in zip(quantities, prices)]
+        chunks = range(0, len(prices), BLOCK)
+        self._keys = [keys[start:start + BLOCK] for start in chunks]
+        self._quantities = [quantities[start:start + BLOCK] for start in chunks]
+        self._amounts = [amounts[start:start + BLOCK] for start in chunks]
+        self._index_blocks()
+
+    # суммы блоков пересчитываются только при появлении или исчезновении блока
+    def _index_blocks(self) -> None:
+        self._firsts = [keys[0] for keys in self._keys]
+        self.tree = _fenwick([sum(quantities) for quantities in self._quantities])
+        self._notional = _fenwick([sum(amounts) for amounts in self._amounts])
+
+    def update(self, price) -> None:
+        level = self._ladder.levels.get(price)
+        quantity = 0 if level is None else level.quantity
+        key = -price if self._ladder.is_bid else price
+        blocks = self._keys
+        if not blocks:
+            if quantity:
+                self._keys, self._quantities, self._amounts = [[key]], [[quantity]], [[quantity * price]]
+                self._index_blocks()
+            return
+
+        block = max(bisect_right(self._firsts, key) - 1, 0)
+        keys, quantities, amounts = blocks[block], self._quantities[block], self._amounts[block]
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            delta = quantity - quantities[position]
+            if not delta:
+                return
+            if quantity:
+                quantities[position] = quantity
+                amounts[position] = quantity * price
+            else:
+                del keys[position], quantities[position], amounts[position]
+                if not keys:
+                    del blocks[block], self._quantities[block], self._amounts[block]
+                    self._index_blocks()
+                    return
+                self._firsts[block] = keys[0]
+        elif quantity:
+            delta = quantity
+            keys.insert(position, key)
+            quantities.insert(position, quantity)
+            amounts.insert(position, quantity * price)
+            self._firsts[block] = keys[0]
+            if len(keys) > 2 * BLOCK:
+                blocks.insert(block + 1, keys[BLOCK:])
+                self._quantities.insert(block + 1, quantities[BLOCK:])
+                self._amounts.insert(block + 1, amounts[BLOCK:])
+                del keys[BLOCK:], quantities[BLOCK:], amounts[BLOCK:]
+                self._index_blocks()
+                return
+        else:
+            return
+
+        _add(self.tree, block + 1, delta)
+        _add(self._notional, block + 1, delta * price)
+
+    def quantity_up_to(self, price) -> int:
+        self._fresh()
+        key = -price if self._ladder.is_bid else price
+        block = bisect_right(self._firsts, key) - 1
+        if block < 0:
+            return 0
+        position = bisect_right(self._keys[block], key)
+        return _prefix(self.tree, block) + sum(self._quantities[block][:position])
+
+    # блок и позиция в нем, на которой накопленное количество достигает quantity; None, если объема не хватает
+    def _locate(self, quantity: int):
+        self._fresh()
+        block, remaining = _search(self.tree, quantity)
+        if block >= len(self.tree):
+            return
+        block -= 1
+        position = bisect_left(list(accumulate(self._quantities[block])), remaining)
+        return block, position
+
+    def _price(self, block: int, position: int):
+        key = self._keys[block][position]
+        return -key if self._ladder.is_bid else key
+
+    def price_for(self, quantity: int):
+        located = self._locate(quantity)
+        if located is None:
+            return
+        return self._price(*located)
+
+    # средняя цена исполнения quantity по лучшим уровням в ключах уровней
+    def vwap(self, quantity: int):
+        located = self._locate(quantity)
+        if located is None:
+            return
+        block, position = located
+        filled = _prefix(self.tree, block) + sum(self._quantities[block][:position])
+        notional = _prefix(self._notional, block) + sum(self._amounts[block][:position])
+        return (notional + (quantity - filled) * self._price(block, position)) / quantity
+
+
+# накопленная глубина в режиме тиков: деревья Фенвика по позициям в окне тиков от лучшей цены, позиция уровня -
+# смещение его тика от базы, поэтому новый уровень внутри окна обновляет индекс за O(log окна).
+# Окно ставится с запасом в четверть размера со стороны улучшения цены и вдвое шире занятого диапазона;
+# уровень вне окна перестраивает индекс с новым окном. Для разреженного стакана индекс работает блоками
+class TickDepthIndex(DepthIndex):
+    __slots__ = ('_base', '_levels', '_sparse')
+
+    def __init__(self, ladder: Ladder):
+        super().__init__(ladder)
+        self._base = None
+        self._levels = None  # количество по позициям окна
+        self._sparse = False
+
+    def _build(self) -> None:
+        ladder = self._ladder
+        levels = ladder.levels
+        count = len(levels)
+        low, high = (min(levels), max(levels)) if count else (0, 0)
+        span = high - low + 1
+        size = 64
+        while size < 2 * span:
+            size *= 2
+        self._sparse = size > max(SPARSE * count, MIN_WINDOW)
+        if self._sparse:
+            super()._build()
+            return
+
+        self._base = high + size // 4 if ladder.is_bid else low - size // 4
+        quantities = [0] * size
+        amounts = [0] * size
+        for price, level in levels.items():
+            position = self._position(price) - 1
+            quantities[position] = level.quantity
+            amounts[position] = level.quantity * price
+        self._levels = [0] + quantities
+        self.tree = _fenwick(quantities)
+        self._notional = _fenwick(amounts)
+
+    # позиция тика от лучшего края окна, с единицы
+    def _position(self, price: int) -> int:
+        return (self._base - price if self._ladder.is_bid else price - self._base) + 1
+
+    def update(self, price) -> None:
+        if self._sparse:
+            super().update(price)
+            return
+        level = self._ladder.levels.get(price)
+        quantity = 0 if level is None else level.quantity
+        position = self._position(price)
+        if not 0 < position < len(self.tree):
+            if quantity:
+                self._build()
+            return
+        delta = quantity - self._levels[position]
+        if not delta:
+            return
+        self._levels[position] = quantity
+        _add(self.tree, position, delta)
+        _add(self._notional, position, delta * price)
+
+    def quantity_up_to(self, price) -> int:
+        self._fresh()
+        if self._sparse:
+            return super().quantity_up_to(price)
+        position = min(max(self._position(price), 0), len(self.tree) - 1)
+        return _prefix(self.tree, position)
+
+    def _locate(self, quantity: int):
+        self._fresh()
+        if self._sparse:
+            return super()._locate(quantity)
+        position, _ = _search(self.tree, quantity)
+        if position >= len(self.tree):
+            return
+        return position
+
+    def price_for(self, quantity: int):
+        self._fresh()
+        if self._sparse:
+            return super().price_for(quantity)
+        position = self._locate(quantity)
+        if position is None:
+            return
+        return self._tick(position)
+
+    def _tick(self, position: int) -> int:
+        return self._base - position + 1 if self._ladder.is_bid else self._base + position - 1
+
+    def vwap(self, quantity: int):
+        self._fresh()
+        if self._sparse:
+            return super().vwap(quantity)
+        position = self._locate(quantity)
+        if position is None:
+            return
+        filled = _prefix(self.tree, position - 1)
+        notional = _prefix(self._notional, position - 1)
+        return (notional + (quantity - filled) * self._tick(position)) / quantity
@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import logging
+import struct
+from time import perf_counter
+
+from .manager import BookManager
+
+logger = logging.getLogger('order_book')
+
+# кадр: длина тела (4 байта) и тело; тело начинается с типа сообщения и номера запроса,
+# символ инструмента занимает остаток тела
+FRAME = struct.Struct('!I')
+HEADER = struct.Struct('!BI')
+ADD = struct.Struct('!BIBdQ')  # сторона, цена, количество
+CANCEL = struct.Struct('!BIBQ')  # сторона, id заявки
+QUERY = struct.Struct('!BIH')  # глубина, 0 - весь стакан
+ACK = struct.Struct('!BIQ')  # id заявки, 0 - заявка не найдена
+MARKET_DATA = struct.Struct('!BIQII')  # seq, число уровней asks и bids
+LEVEL = struct.Struct('!dQ')  # цена, количество
+DELTA = struct.Struct('!BIQBdQ')  # seq, сторона, цена, количество
+TRADE = struct.Struct('!BIdQQQB')  # цена, количество, id заявок ask и bid, сторона инициатора
+
+MSG_ADD, MSG_CANCEL, MSG_QUERY, MSG_SUBSCRIBE = 1, 2, 3, 4
+MSG_ACK, MSG_ERROR, MSG_MARKET_DATA, MSG_DELTA, MSG_TRADE = 101, 102, 103, 104, 105
+ASK, BID = 0, 1
+# количество в кадрах протокола - беззнаковое 64-битное, объем уровня не может его превышать
+MAX_QUANTITY = 2 ** 64 - 1
+
+
+def frame(body: bytes) -> bytes:
+    return FRAME.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    size, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return await reader.readexactly(size)
+
+
+def encode_market_data(request: int, seq: int, market_data: dict) -> bytes:
+    asks, bids = market_data['asks'], market_data['bids']
+    levels = b''.join(LEVEL.pack(level['price'], level['quantity']) for level in asks + bids)
+    return MARKET_DATA.pack(MSG_MARKET_DATA, request, seq, len(asks), len(bids)) + levels
+
+
+def decode_market_data(body: bytes) -> dict:
+    _, _, seq, asks, bids = MARKET_DATA.unpack_from(body)
+    levels = [{"price": price, "quantity": quantity}
+              for price, quantity in LEVEL.iter_unpack(body[MARKET_DATA.size:])]
+    return {"seq": seq, "asks": levels[:asks], "bids": levels[asks:asks + bids]}
+
+
+def _encode_trade(trade: dict) -> bytes:
+    return TRADE.pack(MSG_TRADE, 0, trade['price'], trade['quantity'], trade['ask_id'], trade['bid_id'],
+                      BID if trade['aggressor'] == 'bid' else ASK)
+
+
+def _encode_delta(delta: dict) -> bytes:
+    return DELTA.pack(MSG_DELTA, 0, delta['seq'], BID if delta['side'] == 'bid' else ASK,
+                      delta['price'], delta['quantity'])
+
+
+# шлюз: соединения только читают кадры в очередь, все стаканы меняет одна задача
+# цикла событий, поэтому блокировки не нужны; сделки (в режиме сведения) и изменения уровней
+# рассылаются подписчикам после обработки каждой пачки накопившихся сообщений
+class Gateway:
+    def __init__(self, **book_options):
+        # без record_deltas подписчики получают только сделки
+        self._record_deltas = book_options.setdefault('record_deltas', True)
+        self.manager = BookManager(**book_options)
+        self._queue = None
+        self._engine = None
+        self._subscribers = {}
+        self._touched = set()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0, path: str = None):
+        self._queue = asyncio.Queue()
+        self._engine = asyncio.get_running_loop().create_task(self._run())
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle, path=path)
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def stop(self) -> None:
+        if self._engine is not None:
+            self._engine.cancel()
+            try:
+                await self._engine
+            except asyncio.CancelledError:
+                pass
+            self._engine = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                self._queue.put_nowait((writer, await read_frame(reader)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for writers in self._subscribers.values():
+                writers.discard(writer)
+            writer.close()
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            writer, body = await queue.get()
+            self._apply(writer, body)
+            while not queue.empty():
+                writer, body = queue.get_nowait()
+                self._apply(writer, body)
+            try:
+                self._publish()
+            except Exception as err:
+                self._touched.clear()
+                logger.debug('publish failed: %s', err)
+
+    def _apply(self, writer: asyncio.StreamWriter, body: bytes) -> None:
+        if writer.is_closing():
+            return
+        try:
+            kind, request = HEADER.unpack_from(body)
+        except struct.error:
+            kind, request = 0, 0
+        try:
+            if kind == MSG_ADD:
+                _, _, side, price, quantity = ADD.unpack_from(body)
+                symbol = body[ADD.size:].decode()
+                book = self.manager.book(symbol)
+                level = self._level(book, side, price)
+                if level is not None and level.quantity > MAX_QUANTITY - quantity:
+                    raise ValueError(f'<quantity> would make the level exceed {MAX_QUANTITY}')
+                order_id = book.set_bid(price, quantity) if side == BID else book.set_ask(price, quantity)
+                self._touched.add(symbol)
+                reply = ACK.pack(MSG_ACK, request, order_id)
+            elif kind == MSG_CANCEL:
+                _, _, side, order_id = CANCEL.unpack_from(body)
+                symbol = body[CANCEL.size:].decode()
+                book = self.manager.book(symbol)
+                order = book.del_bid(order_id) if side == BID else book.del_ask(order_id)
+                self._touched.add(symbol)
+                reply = ACK.pack(MSG_ACK, request, 0 if order is None else order.id)
+            elif kind == MSG_QUERY:
+                _, _, depth = QUERY.unpack_from(body)
+                snapshot = self.manager.book(body[QUERY.size:].decode()).snapshot(depth or None)
+                reply = encode_market_data(request, snapshot['seq'], snapshot)
+            elif kind == MSG_SUBSCRIBE:
+                self._subscribers.setdefault(body[HEADER.size:].decode(), set()).add(writer)
+                reply = ACK.pack(MSG_ACK, request, 0)
+            else:
+                raise ValueError(f'unknown message type {kind}')
+        except Exception as err:
+            # ошибка одного сообщения возвращается клиенту и не останавливает задачу стаканов
+            reply = HEADER.pack(MSG_ERROR, request) + str(err).encode()
+        writer.write(frame(reply))
+
+    # уровень, на который встанет заявка; ошибку цены сообщает сам стакан при постановке
+    @staticmethod
+    def _level(book, side: int, price: float):
+        try:
+            key = book._check.key(price)
+        except ValueError:
+            return None
+        return (book.bids if side == BID else book.asks).levels.get(key)
+
+    # сделки и изменения уровней забираются из стакана при каждой рассылке, даже без подписчиков,
+    # чтобы они не копились в стакане
+    def _publish(self) -> None:
+        for symbol in self._touched:
+            book = self.manager.book(symbol)
+            trades = book.drain_trades()
+            deltas = book.drain_deltas() if self._record_deltas else []
+            writers = self._subscribers.get(symbol)
+            if not writers or not (deltas or trades):
+                continue
+            encoded = symbol.encode()
+            message = b''.join(self._encode(_encode_trade, trades, encoded)) + \
+                b''.join(self._encode(_encode_delta, deltas, encoded))
+            for writer in writers:
+                if not writer.is_closing():
+                    writer.write(message)
+        self._touched.clear()
+
+    # сообщение, которое не помещается в формат протокола, пропускается и не останавливает рассылку
+    @staticmethod
+    def _encode(encoder, items: list, symbol: bytes):
+        for item in items:
+            try:
+                yield frame(encoder(item) + symbol)
+            except (struct.error, ValueError, KeyError) as err:
+                logger.debug('%s is not published: %s', item, err)
+
+
+# клиент шлюза: ответы сопоставляются запросам по номеру, изменения уровней попадают в очередь deltas,
+# сделки - в очередь trades
+class GatewayClient:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._request = 0
+        self._waiters = {}
+        self.deltas = asyncio.Queue()
+        self.trades = asyncio.Queue()
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    @classmethod
+    async def connect(cls, host: str = '127.0.0.1', port: int = 0, path: str = None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def close(self) -> None:
+        self._listener.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def _listen(self) -> None:
+        try:
+            while True:
+                body = await read_frame(self._reader)
+                kind, request = HEADER.unpack_from(body)
+                if kind == MSG_DELTA:
+                    _, _, seq, side, price, quantity = DELTA.unpack_from(body)
+                    self.deltas.put_nowait({
+                        "symbol": body[DELTA.size:].decode(), "seq": seq,
+                        "side": "bid" if side == BID else "ask", "price": price, "quantity": quantity
+                    })
+                    continue
+                if kind == MSG_TRADE:
+                    _, _, price, quantity, ask_id, bid_id, aggressor = TRADE.unpack_from(body)
+                    self.trades.put_nowait({
+                        "symbol": body[TRADE.size:].decode(), "price": price, "quantity": quantity,
+                        "ask_id": ask_id, "bid_id": bid_id, "aggressor": "bid" if aggressor == BID else "ask"
+                    })
+                    continue
+                waiter = self._waiters.pop(request, None)
+                if waiter is None or waiter.done():
+                    continue
+                if kind == MSG_ERROR:
+                    waiter.set_exception(ValueError(body[HEADER.size:].decode()))
+                elif kind == MSG_MARKET_DATA:
+                    waiter.set_result(decode_market_data(body))
+                else:
+                    waiter.set_result(ACK.unpack_from(body)[2])
+        except (asyncio.IncompleteReadError, ConnectionError) as err:
+            for waiter in self._waiters.values():
+                if not waiter.done():
+                    waiter.set_exception(ConnectionError(str(err)))
+            self._waiters.clear()
+
+    async def _call(self, body: bytes):
+        waiter = self._waiters[HEADER.unpack_from(body)[1]] = asyncio.get_running_loop().create_future()
+        self._writer.write(frame(body))
+        return await waiter
+
+    def _next_request(self) -> int:
+        self._request = self._request % 0xFFFFFFFF + 1
+        return self._request
+
+    async def add(self, symbol: str, side: str, price: float, quantity: int) -> int:
+        side = BID if side == 'bid' else ASK
+        return await self._call(ADD.pack(MSG_ADD, self._next_request(), side, price, quantity) + symbol.encode())
+
+    # возвращает id снятой заявки или 0, если заявки нет
+    async def cancel(self, symbol: str, side: str, order_id: int) -> int:
+        side = BID if side == 'bid' else ASK
+        return await self._call(CANCEL.pack(MSG_CANCEL, self._next_request(), side, order_id) + symbol.encode())
+
+    async def query(self, symbol: str, depth: int = 0) -> dict:
+        return await self._call(QUERY.pack(MSG_QUERY, self._next_request(), depth) + symbol.encode())
+
+    async def subscribe(self, symbol: str) -> None:
+        await self._call(HEADER.pack(MSG_SUBSCRIBE, self._next_request()) + symbol.encode())
+
+
+# генератор нагрузки: последовательные запросы постановки и снятия, задержка туда-обратно в микросекундах
+async def measure_latency(host: str = '127.0.0.1', port: int = 0, path: str = None,
+                          count: int = 10000, symbol: str = 'BENCH') -> dict:
+    client = await GatewayClient.connect(host, port, path)
+    latencies = []
+    try:
+        for i in range(count):
+            start = perf_counter()
+            order_id = await client.add(symbol, 'bid' if i % 2 else 'ask', 100 + (i % 50) / 10, 1)
+            latencies.append(perf_counter() - start)
+            if i % 3 == 0:
+                start = perf_counter()
+                await client.cancel(symbol, 'bid' if i % 2 else 'ask', order_id)
+                latencies.append(perf_counter() - start)
+    finally:
+        await client.close()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "p50": latencies[len(latencies) // 2] * 1e6,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "mean": sum(latencies) / len(latencies) * 1e6
+    }
+
+
+async def _serve(args) -> None:
+    gateway = Gateway()
+    server = await gateway.start(args.host, args.port, args.path)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OrderBook asyncio gateway')
+    parser.add_argument('command', choices=('serve', 'load'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--path', help='unix socket path instead of TCP')
+    parser.add_argument('--count', type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        asyncio.run(_serve(args))
+    else:
+        print(asyncio.run(measure_latency(args.host, args.port, args.path, args.count)))
+
+
+if __name__ == '__main__':
+    main()
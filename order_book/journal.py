@@ -0,0 +1,293 @@
+import mmap
+import os
+import struct
+from math import isnan, nan
+
+from .order_book import OrderBook, Ask, Bid
+from .snapshot import decode_owner, dumps, encode_owner, loads, read_header
+
+
+# запись журнала фиксированного размера: номер записи, операция, сторона, id, цена (ключ уровня), количество,
+# время истечения заявки GTD (NaN - без срока), seq стакана перед операцией, номер метки владельца (0 - нет)
+RECORDS = {
+    False: struct.Struct('<QBBQdQdQQ'),  # цены float
+    True: struct.Struct('<QBBQqQdQQ')  # цены в тиках
+}
+# OP_ID - id выдан заявке, которая не изменила стакан (IOC или FOK без исполнения);
+# OP_OWNER - определение метки владельца по номеру до первой записи с ней
+OP_ADD, OP_DEL, OP_AMEND, OP_ID, OP_OWNER = 1, 2, 3, 4, 5
+# запись OP_OWNER того же размера: номер записи, операция, 0, номер метки, последний ли кусок, длина куска, кусок
+# байтов метки; длинная метка занимает несколько записей подряд
+CHUNK = RECORDS[False].size - struct.calcsize('<QBBQBB')
+OWNER = struct.Struct(f'<QBBQBB{CHUNK}s')
+# заголовок файла журнала перед записями: сигнатура, версия формата записей, шаг цены (0 - нет)
+MAGIC = b'OBWL'
+VERSION = 2
+HEADER = struct.Struct('<4sBd')
+
+
+def _check_header(data, tick_size: float = None) -> None:
+    if len(data) < HEADER.size:
+        raise ValueError('journal is truncated')
+    magic, version, written = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not an order book journal')
+    if version != VERSION:
+        raise ValueError(f'journal format version {version} is not supported')
+    if (written or None) != tick_size:
+        raise ValueError(f'journal was written with tick_size={written or None}, not {tick_size}')
+
+
+def _read_file(path: str, apply) -> int:
+    if not path or not os.path.exists(path) or not os.path.getsize(path):
+        return 0
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        with memoryview(data) as view:
+            return apply(view)
+
+
+# журнал изменений стакана с групповой фиксацией: записи копятся в буфере и пишутся
+# с одним fsync на group_size записей; checkpoint() сохраняет снапшот и очищает журнал
+class Journal:
+    def __init__(self, path: str, snapshot_path: str = None, group_size: int = 256,
+                 checkpoint_every: int = None, fsync: bool = True):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.group_size = group_size
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+        self._book = None
+        self._file = None
+        self._record = None
+        self._buffer = bytearray()
+        self._pending = 0
+        self._since_checkpoint = 0
+        self._lsn = 0
+        self._owners = {}  # метка владельца -> номер, определенный в текущем файле журнала
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def lsn(self):
+        return self._lsn
+
+    # стакан из последнего снапшота и хвоста журнала, журнал подключается к нему
+    def recover(self, **book_options) -> OrderBook:
+        position, book = 0, None
+        loaded = _read_file(self.snapshot_path,
+                            lambda view: (read_header(view)['position'], loads(view, **book_options)))
+        if loaded:
+            position, book = loaded
+        else:
+            book = OrderBook(**book_options)
+
+        record = RECORDS[book.tick_size is not None]
+        if os.path.exists(self.path) and 0 < os.path.getsize(self.path) < HEADER.size:
+            # заголовок не дописан при сбое, записей в журнале нет
+            os.truncate(self.path, 0)
+        owners = {}
+        lsn = _read_file(self.path, lambda view: self._replay(book, record, view, position, owners))
+        if os.path.exists(self.path):
+            # обрезаем недописанную при сбое запись
+            size = os.path.getsize(self.path)
+            if (size - HEADER.size) % record.size > 0:
+                os.truncate(self.path, size - (size - HEADER.size) % record.size)
+
+        # сделки и изменения уровней при повторе уже были разосланы до сбоя
+        book._trades = []
+        if book._deltas is not None:
+            book._deltas = []
+        self.attach(book, max(lsn, position))
+        self._owners = {owner: number for number, owner in owners.items()}
+
+        return book
+
+    # без сведения подряд идущие постановки вставляются пакетами. Каждая запись хранит seq стакана перед
+    # операцией: повтор начинает с него и, как при обычной работе, увеличивает seq на единицу на каждый
+    # затронутый уровень. Записи пакетных вызовов (set_asks, del_asks, cancel_all) имеют общий seq,
+    # поэтому уровень, затронутый несколько раз в одном пакете, считается один раз.
+    # owners заполняется метками владельцев по номерам
+    @staticmethod
+    def _replay(book: OrderBook, record: struct.Struct, view, position: int, owners: dict) -> int:
+        _check_header(view, book.tick_size)
+        view = view[HEADER.size:]
+        lsn = position
+        names = {}  # куски еще не дочитанных меток по номерам
+        sides = {False: (Ask, book.asks, book.bids), True: (Bid, book.bids, book.asks)}
+        runs = {False: [], True: []}
+        added = None  # (seq, сторона, начало в runs) последнего пакета постановок
+        deleted = None  # (seq, сторона) текущего пакета снятий
+        touched = set()
+
+        def flush():
+            if added is not None:
+                seq, is_bid, start = added
+                book._seq = seq + len({obj.price for obj in runs[is_bid][start:]})
+            for is_bid, run in runs.items():
+                if run:
+                    side = sides[is_bid][1]
+                    side.add_many(run)
+                    for obj in run:
+                        if obj.expires is not None:
+                            book._arm(obj, side)
+                        if obj.owner is not None:
+                            book._owners.setdefault(obj.owner, {})[is_bid, obj.id] = None
+                    runs[is_bid] = []
+
+        body = view[:len(view) - len(view) % record.size]
+        for index, (lsn, op, is_bid, by_id, key, quantity, expires, seq, owner) in enumerate(
+                record.iter_unpack(body)):
+            if lsn <= position:
+                continue
+            if op == OP_OWNER:
+                _, _, _, by_id, last, size, chunk = OWNER.unpack_from(body, index * record.size)
+                name = names.setdefault(by_id, bytearray())
+                name += chunk[:size]
+                if last:
+                    owners[by_id] = decode_owner(bytes(names.pop(by_id)))
+                continue
+            owner = owners.get(owner)
+            is_bid = bool(is_bid)
+            cls, side, opposite = sides[is_bid]
+            if op in (OP_ADD, OP_ID):
+                if is_bid:
+                    book._bid_id = max(book._bid_id, by_id)
+                else:
+                    book._ask_id = max(book._ask_id, by_id)
+            if op == OP_ADD and not book._matching:
+                run = runs[is_bid]
+                if added is None or added[0] != seq:
+                    added = seq, is_bid, len(run)
+                run.append(cls(by_id, key, quantity, owner, None if isnan(expires) else expires))
+                continue
+
+            flush()
+            added = None
+            if op == OP_DEL:
+                if deleted != (seq, is_bid):
+                    deleted = seq, is_bid
+                    touched.clear()
+                    book._seq = seq
+                obj = side.remove(by_id)
+                if obj is not None and obj.price not in touched:
+                    touched.add(obj.price)
+                    book._level_changed(side, obj.price)
+                continue
+
+            deleted = None
+            book._seq = seq
+            if op == OP_ADD:
+                obj = cls(by_id, key, quantity, owner, None if isnan(expires) else expires)
+                book._place(obj, side, opposite)
+                if obj.expires is not None:
+                    book._arm(obj, side)
+            elif op == OP_AMEND:
+                obj = side.get(by_id)
+                if obj is not None:
+                    book._amend(obj, key, quantity, side, opposite)
+        flush()
+        book._reset(book.asks)
+        book._reset(book.bids)
+
+        return lsn
+
+    def attach(self, book: OrderBook, lsn: int = 0) -> None:
+        if self._file is None:
+            if os.path.exists(self.path) and os.path.getsize(self.path):
+                with open(self.path, 'rb') as file:
+                    _check_header(file.read(HEADER.size), book.tick_size)
+            self._file = open(self.path, 'ab')
+            if not self._file.tell():
+                self._write_header(book)
+        self._book = book
+        self._record = RECORDS[book.tick_size is not None]
+        self._lsn = lsn
+        book._journal = self
+
+    # seq - номер изменения перед операцией, если запись пишется уже после изменения уровней
+    def add(self, is_bid: bool, obj, seq: int = None) -> None:
+        owner = 0 if obj.owner is None else self._owners.get(obj.owner) or self._define(obj.owner)
+        self._append(OP_ADD, is_bid, obj.id, obj.price, obj.quantity, obj.expires, seq, owner)
+
+    # метка получает номер и записывается кусками до первой заявки с ней; метку, которую нельзя сохранить,
+    # отклоняет encode_owner до изменения стакана
+    def _define(self, owner) -> int:
+        name = encode_owner(owner)
+        number = self._owners[owner] = len(self._owners) + 1
+        for start in range(0, max(len(name), 1), CHUNK):
+            chunk = name[start:start + CHUNK]
+            self._lsn += 1
+            self._buffer += OWNER.pack(self._lsn, OP_OWNER, 0, number, start + CHUNK >= len(name), len(chunk), chunk)
+            self._pending += 1
+        return number
+
+    def delete(self, is_bid: bool, by_id: int) -> None:
+        self._append(OP_DEL, is_bid, by_id, 0, 0)
+
+    def amend(self, is_bid: bool, by_id: int, key, quantity: int) -> None:
+        self._append(OP_AMEND, is_bid, by_id, key, quantity)
+
+    def issue(self, is_bid: bool, by_id: int) -> None:
+        self._append(OP_ID, is_bid, by_id, 0, 0)
+
+    def _append(self, op: int, is_bid: bool, by_id: int, key, quantity: int, expires=None, seq: int = None,
+                owner: int = 0) -> None:
+        self._lsn += 1
+        self._buffer += self._record.pack(self._lsn, op, is_bid, by_id, key, quantity,
+                                          nan if expires is None else expires, self._book.seq if seq is None else seq,
+                                          owner)
+        self._pending += 1
+        if self._pending >= self.group_size:
+            self.commit()
+
+    def commit(self) -> None:
+        if self._pending:
+            self._file.write(self._buffer)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._since_checkpoint += self._pending
+            self._buffer = bytearray()
+            self._pending = 0
+        if self.checkpoint_every and self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    # снапшот пишется во временный файл и атомарно заменяет предыдущий, после чего журнал очищается;
+    # если сбой случится до очистки, записи с номером не больше позиции снапшота будут пропущены
+    def checkpoint(self) -> None:
+        if not self.snapshot_path:
+            raise ValueError('<snapshot_path> is required for checkpoints')
+        self._since_checkpoint = 0
+        self.commit()
+
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(dumps(self._book, position=self._lsn))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        self._file.truncate(0)
+        self._write_header(self._book)
+        # метки, определенные в очищенном журнале, заново определяются при первом использовании
+        self._owners = {}
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _write_header(self, book: OrderBook) -> None:
+        self._file.write(HEADER.pack(MAGIC, VERSION, book.tick_size or 0.0))
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.commit()
+        self._file.close()
+        self._file = None
+        if self._book is not None:
+            self._book._journal = None
+            self._book = None
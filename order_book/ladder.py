@@ -0,0 +1,560 @@
+from bisect import bisect_left, insort
+from itertools import chain, islice
+from weakref import ref
+
+from .order_object import OrderObject
+
+# цен в блоке отсортированного списка: вставка и удаление уровня сдвигают только его блок,
+# блок больше 2 * BLOCK делится пополам
+BLOCK = 256
+
+
+# ценовой уровень: агрегированное количество и очередь заявок в порядке поступления
+class PriceLevel:
+    __slots__ = ('price', 'quantity', 'orders', 'token')
+
+    # token - метка стороны, которой принадлежит уровень; чужой уровень (общий с копией стакана)
+    # перед изменением копируется
+    def __init__(self, price: float, token=None):
+        self.price = price
+        self.quantity = 0
+        self.orders = {}  # id -> заявка, dict сохраняет порядок вставки (FIFO)
+        self.token = token
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        return iter(self.orders.values())
+
+    def append(self, obj: OrderObject) -> None:
+        self.orders[obj.id] = obj
+        self.quantity += obj.quantity
+
+    def remove(self, obj: OrderObject) -> None:
+        del self.orders[obj.id]
+        self.quantity -= obj.quantity
+
+
+# одна сторона стакана: отсортированные по возрастанию цены уровней блоками, уровни по цене и индекс заявок по id
+# лучшая цена у заявок на продажу - минимальная, у заявок на покупку - максимальная
+class Ladder:
+    def __init__(self, is_bid: bool = False):
+        self.is_bid = is_bid
+        self.levels = {}
+        self.index = {}
+        self.token = object()
+        self._family = None  # слабые ссылки на стороны, делящие уровни после clone()
+        # кэш списка цен вместе с поколением уровней, при котором он собран: читатель без блокировки
+        # не может вернуть список, собранный до изменения уровней
+        self._generation = 0
+        self._prices = (-1, None)
+        self._set_prices([])
+
+    # копия стороны с общими уровнями и заявками: копируются только словари и список цен, новую метку получает
+    # только копия. Копия копирует чужой уровень при первом своем изменении, а владелец уровня меняет его на месте,
+    # отдав перед этим собственный экземпляр уровня живым копиям, которые на него еще ссылаются (_release).
+    # Стороны, делящие уровни, ведут общий список слабых ссылок друг на друга
+    def clone(self) -> 'Ladder':
+        other = object.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.levels, other.index = dict(self.levels), dict(self.index)
+        other._detach()
+        other.token = object()
+        if self._family is None:
+            self._family = [ref(self)]
+        self._family.append(ref(other))
+        other._family = self._family
+        return other
+
+    # уровень, который сторона может менять: чужой копируется, свой общий сначала отдается копиям
+    def _own(self, level: PriceLevel) -> PriceLevel:
+        if level.token is not self.token:
+            return self._writable(level)
+        self._release(level)
+        return level
+
+    def _release(self, level: PriceLevel) -> None:
+        family = self._family
+        alive = [member for member in family if member() is not None]
+        if len(alive) < 2:
+            self._family = None
+            return
+        family[:] = alive
+        price = level.price
+        for member in alive:
+            ladder = member()
+            if ladder is not None and ladder is not self and ladder.levels.get(price) is level:
+                ladder._writable(level)
+
+    def _detach(self) -> None:
+        self._blocks = [block[:] for block in self._blocks]
+        self._lasts = self._lasts[:]
+
+    # собственная копия общего уровня вместе с заявками, индекс переводится на новые заявки
+    def _writable(self, level: PriceLevel) -> PriceLevel:
+        copy = PriceLevel(level.price, self.token)
+        orders, index = copy.orders, self.index
+        for by_id, obj in level.orders.items():
+            orders[by_id] = index[by_id] = type(obj)(obj.id, obj.price, obj.quantity, obj.owner, obj.expires)
+        copy.quantity = level.quantity
+        self.levels[level.price] = copy
+        return copy
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __iter__(self):
+        levels = self.levels
+        return (levels[price] for price in self.prices)
+
+    # отсортированный список цен собирается из блоков только по запросу, возвращаемый список изменять нельзя
+    @property
+    def prices(self) -> list:
+        generation, prices = self._prices
+        if generation != self._generation:
+            generation = self._generation
+            prices = list(chain.from_iterable(self._blocks))
+            self._prices = generation, prices
+        return prices
+
+    def best(self) -> PriceLevel:
+        blocks = self._blocks
+        if not blocks:
+            return
+        return self.levels[blocks[-1][-1] if self.is_bid else blocks[0][0]]
+
+    # цены depth лучших уровней в порядке возрастания
+    def top(self, depth: int) -> list:
+        if depth >= len(self.levels):
+            return self.prices
+        prices = list(islice(self.walk(), depth))
+        if self.is_bid:
+            prices.reverse()
+        return prices
+
+    # цены уровней от лучшей к худшей
+    def walk(self):
+        if self.is_bid:
+            return chain.from_iterable(map(reversed, reversed(self._blocks)))
+        return chain.from_iterable(self._blocks)
+
+    # блоки и последние цены блоков для поиска блока; поколение меняется только после изменения цен
+    def _set_prices(self, prices: list) -> None:
+        self._blocks = [prices[start:start + BLOCK] for start in range(0, len(prices), BLOCK)]
+        self._lasts = [block[-1] for block in self._blocks]
+        self._generation += 1
+
+    def _insert_price(self, price) -> None:
+        blocks, lasts = self._blocks, self._lasts
+        if not blocks:
+            blocks.append([price])
+            lasts.append(price)
+        else:
+            position = min(bisect_left(lasts, price), len(blocks) - 1)
+            block = blocks[position]
+            # новые уровни чаще всего появляются у края стакана
+            if price > block[-1]:
+                block.append(price)
+            else:
+                insort(block, price)
+            lasts[position] = block[-1]
+            if len(block) > 2 * BLOCK:
+                blocks.insert(position + 1, block[BLOCK:])
+                del block[BLOCK:]
+                lasts.insert(position, block[-1])
+        self._generation += 1
+
+    def _discard_price(self, price) -> None:
+        blocks, lasts = self._blocks, self._lasts
+        position = bisect_left(lasts, price)
+        block = blocks[position]
+        del block[bisect_left(block, price)]
+        if block:
+            lasts[position] = block[-1]
+        else:
+            del blocks[position], lasts[position]
+        self._generation += 1
+
+    # цена не хуже граничной, то есть попадает в лучшие уровни до границы включительно
+    def within(self, price, boundary) -> bool:
+        return price >= boundary if self.is_bid else price <= boundary
+
+    def add(self, obj: OrderObject) -> PriceLevel:
+        level = self.levels.get(obj.price)
+        if level is None:
+            level = self.levels[obj.price] = PriceLevel(obj.price, self.token)
+            self._insert_price(obj.price)
+        elif level.token is not self.token or self._family is not None:
+            level = self._own(level)
+        level.append(obj)
+        self.index[obj.id] = obj
+        return level
+
+    # пакетная вставка: новые цены сортируются один раз; немногие вставляются в свои блоки,
+    # крупная доля сливается с существующими (timsort сливает два отсортированных участка за линейное время)
+    def add_many(self, objs: list) -> list:
+        levels, index, token = self.levels, self.index, self.token
+        touched = {}
+        new_prices = []
+        for obj in objs:
+            level = levels.get(obj.price)
+            if level is None:
+                level = levels[obj.price] = PriceLevel(obj.price, token)
+                new_prices.append(obj.price)
+            elif level.token is not token or self._family is not None:
+                level = self._own(level)
+            level.append(obj)
+            index[obj.id] = obj
+            touched[obj.price] = None
+        if new_prices:
+            new_prices.sort()
+            if len(new_prices) * 32 < len(levels):
+                for price in new_prices:
+                    self._insert_price(price)
+            else:
+                prices = self.prices + new_prices
+                prices.sort()
+                self._set_prices(prices)
+        return list(touched)
+
+    # пакетное снятие: опустевшие уровни удаляются из списка цен за один проход
+    # загрузка пустой стороны заявками в порядке цена-время (как в снапшоте): уровни собираются за один проход
+    # без поиска места цены, индекс - целиком из колонки id
+    def load(self, objs: list, ids: list) -> None:
+        self.levels, self.index = self._group(objs, ids)
+        self._set_prices(list(self.levels))
+
+    def _group(self, objs: list, ids: list) -> tuple:
+        levels, token = {}, self.token
+        level = None
+        for obj in objs:
+            key = obj.price
+            if level is None or key != level.price:
+                if level is not None and key < level.price or key in levels:
+                    raise ValueError('orders must be grouped by ascending price')
+                level = levels[key] = PriceLevel(key, token)
+            level.orders[obj.id] = obj
+            level.quantity += obj.quantity
+        index = dict(zip(ids, objs))
+        if len(index) != len(objs):
+            raise ValueError('order ids must be unique')
+
+        return levels, index
+
+    def remove_many(self, ids) -> list:
+        levels, index, token = self.levels, self.index, self.token
+        removed = []
+        emptied = []
+        for by_id in ids:
+            obj = index.get(by_id)
+            if obj is None:
+                continue
+            level = levels[obj.price]
+            if level.token is not token or self._family is not None:
+                level = self._own(level)
+            obj = index.pop(by_id)
+            level.remove(obj)
+            if not level.orders:
+                del levels[obj.price]
+                emptied.append(obj.price)
+            removed.append(obj)
+        # пересборка списка обходит все уровни, поэтому выгоднее точечных удалений только для крупной доли уровней
+        if len(emptied) * 32 < len(levels) + len(emptied):
+            for price in emptied:
+                self._discard_price(price)
+        elif emptied:
+            self._set_prices([price for price in self.prices if price in levels])
+        return removed
+
+    # исполнение встречной заявки по лучшим уровням в порядке цена-время
+    # fills пополняется парами (заявка из стакана, исполненное количество), возвращается остаток
+    def take(self, limit, quantity: int, fills: list) -> int:
+        blocks, levels = self._blocks, self.levels
+        while quantity and blocks:
+            price = blocks[-1][-1] if self.is_bid else blocks[0][0]
+            if not self.within(price, limit):
+                break
+
+            level = levels[price]
+            if level.token is not self.token or self._family is not None:
+                level = self._own(level)
+            quantity = self._fill(level, quantity, fills)
+            if not level.orders:
+                del levels[price]
+                self._discard_price(price)
+
+        return quantity
+
+    # исполнение заявок уровня по очереди, полностью исполненные заявки уходят из уровня и индекса
+    def _fill(self, level: PriceLevel, quantity: int, fills: list) -> int:
+        orders, index = level.orders, self.index
+        done = []
+        for obj in orders.values():
+            if obj.quantity > quantity:
+                fills.append((obj, quantity))
+                obj.quantity -= quantity
+                level.quantity -= quantity
+                quantity = 0
+                break
+            fills.append((obj, obj.quantity))
+            quantity -= obj.quantity
+            done.append(obj)
+            if not quantity:
+                break
+
+        for obj in done:
+            del orders[obj.id]
+            del index[obj.id]
+            level.quantity -= obj.quantity
+            obj.quantity = 0
+
+        return quantity
+
+    # количество, доступное для исполнения по цене не хуже limit; подсчет останавливается, как только набрано quantity
+    def available(self, limit, quantity: int) -> int:
+        levels = self.levels
+        total = 0
+        for price in self.walk():
+            if total >= quantity or not self.within(price, limit):
+                break
+            total += levels[price].quantity
+
+        return total
+
+    # изменение заявки без смены id: уменьшение количества сохраняет место в очереди,
+    # увеличение или новая цена ставят заявку в конец очереди уровня; возвращается измененная заявка
+    # (после копирования общего уровня это уже другой объект)
+    def amend(self, obj: OrderObject, price, quantity: int) -> OrderObject:
+        level = self.levels[obj.price]
+        if level.token is not self.token or self._family is not None:
+            level = self._own(level)
+            obj = self.index[obj.id]
+        if price == obj.price:
+            if quantity < obj.quantity:
+                level.quantity -= obj.quantity - quantity
+                obj.quantity = quantity
+            elif quantity > obj.quantity:
+                level.remove(obj)
+                obj.quantity = quantity
+                level.append(obj)
+            return obj
+
+        self.remove(obj.id)
+        obj.price, obj.quantity = price, quantity
+        self.add(obj)
+        return obj
+
+    def get(self, by_id: int) -> OrderObject:
+        return self.index.get(by_id)
+
+    def remove(self, by_id: int) -> OrderObject:
+        obj = self.index.get(by_id)
+        if obj is None:
+            return
+        level = self.levels[obj.price]
+        if level.token is not self.token or self._family is not None:
+            level = self._own(level)
+        obj = self.index.pop(by_id)
+        level.remove(obj)
+        if not level.orders:
+            del self.levels[obj.price]
+            self._discard_price(obj.price)
+        return obj
+
+
+# сторона стакана в режиме тиков для цен, собранных около лучшей цены: уровни лежат в массиве
+# фиксированного размера по смещению от базовой цены, поэтому постановка и снятие уровня - O(1),
+# а лучшая цена - указатель, который сдвигается к следующему занятому слоту при опустошении уровня.
+# Цены вне окна хранятся в отсортированном списке far; если лучшая цена уходит за окно,
+# окно перестраивается вокруг нее. Отсортированный список цен собирается только по запросу
+class DenseLadder(Ladder):
+    def __init__(self, is_bid: bool = False, capacity: int = 4096):
+        self.is_bid = is_bid
+        self.levels = {}
+        self.index = {}
+        self.token = object()
+        self._family = None
+        self.capacity = capacity
+        self.base = None
+        self.slots = [None] * capacity
+        self.filled = 0
+        self.far = []
+        self._best = None  # смещение лучшего занятого слота
+        # кэш списка цен вместе с поколением уровней, при котором он собран: читатель без блокировки
+        # не может вернуть список, собранный до изменения уровней
+        self._generation = 0
+        self._prices = (-1, None)
+
+    def _detach(self) -> None:
+        self.slots = self.slots[:]
+        self.far = self.far[:]
+
+    def _writable(self, level: PriceLevel) -> PriceLevel:
+        copy = super()._writable(level)
+        offset = level.price - self.base
+        if 0 <= offset < self.capacity:
+            self.slots[offset] = copy
+        return copy
+
+    @property
+    def prices(self) -> list:
+        generation, prices = self._prices
+        if generation != self._generation:
+            generation = self._generation
+            prices = list(self.walk())
+            if self.is_bid:
+                prices.reverse()
+            self._prices = generation, prices
+        return prices
+
+    def walk(self):
+        far, base, slots = self.far, self.base, self.slots
+        if base is None:
+            return iter(far)
+        if self.is_bid:
+            split = bisect_left(far, base + self.capacity)
+            window = () if self._best is None else (
+                base + offset for offset in range(self._best, -1, -1) if slots[offset] is not None)
+            return chain(reversed(far[split:]), window, reversed(far[:split]))
+        split = bisect_left(far, base)
+        window = () if self._best is None else (
+            base + offset for offset in range(self._best, self.capacity) if slots[offset] is not None)
+        return chain(far[:split], window, far[split:])
+
+    def best(self) -> PriceLevel:
+        far = self.far
+        if far:
+            if self.is_bid:
+                if self._best is None or far[-1] >= self.base + self.capacity:
+                    return self.levels[far[-1]]
+            elif self._best is None or far[0] < self.base:
+                return self.levels[far[0]]
+        if self._best is None:
+            return
+        return self.slots[self._best]
+
+    def add(self, obj: OrderObject) -> PriceLevel:
+        level = self.levels.get(obj.price)
+        if level is None:
+            level = self.levels[obj.price] = PriceLevel(obj.price, self.token)
+            self._insert(level)
+        elif level.token is not self.token or self._family is not None:
+            level = self._own(level)
+        level.append(obj)
+        self.index[obj.id] = obj
+        return level
+
+    def add_many(self, objs: list) -> list:
+        touched = {}
+        for obj in objs:
+            self.add(obj)
+            touched[obj.price] = None
+        return list(touched)
+
+    def remove(self, by_id: int) -> OrderObject:
+        obj = self.index.get(by_id)
+        if obj is None:
+            return
+        level = self.levels[obj.price]
+        if level.token is not self.token or self._family is not None:
+            level = self._own(level)
+        obj = self.index.pop(by_id)
+        level.remove(obj)
+        if not level.orders:
+            self._discard(level)
+        return obj
+
+    def load(self, objs: list, ids: list) -> None:
+        self.levels, self.index = self._group(objs, ids)
+        if objs:
+            self._recenter(objs[-1].price if self.is_bid else objs[0].price)
+        self._generation += 1
+
+    def remove_many(self, ids) -> list:
+        removed = []
+        for by_id in ids:
+            obj = self.remove(by_id)
+            if obj is not None:
+                removed.append(obj)
+        return removed
+
+    def take(self, limit, quantity: int, fills: list) -> int:
+        while quantity:
+            level = self.best()
+            if level is None or not self.within(level.price, limit):
+                break
+            if level.token is not self.token or self._family is not None:
+                level = self._own(level)
+            quantity = self._fill(level, quantity, fills)
+            if not level.orders:
+                self._discard(level)
+
+        return quantity
+
+    # поколение меняется только после изменения уровней: читатель, собравший список цен во время изменения,
+    # записывает его в кэш под прежним поколением, и следующий читатель собирает список заново
+    def _insert(self, level: PriceLevel) -> None:
+        self._link(level)
+        self._generation += 1
+
+    def _discard(self, level: PriceLevel) -> None:
+        self._unlink(level)
+        self._generation += 1
+
+    def _link(self, level: PriceLevel) -> None:
+        price = level.price
+        if self.base is None:
+            self._recenter(price)
+            return
+        offset = price - self.base
+        if 0 <= offset < self.capacity:
+            self.slots[offset] = level
+            self.filled += 1
+            best = self._best
+            if best is None or (offset > best if self.is_bid else offset < best):
+                self._best = offset
+            return
+
+        insort(self.far, price)
+        best = self.best()
+        if self.filled == 0 or best is level:
+            self._recenter(best.price)
+
+    def _unlink(self, level: PriceLevel) -> None:
+        price = level.price
+        del self.levels[price]
+        offset = price - self.base
+        if not 0 <= offset < self.capacity:
+            far = self.far
+            del far[bisect_left(far, price)]
+            return
+
+        slots = self.slots
+        slots[offset] = None
+        self.filled -= 1
+        if offset == self._best:
+            step = -1 if self.is_bid else 1
+            end = -1 if self.is_bid else self.capacity
+            self._best = next((i for i in range(offset + step, end, step) if slots[i] is not None), None)
+        if self.filled == 0 and self.far:
+            self._recenter(self.best().price)
+
+    # окно ставится так, чтобы лучшая цена была в первой четверти со стороны улучшения цены,
+    # а основной объем стакана за ней попадал в окно
+    def _recenter(self, touch: int) -> None:
+        capacity = self.capacity
+        self.base = touch - capacity // 4 if not self.is_bid else touch - capacity + 1 + capacity // 4
+        base = self.base
+        slots = self.slots = [None] * capacity
+        far = []
+        for price in sorted(self.levels):
+            offset = price - base
+            if 0 <= offset < capacity:
+                slots[offset] = self.levels[price]
+            else:
+                far.append(price)
+        self.far = far
+        self.filled = len(self.levels) - len(far)
+        occupied = [offset for offset, level in enumerate(slots) if level is not None]
+        self._best = None if not occupied else occupied[-1] if self.is_bid else occupied[0]
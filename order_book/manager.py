@@ -0,0 +1,184 @@
+import multiprocessing
+from zlib import crc32
+
+from .order_book import OrderBook
+
+
+# команды, которые можно направить стакану инструмента
+COMMANDS = frozenset((
+    'set_ask', 'set_bid', 'get_ask', 'get_bid', 'del_ask', 'del_bid',
+    'set_asks', 'set_bids', 'del_asks', 'del_bids', 'amend_ask', 'amend_bid', 'expire', 'cancel_all',
+    'best_ask', 'best_bid', 'report_market_data', 'snapshot', 'drain_deltas', 'drain_trades',
+    'depth_up_to', 'price_for_quantity', 'sweep_vwap'
+))
+
+
+def check_command(command: str) -> str:
+    if command not in COMMANDS:
+        raise ValueError(f'<command> must be one of: {", ".join(sorted(COMMANDS))}')
+
+    return command
+
+
+# стаканы многих инструментов в одном процессе, стакан создается при первом обращении
+class BookManager:
+    def __init__(self, **book_options):
+        self._book_options = book_options
+        self._books = {}
+
+    @property
+    def symbols(self):
+        return list(self._books)
+
+    def book(self, symbol: str) -> OrderBook:
+        book = self._books.get(symbol)
+        if book is None:
+            book = self._books[symbol] = OrderBook(**self._book_options)
+        return book
+
+    def execute(self, command: str, symbol: str, *args):
+        return getattr(self.book(symbol), check_command(command))(*args)
+
+    # пакет команд (command, symbol, *args); ошибки возвращаются на месте результата.
+    # errors - перехватываемые исключения, процесс шарда перехватывает любые, чтобы плохая команда
+    # не завершила процесс вместе со всеми его стаканами
+    def execute_many(self, commands, errors=ValueError) -> list:
+        results = []
+        for command, symbol, *args in commands:
+            try:
+                results.append(self.execute(command, symbol, *args))
+            except errors as err:
+                results.append(err)
+        return results
+
+    def set_ask(self, symbol: str, price: float, quantity: int) -> int:
+        return self.book(symbol).set_ask(price, quantity)
+
+    def set_bid(self, symbol: str, price: float, quantity: int) -> int:
+        return self.book(symbol).set_bid(price, quantity)
+
+    def get_ask(self, symbol: str, by_id: int):
+        return self.book(symbol).get_ask(by_id)
+
+    def get_bid(self, symbol: str, by_id: int):
+        return self.book(symbol).get_bid(by_id)
+
+    def del_ask(self, symbol: str, by_id: int):
+        return self.book(symbol).del_ask(by_id)
+
+    def del_bid(self, symbol: str, by_id: int):
+        return self.book(symbol).del_bid(by_id)
+
+    def report_market_data(self, symbol: str, depth: int = None) -> dict:
+        return self.book(symbol).report_market_data(depth)
+
+
+def _worker(conn, book_options: dict) -> None:
+    manager = BookManager(**book_options)
+    while True:
+        commands = conn.recv()
+        if commands is None:
+            break
+        conn.send(manager.execute_many(commands, errors=Exception))
+    conn.close()
+
+
+# инструменты распределяются по процессам по хэшу символа,
+# команды копятся по шардам и отправляются пакетами при flush()
+class ShardedBookManager:
+    def __init__(self, workers: int = None, **book_options):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers <= 0:
+            raise ValueError('<workers> must be bigger than Zero')
+
+        self._connections = []
+        self._processes = []
+        for _ in range(workers):
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, args=(child, book_options), daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+        self._pending = [[] for _ in range(workers)]
+        self._order = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def workers(self):
+        return len(self._processes)
+
+    def shard(self, symbol: str) -> int:
+        return crc32(symbol.encode()) % len(self._connections)
+
+    def submit(self, command: str, symbol: str, *args) -> None:
+        shard = self.shard(symbol)
+        self._pending[shard].append((check_command(command), symbol, *args))
+        self._order.append(shard)
+
+    # результаты возвращаются в порядке submit, ошибки - на месте результата;
+    # накопленные команды сбрасываются и при сбое отправки, чтобы менеджер не оставался заблокированным
+    def flush(self) -> list:
+        results = {}
+        try:
+            for shard, (conn, batch) in enumerate(zip(self._connections, self._pending)):
+                if batch:
+                    conn.send(batch)
+                    results[shard] = None
+            for shard in results:
+                results[shard] = iter(self._connections[shard].recv())
+            ordered = [next(results[shard]) for shard in self._order]
+        finally:
+            self._pending = [[] for _ in self._connections]
+            self._order = []
+
+        return ordered
+
+    def execute(self, command: str, symbol: str, *args):
+        if self._order:
+            raise RuntimeError('flush() pending commands before executing a single one')
+        self.submit(command, symbol, *args)
+        result = self.flush()[0]
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    def set_ask(self, symbol: str, price: float, quantity: int) -> int:
+        return self.execute('set_ask', symbol, price, quantity)
+
+    def set_bid(self, symbol: str, price: float, quantity: int) -> int:
+        return self.execute('set_bid', symbol, price, quantity)
+
+    def get_ask(self, symbol: str, by_id: int):
+        return self.execute('get_ask', symbol, by_id)
+
+    def get_bid(self, symbol: str, by_id: int):
+        return self.execute('get_bid', symbol, by_id)
+
+    def del_ask(self, symbol: str, by_id: int):
+        return self.execute('del_ask', symbol, by_id)
+
+    def del_bid(self, symbol: str, by_id: int):
+        return self.execute('del_bid', symbol, by_id)
+
+    def report_market_data(self, symbol: str, depth: int = None) -> dict:
+        return self.execute('report_market_data', symbol, depth)
+
+    def close(self) -> None:
+        for conn in self._connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
@@ -0,0 +1,123 @@
+from functools import wraps
+from time import perf_counter_ns
+
+
+# операции стакана, для которых при включенных метриках считаются вызовы, ошибки и задержки
+INSTRUMENTED = (
+    'set_ask', 'set_bid', 'get_ask', 'get_bid', 'del_ask', 'del_bid',
+    'set_asks', 'set_bids', 'del_asks', 'del_bids', 'amend_ask', 'amend_bid',
+    'expire', 'cancel_all', 'best_ask', 'best_bid', 'report_market_data', 'snapshot'
+)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+# гистограмма в духе HDR: корзины логарифмические по степеням двойки и линейные внутри,
+# относительная погрешность не больше 2 ** (1 - precision_bits)
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'min', 'max', '_bits')
+
+    def __init__(self, precision_bits: int = 5):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self._bits = precision_bits
+
+    def record(self, value: int) -> None:
+        shift = value.bit_length() - self._bits
+        bucket = value >> shift << shift if shift > 0 else value
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # нижняя граница корзины, в которую попадает квантиль
+    def quantile(self, q: float) -> int:
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return bucket
+        return self.max
+
+    def export(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_ns": self.total,
+            "min_ns": self.min or 0,
+            "max_ns": self.max or 0,
+            **{f"p{q * 100:g}_ns": self.quantile(q) for q in QUANTILES}
+        }
+
+
+class Metrics:
+    def __init__(self, book):
+        self._book = book
+        self.histograms = {name: Histogram() for name in INSTRUMENTED}
+        self.errors = dict.fromkeys(INSTRUMENTED, 0)
+
+    def wrap(self, name: str, method):
+        histogram = self.histograms[name]
+        errors = self.errors
+
+        @wraps(method)
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            except ValueError:
+                errors[name] += 1
+                raise
+            finally:
+                histogram.record(perf_counter_ns() - start)
+
+        return timed
+
+    def gauges(self) -> dict:
+        book = self._book
+        return {
+            "ask_levels": len(book.asks),
+            "bid_levels": len(book.bids),
+            "ask_orders": len(book.asks.index),
+            "bid_orders": len(book.bids.index),
+            "seq": book.seq
+        }
+
+    def export(self) -> dict:
+        return {
+            "operations": {
+                name: {**histogram.export(), "errors": self.errors[name]}
+                for name, histogram in self.histograms.items() if histogram.count or self.errors[name]
+            },
+            "gauges": self.gauges()
+        }
+
+    # текстовый формат экспозиции Prometheus
+    def to_text(self, prefix: str = 'order_book') -> str:
+        lines = [f'# TYPE {prefix}_operations_total counter']
+        active = [(name, histogram) for name, histogram in self.histograms.items() if histogram.count]
+        lines += [f'{prefix}_operations_total{{op="{name}"}} {histogram.count}' for name, histogram in active]
+        lines.append(f'# TYPE {prefix}_errors_total counter')
+        lines += [f'{prefix}_errors_total{{op="{name}"}} {count}' for name, count in self.errors.items() if count]
+        lines.append(f'# TYPE {prefix}_latency_seconds summary')
+        for name, histogram in active:
+            lines += [f'{prefix}_latency_seconds{{op="{name}",quantile="{q:g}"}} {histogram.quantile(q) / 1e9:.9f}'
+                      for q in QUANTILES]
+            lines.append(f'{prefix}_latency_seconds_sum{{op="{name}"}} {histogram.total / 1e9:.9f}')
+            lines.append(f'{prefix}_latency_seconds_count{{op="{name}"}} {histogram.count}')
+        gauges = self.gauges()
+        lines.append(f'# TYPE {prefix}_levels gauge')
+        lines += [f'{prefix}_levels{{side="{side}"}} {gauges[side + "_levels"]}' for side in ('ask', 'bid')]
+        lines.append(f'# TYPE {prefix}_orders gauge')
+        lines += [f'{prefix}_orders{{side="{side}"}} {gauges[side + "_orders"]}' for side in ('ask', 'bid')]
+        lines.append(f'# TYPE {prefix}_seq gauge')
+        lines.append(f'{prefix}_seq {gauges["seq"]}')
+
+        return '\n'.join(lines) + '\n'
@@ -1,52 +1,97 @@
-from pprint import pprint
+import logging
+from decimal import Decimal
+from heapq import heappop, heappush
+from itertools import repeat
+from operator import attrgetter
+from pprint import pformat
 
 from .order_object import OrderObject, Ask, Bid
-from .utils import bin_insert, find_position, format_market_data
+from .depth import DepthIndex, TickDepthIndex
+from .ladder import Ladder, DenseLadder
+from .metrics import INSTRUMENTED, Metrics
+from .utils import format_market_data, market_data_array
+from .validator import Validator, TrustedValidator, check_int, check_tick_size, check_ticks, check_time, \
+    check_time_in_force
+
+
+# по умолчанию стакан ничего не выводит; подробности операций пишутся в лог на уровне DEBUG
+logger = logging.getLogger('order_book')
+logger.addHandler(logging.NullHandler())
 
 
 class BookHandler:
     @staticmethod
-    def set_object(obj: OrderObject, in_array: list):
-        bin_insert(obj, in_array)
+    def set_object(obj: OrderObject, in_ladder: Ladder):
+        in_ladder.add(obj)
 
     @staticmethod
-    def get_object(by_id: int, from_array: list):
-        if not isinstance(by_id, int) or isinstance(by_id, bool):
-            raise ValueError('<id> must be Integer')
-        if by_id <= 0:
-            raise ValueError('<id> must be bigger than Zero')
-
-        position = find_position(by_id, from_array)
-        if position is None:
-            print(f'#{by_id} is not exist')
-            return
+    def get_object(by_id: int, from_ladder: Ladder):
+        obj = from_ladder.get(by_id)
+        if not logger.isEnabledFor(logging.DEBUG):
+            return obj
 
-        obj = from_array[position]
-        print(f'{obj.__class__.__name__} #{obj.id} info: price={obj.price}, quantity={obj.quantity}')
+        if obj is None:
+            logger.debug('#%s is not exist', by_id)
+        else:
+            logger.debug('%s #%s info: price=%s, quantity=%s',
+                         obj.__class__.__name__, obj.id, obj.price, obj.quantity)
 
         return obj
 
     @staticmethod
-    def del_object(by_id: int, from_array: list):
-        if not isinstance(by_id, int) or isinstance(by_id, bool):
-            raise ValueError('<id> must be Integer')
-        if by_id <= 0:
-            raise ValueError('<id> must be bigger than Zero')
-
-        position = find_position(by_id, from_array)
-        if position is None:
-            print(f'#{by_id} is not exist')
-            return
+    def del_object(by_id: int, from_ladder: Ladder):
+        obj = from_ladder.remove(by_id)
+        if obj is None and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('#%s is not exist', by_id)
 
-        return from_array.pop(position)
+        return obj
 
 
 class OrderBook(BookHandler):
-    def __init__(self):
+    def __init__(self, tick_size: float = None, record_deltas: bool = False, matching: bool = False,
+                 trusted: bool = False, dense: int = None):
         self._ask_id = 0
         self._bid_id = 0
-        self._asks = []
-        self._bids = []
+        if dense is None:
+            self._asks = Ladder()
+            self._bids = Ladder(is_bid=True)
+        else:
+            # уровни в плотном массиве по смещению в тиках от базовой цены, dense - размер окна в тиках
+            if tick_size is None:
+                raise ValueError('<dense> requires <tick_size>')
+            check_int('dense', dense)
+            self._asks = DenseLadder(capacity=dense)
+            self._bids = DenseLadder(is_bid=True, capacity=dense)
+        # кэш снапшотов по глубине: depth -> (данные, цена худшего вошедшего уровня)
+        self._ask_cache = {}
+        self._bid_cache = {}
+        # накопленная глубина сторон, строится при первом запросе; в режиме тиков индекс по смещению тика
+        depth_index = DepthIndex if tick_size is None else TickDepthIndex
+        self._ask_depth = depth_index(self._asks)
+        self._bid_depth = depth_index(self._bids)
+        # номер последнего изменения уровней и накопленные изменения для инкрементальной рассылки
+        self._seq = 0
+        self._deltas = [] if record_deltas else None
+        # в режиме сведения пересекающиеся заявки исполняются, а в стакан попадает только остаток
+        self._matching = matching
+        self._trades = []
+        # таймеры заявок GTD: куча (время истечения, номер, id, сторона); таймер действителен, пока в стакане
+        # стоит заявка с этим id и тем же временем истечения, поэтому снятые заявки из кучи не удаляются
+        self._expiries = []
+        self._timer = 0
+        # заявки по меткам владельцев: owner -> {(is_bid, id): None}, в порядке постановки
+        self._owners = {}
+        # журнал изменений для восстановления после сбоя, подключается через Journal
+        self._journal = None
+        self._metrics = None
+        # при заданном шаге цены заявки и уровни хранят цену в целых тиках
+        self._tick_size = None
+        self._tick_digits = 0
+        if tick_size is not None:
+            self._tick_size = check_tick_size('tick_size', tick_size)
+            self._tick_digits = max(0, -Decimal(str(tick_size)).as_tuple().exponent)
+        # все входные значения проверяются одним объектом; в доверенном режиме проверки пропускаются
+        self._check = (TrustedValidator if trusted else Validator)(self._tick_size)
 
     @property
     def ask_id(self):
@@ -56,6 +101,22 @@ class OrderBook(BookHandler):
     def bid_id(self):
         return self._bid_id
 
+    @property
+    def seq(self):
+        return self._seq
+
+    @property
+    def journal(self):
+        return self._journal
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def tick_size(self):
+        return self._tick_size
+
     @property
     def asks(self):
         return self._asks
@@ -64,39 +125,506 @@ class OrderBook(BookHandler):
     def bids(self):
         return self._bids
 
-    def set_ask(self, price: float, quantity: int) -> int:
+    # при включении методы экземпляра подменяются обертками с замером времени,
+    # в выключенном состоянии вызовы идут напрямую в методы класса без накладных расходов
+    def enable_metrics(self) -> Metrics:
+        if self._metrics is None:
+            self._metrics = Metrics(self)
+            for name in INSTRUMENTED:
+                setattr(self, name, self._metrics.wrap(name, getattr(self, name)))
+
+        return self._metrics
+
+    def disable_metrics(self) -> None:
+        if self._metrics is None:
+            return
+        for name in INSTRUMENTED:
+            delattr(self, name)
+        self._metrics = None
+
+    # копия стакана для сценариев: стороны делят уровни и заявки с исходным стаканом, и каждый из двух стаканов
+    # копирует уровень только при первом своем изменении. Копия не пишет в журнал, не считает метрики
+    # и начинает с пустыми очередями сделок и изменений
+    def clone(self) -> 'OrderBook':
+        other = object.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        for name in INSTRUMENTED:
+            other.__dict__.pop(name, None)
+        other._journal = None
+        other._metrics = None
+        other._asks, other._bids = self._asks.clone(), self._bids.clone()
+        # снапшоты в кэше не изменяются, поэтому их можно делить до первого изменения уровня
+        other._ask_cache, other._bid_cache = dict(self._ask_cache), dict(self._bid_cache)
+        depth_index = type(self._ask_depth)
+        other._ask_depth, other._bid_depth = depth_index(other._asks), depth_index(other._bids)
+        other._deltas = None if self._deltas is None else []
+        other._trades = []
+        sides = {self._asks: other._asks, self._bids: other._bids}
+        other._expiries = [(expires, n, by_id, sides[side]) for expires, n, by_id, side in self._expiries]
+        other._owners = {owner: dict(orders) for owner, orders in self._owners.items()}
+
+        return other
+
+    # упакованный снапшот заявок и счетчиков id (order_book.snapshot), модуль снапшота импортирует стакан,
+    # поэтому импорт отложен
+    def dumps(self, position: int = 0) -> bytes:
+        from .snapshot import dumps
+        return dumps(self, position)
+
+    @classmethod
+    def loads(cls, data, **book_options) -> 'OrderBook':
+        from .snapshot import loads
+        return loads(data, book_class=cls, **book_options)
+
+    def to_ticks(self, price: float) -> int:
+        return check_ticks('price', price, self._tick_size)
+
+    def to_price(self, ticks: int) -> float:
+        return round(ticks * self._tick_size, self._tick_digits)
+
+    def set_ask(self, price: float, quantity: int, tif: str = None, expires=None, owner=None) -> int:
         self._ask_id += 1
-        ask = Ask()
-        ask.id, ask.price, ask.quantity = self._ask_id, price, quantity
-        super().set_object(ask, self._asks)
+        key, quantity = self._check.order(price, quantity)
+        ask = Ask(self._ask_id, key, quantity, owner)
+        if tif is None and expires is None:
+            self._place(ask, self._asks, self._bids)
+        else:
+            # expires без tif проверяется как GTC и отклоняется, а не теряется молча
+            self._place_tif(ask, self._asks, self._bids, tif or 'GTC', expires)
 
         return ask.id
 
-    def set_bid(self, price: float, quantity: int) -> int:
+    def set_bid(self, price: float, quantity: int, tif: str = None, expires=None, owner=None) -> int:
         self._bid_id += 1
-        bid = Bid()
-        bid.id, bid.price, bid.quantity = self._bid_id, price, quantity
-        super().set_object(bid, self._bids)
+        key, quantity = self._check.order(price, quantity)
+        bid = Bid(self._bid_id, key, quantity, owner)
+        if tif is None and expires is None:
+            self._place(bid, self._bids, self._asks)
+        else:
+            # expires без tif проверяется как GTC и отклоняется, а не теряется молча
+            self._place_tif(bid, self._bids, self._asks, tif or 'GTC', expires)
 
         return bid.id
 
+    def set_asks(self, prices, quantities, ids=None, owner=None) -> list:
+        return self._set_many(Ask, self._asks, self._bids, prices, quantities, ids, owner)
+
+    def set_bids(self, prices, quantities, ids=None, owner=None) -> list:
+        return self._set_many(Bid, self._bids, self._asks, prices, quantities, ids, owner)
+
+    def _place(self, obj: OrderObject, side: Ladder, opposite: Ladder) -> None:
+        if self._journal is not None:
+            self._journal.add(side.is_bid, obj)
+        if self._matching:
+            self._match(obj, opposite)
+            if not obj.quantity:
+                return
+        super().set_object(obj, side)
+        if obj.owner is not None:
+            self._owners.setdefault(obj.owner, {})[side.is_bid, obj.id] = None
+        self._level_changed(side, obj.price)
+
+    # IOC и FOK не встают в стакан: в журнал пишется только исполненная часть, поэтому повтор журнала
+    # дает те же сделки; GTD встает как обычная заявка и получает таймер, если остался остаток
+    def _place_tif(self, obj: OrderObject, side: Ladder, opposite: Ladder, tif: str, expires) -> None:
+        tif, expires = check_time_in_force(tif, expires, self._matching)
+        if tif == 'GTC':
+            self._place(obj, side, opposite)
+        elif tif == 'GTD':
+            obj.expires = expires
+            self._place(obj, side, opposite)
+            self._arm(obj, side)
+        else:
+            quantity, seq = obj.quantity, self._seq
+            if tif == 'IOC' or opposite.available(obj.price, quantity) >= quantity:
+                self._match(obj, opposite)
+            if self._journal is None:
+                return
+            if obj.quantity < quantity:
+                self._journal.add(side.is_bid, type(obj)(obj.id, obj.price, quantity - obj.quantity), seq)
+            else:
+                # заявка ничего не исполнила, но ее id уже выдан: журнал сохраняет счетчик id
+                self._journal.issue(side.is_bid, obj.id)
+
+    # таймер заявки GTD, если она встала в стакан
+    def _arm(self, obj: OrderObject, side: Ladder) -> None:
+        if obj.id in side.index:
+            self._timer += 1
+            heappush(self._expiries, (obj.expires, self._timer, obj.id, side))
+
+    # снимает заявки GTD со временем истечения не позже now через тот же путь, что и del_ask/del_bid;
+    # работа пропорциональна числу истекших таймеров, а не размеру стакана
+    def expire(self, now) -> list:
+        check_time('now', now)
+        expiries = self._expiries
+        expired = []
+        while expiries and expiries[0][0] <= now:
+            expires, _, by_id, side = heappop(expiries)
+            obj = side.index.get(by_id)
+            if obj is not None and obj.expires == expires:
+                obj = side.remove(by_id)
+                self._cancelled(side, obj)
+                expired.append(obj)
+
+        return expired
+
+    # пакет проверяется целиком до изменения стакана; без явных id заявки нумеруются подряд
+    def _set_many(self, cls, side: Ladder, opposite: Ladder, prices, quantities, ids, owner) -> list:
+        keys, quantities, ids = self._check.orders(prices, quantities, ids)
+        if ids is None:
+            last_id = self._bid_id if side.is_bid else self._ask_id
+            ids = list(range(last_id + 1, last_id + 1 + len(keys)))
+        else:
+            index = side.index
+            if len(set(ids)) != len(ids) or any(by_id in index for by_id in ids):
+                raise ValueError('<id> must be unique')
+        self._add_many(cls, side, opposite, ids, keys, quantities, owner)
+
+        return ids
+
+    # вставка уже проверенных заявок, цены заданы ключами уровней (тиками в режиме тиков)
+    def _add_many(self, cls, side: Ladder, opposite: Ladder, ids, keys, quantities, owner=None) -> None:
+        objs = [cls(by_id, key, quantity, owner) for by_id, key, quantity in zip(ids, keys, quantities)]
+        if self._matching:
+            for obj in objs:
+                self._place(obj, side, opposite)
+        else:
+            if self._journal is not None:
+                for obj in objs:
+                    self._journal.add(side.is_bid, obj)
+            if owner is not None:
+                self._owners.setdefault(owner, {}).update(dict.fromkeys((side.is_bid, obj.id) for obj in objs))
+            for price in side.add_many(objs):
+                self._level_changed(side, price)
+
+        last_id = max(ids, default=0)
+        if side.is_bid:
+            self._bid_id = max(self._bid_id, last_id)
+        else:
+            self._ask_id = max(self._ask_id, last_id)
+
+    # загрузка состояния из снапшота или журнала: без проверок, сведения и записи в журнал;
+    # expires - время истечения каждой заявки, None - заявки без срока
+    def _load(self, cls, side: Ladder, ids, keys, quantities, expires=None, owners=None) -> None:
+        if expires is None and owners is None:
+            objs = list(map(cls, ids, keys, quantities))
+        else:
+            objs = list(map(cls, ids, keys, quantities, owners or repeat(None), expires or repeat(None)))
+        if side.index:
+            side.add_many(objs)
+        else:
+            side.load(objs, ids)
+        if expires is not None:
+            for obj in objs:
+                if obj.expires is not None:
+                    self._arm(obj, side)
+        if owners is not None:
+            # заявки владельца индексируются в порядке постановки, то есть по возрастанию id
+            for obj in sorted((obj for obj in objs if obj.owner is not None), key=attrgetter('id')):
+                self._owners.setdefault(obj.owner, {})[side.is_bid, obj.id] = None
+        self._reset(side)
+
+    def _cache_for(self, side: Ladder) -> dict:
+        return self._bid_cache if side.is_bid else self._ask_cache
+
+    # сброс производных данных стороны после изменений в обход _level_changed (загрузка, повтор журнала)
+    def _reset(self, side: Ladder) -> None:
+        self._cache_for(side).clear()
+        (self._bid_depth if side.is_bid else self._ask_depth).reset()
+
     def get_ask(self, by_id: int):
-        return super().get_object(by_id, self._asks)
+        return super().get_object(self._check.id(by_id), self._asks)
 
     def get_bid(self, by_id: int):
-        return super().get_object(by_id, self._bids)
+        return super().get_object(self._check.id(by_id), self._bids)
 
     def del_ask(self, by_id: int):
-        return super().del_object(by_id, self._asks)
+        ask = super().del_object(self._check.id(by_id), self._asks)
+        if ask is not None:
+            self._cancelled(self._asks, ask)
+
+        return ask
 
     def del_bid(self, by_id: int):
-        return super().del_object(by_id, self._bids)
+        bid = super().del_object(self._check.id(by_id), self._bids)
+        if bid is not None:
+            self._cancelled(self._bids, bid)
+
+        return bid
+
+    def _cancelled(self, side: Ladder, obj: OrderObject) -> None:
+        if self._journal is not None:
+            self._journal.delete(side.is_bid, obj.id)
+        if obj.owner is not None:
+            self._disown(side, obj)
+        self._level_changed(side, obj.price)
+
+    def _disown(self, side: Ladder, obj: OrderObject) -> None:
+        orders = self._owners.get(obj.owner)
+        if orders is None:
+            return
+        orders.pop((side.is_bid, obj.id), None)
+        if not orders:
+            del self._owners[obj.owner]
+
+    def amend_ask(self, by_id: int, quantity: int = None, price: float = None):
+        return self._amend_object(by_id, quantity, price, self._asks, self._bids)
+
+    def amend_bid(self, by_id: int, quantity: int = None, price: float = None):
+        return self._amend_object(by_id, quantity, price, self._bids, self._asks)
+
+    # уменьшение количества сохраняет время заявки, увеличение или новая цена ставят ее в конец очереди уровня
+    def _amend_object(self, by_id: int, quantity, price, side: Ladder, opposite: Ladder):
+        if quantity is None and price is None:
+            raise ValueError('<quantity> or <price> must be set')
+        check = self._check
+        quantity = None if quantity is None else check.quantity(quantity)
+        key = None if price is None else check.key(price)
 
-    def report_market_data(self) -> dict:
+        obj = super().get_object(check.id(by_id), side)
+        if obj is None:
+            return
+
+        return self._amend(obj, obj.price if key is None else key,
+                           obj.quantity if quantity is None else quantity, side, opposite)
+
+    # в режиме сведения новая цена может пересечь встречную сторону, тогда заявка исполняется с тем же id
+    def _amend(self, obj: OrderObject, key, quantity: int, side: Ladder, opposite: Ladder) -> OrderObject:
+        if self._journal is not None:
+            self._journal.amend(side.is_bid, obj.id, key, quantity)
+        old_key = obj.price
+        if key == old_key:
+            obj = side.amend(obj, key, quantity)
+            self._level_changed(side, key)
+            return obj
+
+        if self._matching:
+            obj = side.remove(obj.id)
+            self._level_changed(side, old_key)
+            obj.price, obj.quantity = key, quantity
+            self._match(obj, opposite)
+            if obj.quantity:
+                super().set_object(obj, side)
+                self._level_changed(side, key)
+            elif obj.owner is not None:
+                self._disown(side, obj)
+            return obj
+
+        obj = side.amend(obj, key, quantity)
+        self._level_changed(side, old_key)
+        self._level_changed(side, key)
+
+        return obj
+
+    def del_asks(self, ids) -> list:
+        return self._del_many(self._asks, ids)
+
+    def del_bids(self, ids) -> list:
+        return self._del_many(self._bids, ids)
+
+    # несуществующие id пропускаются, возвращаются только снятые заявки
+    def _del_many(self, side: Ladder, ids) -> list:
+        removed = side.remove_many(self._check.ids(ids))
+        self._removed(side, removed)
+
+        return removed
+
+    # журнал, метки владельцев и изменения уровней для снятых пакетом заявок;
+    # если передан список deltas, в него добавляются новые состояния уровней
+    def _removed(self, side: Ladder, removed: list, deltas: list = None) -> None:
+        if self._journal is not None:
+            for obj in removed:
+                self._journal.delete(side.is_bid, obj.id)
+        if self._owners:
+            for obj in removed:
+                if obj.owner is not None:
+                    self._disown(side, obj)
+        for price in dict.fromkeys(obj.price for obj in removed):
+            self._level_changed(side, price)
+            if deltas is not None:
+                deltas.append(self._delta(side, price))
+
+    # снятие всех заявок владельца за один проход по его заявкам, side - 'ask', 'bid' или None (обе стороны),
+    # price_range - (min, max) включительно; возвращает снятые заявки и изменения уровней
+    def cancel_all(self, owner, side: str = None, price_range: tuple = None) -> tuple:
+        if side not in (None, 'ask', 'bid'):
+            raise ValueError("<side> must be 'ask' or 'bid'")
+        low = high = None
+        if price_range is not None:
+            low, high = (self._check.key(price) for price in price_range)
+            if low > high:
+                raise ValueError('<price_range> must be (min, max)')
+
+        selected = {}
+        for is_bid, by_id in self._owners.get(owner, ()):
+            if side is not None and is_bid != (side == 'bid'):
+                continue
+            ladder = self._bids if is_bid else self._asks
+            if low is not None and not low <= ladder.index[by_id].price <= high:
+                continue
+            selected.setdefault(ladder, []).append(by_id)
+
+        removed, deltas = [], []
+        for ladder, ids in selected.items():
+            objs = ladder.remove_many(ids)
+            self._removed(ladder, objs, deltas)
+            removed += objs
+
+        return removed, deltas
+
+    def _match(self, obj: OrderObject, opposite: Ladder) -> None:
+        best = opposite.best()
+        if best is None or not opposite.within(best.price, obj.price):
+            return
+
+        fills = []
+        obj.quantity = opposite.take(obj.price, obj.quantity, fills)
+
+        is_bid = opposite.is_bid
+        aggressor = 'ask' if is_bid else 'bid'
+        to_price = self.to_price if self._tick_size is not None else None
+        trades = self._trades
+        price = None
+        for resting, quantity in fills:
+            if resting.price != price:
+                if price is not None:
+                    self._level_changed(opposite, price)
+                price = resting.price
+            trades.append({
+                "price": price if to_price is None else to_price(price),
+                "quantity": quantity,
+                "ask_id": obj.id if is_bid else resting.id,
+                "bid_id": resting.id if is_bid else obj.id,
+                "aggressor": aggressor
+            })
+            if not resting.quantity and resting.owner is not None:
+                self._disown(opposite, resting)
+        self._level_changed(opposite, price)
+
+    # сделки с момента прошлого вызова; цена сделки - цена заявки, стоявшей в стакане
+    def drain_trades(self) -> list:
+        trades, self._trades = self._trades, []
+
+        return trades
+
+    def best_ask(self):
+        return self._best(self._asks)
+
+    def best_bid(self):
+        return self._best(self._bids)
+
+    def _best(self, side: Ladder):
+        level = side.best()
+        if level is None:
+            return
+        price = level.price if self._tick_size is None else self.to_price(level.price)
+        return {"price": price, "quantity": level.quantity}
+
+    # сбрасываем только те снапшоты, в лучшие уровни которых попадает изменившаяся цена
+    def _level_changed(self, side: Ladder, price) -> None:
+        self._seq += 1
+        if self._deltas is not None:
+            self._deltas.append(self._delta(side, price))
+
+        depth = self._bid_depth if side.is_bid else self._ask_depth
+        if depth.tree is not None:
+            depth.update(price)
+
+        cache = self._cache_for(side)
+        if not cache:
+            return
+        for depth, (_, boundary) in list(cache.items()):
+            if boundary is None or side.within(price, boundary):
+                del cache[depth]
+
+    # текущее состояние уровня с номером последнего изменения, quantity=0 - уровень удален
+    def _delta(self, side: Ladder, price) -> dict:
+        level = side.levels.get(price)
+        return {
+            "seq": self._seq,
+            "side": "bid" if side.is_bid else "ask",
+            "price": price if self._tick_size is None else self.to_price(price),
+            "quantity": 0 if level is None else level.quantity
+        }
+
+    # изменения уровней с момента прошлого вызова, quantity=0 означает удаление уровня
+    def drain_deltas(self) -> list:
+        if self._deltas is None:
+            raise ValueError('deltas are not recorded, create OrderBook(record_deltas=True)')
+        deltas, self._deltas = self._deltas, []
+
+        return deltas
+
+    def _side_market_data(self, side: Ladder, depth: int) -> list:
+        cache = self._cache_for(side)
+        cached = cache.get(depth)
+        if cached is not None:
+            return cached[0]
+
+        if depth is None or depth >= len(side):
+            prices, boundary = side.prices, None
+        else:
+            prices = side.top(depth)
+            boundary = prices[0] if side.is_bid else prices[-1]
+        levels = side.levels
+        to_price = None if self._tick_size is None else self.to_price
+        data = format_market_data([levels[price] for price in prices], to_price)
+        cache[depth] = data, boundary
+
+        return data
+
+    # снапшот кэшируется, возвращаемые списки нельзя изменять
+    def report_market_data(self, depth: int = None) -> dict:
+        if depth is not None:
+            check_int('depth', depth)
         market_data = {
-            **{"asks": format_market_data(self._asks)},
-            **{"bids": format_market_data(self._bids)}
+            **{"asks": self._side_market_data(self._asks, depth)},
+            **{"bids": self._side_market_data(self._bids, depth)}
         }
-        pprint(market_data)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('market data:\n%s', pformat(market_data))
 
         return market_data
+
+    # те же данные в виде структурированных массивов NumPy для векторных расчетов
+    def market_data_arrays(self, depth: int = None) -> dict:
+        if depth is not None:
+            check_int('depth', depth)
+        return {
+            side_name: market_data_array(side.levels, side.prices if depth is None else side.top(depth),
+                                         self._tick_size, self._tick_digits)
+            for side_name, side in (("asks", self._asks), ("bids", self._bids))
+        }
+
+    # запросы накопленной глубины без сборки снапшота, side - 'ask' или 'bid'
+    def _depth_for(self, side: str) -> DepthIndex:
+        if side == 'ask':
+            return self._ask_depth
+        if side == 'bid':
+            return self._bid_depth
+        raise ValueError("<side> must be 'ask' or 'bid'")
+
+    # суммарное количество на уровнях с ценой не хуже price
+    def depth_up_to(self, price: float, side: str = 'ask') -> int:
+        depth = self._depth_for(side)
+        return depth.quantity_up_to(self._check.key(price))
+
+    # худшая цена, до которой нужно пройти от лучшей, чтобы набрать quantity; None, если объема не хватает
+    def price_for_quantity(self, quantity: int, side: str = 'ask'):
+        depth = self._depth_for(side)
+        price = depth.price_for(self._check.quantity(quantity))
+        if price is None or self._tick_size is None:
+            return price
+        return self.to_price(price)
+
+    # средняя цена исполнения quantity по лучшим уровням; None, если объема не хватает
+    def sweep_vwap(self, quantity: int, side: str = 'ask'):
+        depth = self._depth_for(side)
+        vwap = depth.vwap(self._check.quantity(quantity))
+        if vwap is None or self._tick_size is None:
+            return vwap
+        return vwap * self._tick_size
+
+    # полный снапшот с номером последнего вошедшего в него изменения для ресинхронизации подписчиков
+    def snapshot(self, depth: int = None) -> dict:
+        return {"seq": self._seq, **self.report_market_data(depth)}
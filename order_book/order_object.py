@@ -1,15 +1,23 @@
-from .validator import IntValidator, FloatValidator
+# компактная заявка без __dict__, значения проверены до создания объекта
+class OrderObject:
+    __slots__ = ('id', 'price', 'quantity', 'owner', 'expires')
 
+    # owner - необязательная метка участника или сессии для массового снятия заявок,
+    # expires - время истечения заявки GTD
+    def __init__(self, id: int, price: float, quantity: int, owner=None, expires=None):
+        self.id = id
+        self.price = price
+        self.quantity = quantity
+        self.owner = owner
+        self.expires = expires
 
-class OrderObject:
-    id = IntValidator()
-    price = FloatValidator()
-    quantity = IntValidator()
+    def __repr__(self):
+        return f'{self.__class__.__name__}(id={self.id}, price={self.price}, quantity={self.quantity})'
 
 
 class Ask(OrderObject):
-    pass
+    __slots__ = ()
 
 
 class Bid(OrderObject):
-    pass
+    __slots__ = ()
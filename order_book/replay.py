@@ -0,0 +1,165 @@
+import mmap
+import struct
+import sys
+from array import array
+from time import perf_counter
+
+from .order_book import OrderBook
+
+
+# файл событий: заголовок и блоки; каждый блок хранит число событий и колонки
+# ts (нс), op, side, id, price, quantity, поэтому память при чтении ограничена одним блоком
+MAGIC = b'OBEV'
+VERSION = 1
+HEADER = struct.Struct('<4sB')
+BLOCK = struct.Struct('<I')
+COLUMNS = (('ts', 'q'), ('op', 'B'), ('side', 'B'), ('id', 'q'), ('price', 'd'), ('quantity', 'q'))
+OP_ADD, OP_DEL = 1, 2
+ASK, BID = 0, 1
+
+
+class EventWriter:
+    def __init__(self, path: str, block_size: int = 65536):
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION))
+        self._block_size = block_size
+        self._columns = [array(typecode) for _, typecode in COLUMNS]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, ts: int, side: int, order_id: int, price: float, quantity: int) -> None:
+        self._append(ts, OP_ADD, side, order_id, price, quantity)
+
+    def delete(self, ts: int, side: int, order_id: int) -> None:
+        self._append(ts, OP_DEL, side, order_id, 0.0, 0)
+
+    def _append(self, *event) -> None:
+        for column, value in zip(self._columns, event):
+            column.append(value)
+        if len(self._columns[0]) >= self._block_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._columns[0]:
+            return
+        self._file.write(BLOCK.pack(len(self._columns[0])))
+        for column in self._columns:
+            if sys.byteorder != 'little':
+                column.byteswap()
+            self._file.write(column.tobytes())
+        self._columns = [array(typecode) for _, typecode in COLUMNS]
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._flush()
+        self._file.close()
+
+
+# блоки файла в виде словаря колонок, файл отображается в память через mmap
+def read_blocks(path: str):
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if len(data) < HEADER.size or HEADER.unpack_from(data) != (MAGIC, VERSION):
+            raise ValueError('not an order book event file')
+        offset = HEADER.size
+        while offset < len(data):
+            count, = BLOCK.unpack_from(data, offset)
+            offset += BLOCK.size
+            block = {}
+            for name, typecode in COLUMNS:
+                column = array(typecode)
+                end = offset + count * column.itemsize
+                column.frombytes(data[offset:end])
+                if len(column) != count:
+                    raise ValueError('event file is truncated')
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                block[name] = column.tolist()
+                offset = end
+            yield block
+
+
+# подряд идущие события с одной операцией и стороной объединяются в пачки;
+# пачка также завершается на границе очередного снапшота
+def read_runs(blocks, snapshot_every: int = None, snapshot_interval: int = None):
+    run = None
+    events = 0
+    next_ts = None
+    for block in blocks:
+        for ts, op, side, order_id, price, quantity in zip(*(block[name] for name, _ in COLUMNS)):
+            boundary = False
+            if snapshot_interval is not None:
+                if next_ts is None:
+                    next_ts = ts - ts % snapshot_interval + snapshot_interval
+                elif ts >= next_ts:
+                    boundary = True
+            if run is not None and (boundary or run[0] != op or run[1] != side):
+                yield run
+                run = None
+            if boundary:
+                yield 'snapshot', next_ts
+                next_ts = ts - ts % snapshot_interval + snapshot_interval
+            if run is None:
+                run = op, side, [], [], []
+            run[2].append(order_id)
+            run[3].append(price)
+            run[4].append(quantity)
+            events += 1
+            if snapshot_every and not events % snapshot_every:
+                yield run
+                run = None
+                yield 'snapshot', ts
+    if run is not None:
+        yield run
+
+
+# повтор файла событий через стакан; итерация возвращает снапшоты,
+# run() прогоняет файл целиком и возвращает статистику
+class Replay:
+    def __init__(self, book: OrderBook, path: str, snapshot_every: int = None,
+                 snapshot_interval: int = None, depth: int = None):
+        self.book = book
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self.depth = depth
+        self.events = 0
+        self.seconds = 0.0
+
+    @property
+    def events_per_sec(self) -> float:
+        return self.events / self.seconds if self.seconds else 0.0
+
+    def __iter__(self):
+        book = self.book
+        runs = read_runs(read_blocks(self.path), self.snapshot_every, self.snapshot_interval)
+        start = perf_counter()
+        try:
+            for run in runs:
+                if run[0] == 'snapshot':
+                    self.seconds += perf_counter() - start
+                    yield {"events": self.events, "ts": run[1], **book.snapshot(self.depth)}
+                    start = perf_counter()
+                    continue
+                op, side, ids, prices, quantities = run
+                if op == OP_ADD:
+                    if side == BID:
+                        book.set_bids(prices, quantities, ids)
+                    else:
+                        book.set_asks(prices, quantities, ids)
+                elif side == BID:
+                    book.del_bids(ids)
+                else:
+                    book.del_asks(ids)
+                self.events += len(ids)
+        finally:
+            self.seconds += perf_counter() - start
+
+    def run(self) -> dict:
+        snapshots = sum(1 for _ in self)
+        return {"events": self.events, "seconds": self.seconds,
+                "events_per_sec": self.events_per_sec, "snapshots": snapshots}
@@ -0,0 +1,132 @@
+import struct
+import sys
+from array import array
+from math import isfinite, nan
+
+from .order_book import OrderBook, Ask, Bid
+
+
+# упакованный снапшот: заголовок, таблица меток владельцев и по пять массивов на сторону (id, цены, количества,
+# время истечения GTD, NaN - без срока, номер владельца в таблице, 0 - без метки) в порядке цена-время,
+# массивы пишутся и читаются целиком через array. Снапшоты версии 1 (без времени истечения) и версии 2
+# (без владельцев) читаются
+MAGIC = b'OBSN'
+VERSION = 3
+HEADER = struct.Struct('<4sBQQQQdQQ')  # ask_id, bid_id, seq, позиция журнала, шаг цены (0 - нет), число asks и bids
+OWNERS = struct.Struct('<Q')  # число меток владельцев, за ним каждая метка: длина и байты
+OWNER = struct.Struct('<I')
+
+
+# метка владельца сохраняется вместе с типом, чтобы после восстановления cancel_all находил те же заявки
+def encode_owner(owner) -> bytes:
+    if type(owner) is str:
+        return b's' + owner.encode()
+    if type(owner) is int:
+        return b'i' + str(owner).encode()
+    raise ValueError('<owner> must be str or int to be persisted')
+
+
+def decode_owner(data: bytes):
+    kind, value = data[:1], data[1:].decode()
+    return int(value) if kind == b'i' else value
+
+
+def _column(typecode: str, values) -> bytes:
+    column = array(typecode, values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _read_column(typecode: str, data, offset: int, count: int) -> tuple:
+    column = array(typecode)
+    end = offset + count * column.itemsize
+    column.frombytes(data[offset:end])
+    if len(column) != count:
+        raise ValueError('snapshot is truncated')
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tolist(), end
+
+
+def dumps(book: OrderBook, position: int = 0) -> bytes:
+    key_type = 'd' if book.tick_size is None else 'q'
+    # уровни берутся по списку цен напрямую, без генератора Ladder.__iter__
+    sides = [[obj for level in map(side.levels.__getitem__, side.prices) for obj in level.orders.values()]
+             for side in (book.asks, book.bids)]
+    owners = {}
+    numbers = [[0 if obj.owner is None else owners.setdefault(obj.owner, len(owners) + 1) for obj in objs]
+               for objs in sides]
+    names = [encode_owner(owner) for owner in owners]
+    chunks = [HEADER.pack(MAGIC, VERSION, book.ask_id, book.bid_id, book.seq, position,
+                          book.tick_size or 0.0, len(sides[0]), len(sides[1])), OWNERS.pack(len(names))]
+    chunks.extend(OWNER.pack(len(name)) + name for name in names)
+    for objs, owner_numbers in zip(sides, numbers):
+        chunks.append(_column('q', [obj.id for obj in objs]))
+        chunks.append(_column(key_type, [obj.price for obj in objs]))
+        chunks.append(_column('q', [obj.quantity for obj in objs]))
+        chunks.append(_column('d', [nan if obj.expires is None else obj.expires for obj in objs]))
+        chunks.append(_column('q', owner_numbers))
+
+    return b''.join(chunks)
+
+
+def read_header(data) -> dict:
+    if len(data) < HEADER.size:
+        raise ValueError('snapshot is truncated')
+    magic, version, ask_id, bid_id, seq, position, tick_size, asks, bids = HEADER.unpack_from(data)
+    if magic != MAGIC or version not in (1, 2, VERSION):
+        raise ValueError('not an order book snapshot')
+
+    return {"version": version, "ask_id": ask_id, "bid_id": bid_id, "seq": seq, "position": position,
+            "tick_size": tick_size or None, "asks": asks, "bids": bids}
+
+
+# таблица меток владельцев, номер метки - ее позиция с единицы
+def _read_owners(data, offset: int) -> tuple:
+    if len(data) < offset + OWNERS.size:
+        raise ValueError('snapshot is truncated')
+    count, = OWNERS.unpack_from(data, offset)
+    offset += OWNERS.size
+    names = [None]
+    for _ in range(count):
+        if len(data) < offset + OWNER.size:
+            raise ValueError('snapshot is truncated')
+        size, = OWNER.unpack_from(data, offset)
+        offset += OWNER.size
+        if len(data) < offset + size:
+            raise ValueError('snapshot is truncated')
+        names.append(decode_owner(bytes(data[offset:offset + size])))
+        offset += size
+
+    return names, offset
+
+
+# data может быть bytes или memoryview над mmap, стороны стакана собираются целиком из колонок
+def loads(data, book_class=OrderBook, **book_options) -> OrderBook:
+    header = read_header(data)
+    tick_size = book_options.pop('tick_size', header['tick_size'])
+    if tick_size != header['tick_size']:
+        raise ValueError('<tick_size> differs from the snapshot')
+
+    book = book_class(tick_size=tick_size, **book_options)
+    key_type = 'd' if tick_size is None else 'q'
+    offset = HEADER.size
+    names = [None]
+    if header['version'] > 2:
+        names, offset = _read_owners(data, offset)
+    for cls, side, count in ((Ask, book.asks, header['asks']), (Bid, book.bids, header['bids'])):
+        ids, offset = _read_column('q', data, offset, count)
+        keys, offset = _read_column(key_type, data, offset, count)
+        quantities, offset = _read_column('q', data, offset, count)
+        expires = owners = None
+        if header['version'] > 1:
+            expires, offset = _read_column('d', data, offset, count)
+            expires = [at if isfinite(at) else None for at in expires] if any(map(isfinite, expires)) else None
+        if header['version'] > 2:
+            owners, offset = _read_column('q', data, offset, count)
+            owners = [names[number] for number in owners] if any(owners) else None
+        book._load(cls, side, ids, keys, quantities, expires, owners)
+    book._ask_id, book._bid_id, book._seq = header['ask_id'], header['bid_id'], header['seq']
+
+    return book
@@ -1,38 +1,24 @@
-from .order_object import OrderObject
+def format_market_data(levels, to_price=None) -> list:
+    if to_price is None:
+        return [{"price": level.price, "quantity": level.quantity} for level in levels]
+    return [{"price": to_price(level.price), "quantity": level.quantity} for level in levels]
 
 
-# поиск позиции для вставки элемента в массив
-# с помощью алгоритма приближенного бинарного поиска
-def bin_insert(obj: OrderObject, in_array: list) -> None:
-    price = obj.price
-    low = 0  # нижний (начальный) индекс
-    mid = 0
-    high = len(in_array) - 1  # верхний (конечный) индекс
-    while low <= high:
-        mid = (low + high) // 2
-        if price < in_array[mid].price:
-            high = mid - 1
-        elif price > in_array[mid].price:
-            low = mid + 1
-        else:
-            in_array[mid].quantity += obj.quantity
-            return
-    else:
-        if low >= len(in_array):
-            in_array.insert(low, obj)
-            return
-        if high < 0:
-            in_array.insert(0, obj)
-            return
-        pos = mid + 1 if in_array[mid].price < price else mid
-        in_array.insert(pos, obj)
+MARKET_DATA_DTYPE = [('price', 'f8'), ('quantity', 'i8')]
 
 
-def find_position(by_id: int, in_array: list) -> int:
-    for obj in in_array:
-        if obj.id == by_id:
-            return in_array.index(obj)
+# рыночные данные стороны в виде структурированного массива NumPy (price, quantity)
+def market_data_array(levels: dict, prices: list, tick_size: float = None, digits: int = 0):
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError('market data arrays require NumPy, install it with `pip install numpy`') from None
 
+    data = np.empty(len(prices), dtype=MARKET_DATA_DTYPE)
+    if tick_size is None:
+        data['price'] = prices
+    else:
+        data['price'] = (np.array(prices, dtype='i8') * tick_size).round(digits)
+    data['quantity'] = np.fromiter((levels[price].quantity for price in prices), dtype='i8', count=len(prices))
 
-def format_market_data(in_array: list) -> list:
-    return [{"price": elem.price, "quantity": elem.quantity} for elem in in_array]
+    return data
@@ -1,37 +1,260 @@
-class TypesValidator:
-    def __set_name__(self, owner, property_name):
-        self.property_name = property_name
+from math import isfinite
 
-    def __get__(self, instance, owner):
-        if instance is None:
-            return self
 
-        key = "_" + self.property_name
-        return getattr(instance, key, None)
+# проверки выполняются один раз на границе API, сами заявки хранят готовые значения
+def check_int(name: str, value) -> int:
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f'<{name}> must be Integer')
 
+    if value <= 0:
+        raise ValueError(f'<{name}> must be bigger than Zero')
 
-class IntValidator(TypesValidator):
-    def __set__(self, instance, value):
-        if not isinstance(value, int) or isinstance(value, bool):
-            raise ValueError(f'<{self.property_name}> must be Integer')
+    return value
 
-        if value <= 0:
-            raise ValueError(f'<{self.property_name}> must be bigger than Zero')
 
-        key = "_" + self.property_name
-        setattr(instance, key, value)
+def check_price(name: str, value) -> float:
+    if not isinstance(value, (float, int)) or isinstance(value, bool):
+        raise ValueError(f'<{name}> must be Float or Integer')
 
+    if isinstance(value, float):
+        value = round(value, 2)
 
-class FloatValidator(TypesValidator):
-    def __set__(self, instance, value):
-        if not isinstance(value, (float, int)) or isinstance(value, bool):
-            raise ValueError(f'<{self.property_name}> must be Float or Integer')
+    if value <= 0:
+        raise ValueError(f'<{name}> must be bigger than Zero')
 
-        if isinstance(value, float):
-            value = round(value, 2)
+    return value
 
-        if value <= 0:
-            raise ValueError(f'<{self.property_name}> must be bigger than Zero')
 
-        key = "_" + self.property_name
-        setattr(instance, key, value)
+def check_tick_size(name: str, value) -> float:
+    if not isinstance(value, (float, int)) or isinstance(value, bool):
+        raise ValueError(f'<{name}> must be Float or Integer')
+
+    if not value > 0 or not isfinite(value):
+        raise ValueError(f'<{name}> must be bigger than Zero')
+
+    return value
+
+
+def check_time(name: str, value):
+    if not isinstance(value, (float, int)) or isinstance(value, bool):
+        raise ValueError(f'<{name}> must be Float or Integer')
+
+    if not isfinite(value):
+        raise ValueError(f'<{name}> is out of range')
+
+    return value
+
+
+TIME_IN_FORCE = ('GTC', 'IOC', 'FOK', 'GTD')
+
+
+# GTD требует время истечения, IOC и FOK имеют смысл только в стакане со сведением
+def check_time_in_force(tif, expires, matching: bool) -> tuple:
+    if tif not in TIME_IN_FORCE:
+        raise ValueError('<tif> must be one of GTC, IOC, FOK, GTD')
+
+    if tif == 'GTD':
+        if expires is None:
+            raise ValueError('<expires> must be set for GTD')
+        check_time('expires', expires)
+    elif expires is not None:
+        raise ValueError('<expires> is allowed only for GTD')
+
+    if tif in ('IOC', 'FOK') and not matching:
+        raise ValueError('<tif> IOC and FOK require OrderBook(matching=True)')
+
+    return tif, expires
+
+
+# перевод цены в целое число тиков, дальнейшие сравнения идут только по int
+def check_ticks(name: str, value, tick_size: float) -> int:
+    if not isinstance(value, (float, int)) or isinstance(value, bool):
+        raise ValueError(f'<{name}> must be Float or Integer')
+
+    ticks = value / tick_size
+    if not isfinite(ticks):
+        raise ValueError(f'<{name}> is out of range')
+
+    ticks = round(ticks)
+    if ticks <= 0:
+        raise ValueError(f'<{name}> must be bigger than Zero')
+
+    return ticks
+
+
+# пакетные проверки: массивы NumPy проверяются векторно по dtype и знаку,
+# остальные последовательности - поэлементно теми же функциями
+def check_ints(name: str, values) -> list:
+    dtype = getattr(values, 'dtype', None)
+    if dtype is None or dtype.kind == 'O':
+        return [check_int(name, value) for value in values]
+
+    if dtype.kind not in 'iu':
+        raise ValueError(f'<{name}> must be Integer')
+    if values.size and not (values > 0).all():
+        raise ValueError(f'<{name}> must be bigger than Zero')
+
+    return values.tolist()
+
+
+def check_prices(name: str, values, tick_size: float = None) -> list:
+    dtype = getattr(values, 'dtype', None)
+    if dtype is None or dtype.kind == 'O':
+        if tick_size is None:
+            return [check_price(name, value) for value in values]
+        return [check_ticks(name, value, tick_size) for value in values]
+
+    if dtype.kind not in 'iuf':
+        raise ValueError(f'<{name}> must be Float or Integer')
+    if tick_size is not None:
+        values = values / tick_size
+        if values.size and not abs(values).max() < 2 ** 63:
+            raise ValueError(f'<{name}> is out of range')
+        values = values.round().astype('int64')
+    elif dtype.kind == 'f':
+        values = values.round(2)
+    if values.size and not (values > 0).all():
+        raise ValueError(f'<{name}> must be bigger than Zero')
+
+    return values.tolist()
+
+
+def _to_list(values) -> list:
+    return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+
+# сообщения об ошибках частых случаев готовы заранее, чтобы не форматировать их на каждой плохой заявке
+ID_ZERO = '<id> must be bigger than Zero'
+QUANTITY_ZERO = '<quantity> must be bigger than Zero'
+PRICE_ZERO = '<price> must be bigger than Zero'
+
+
+# единая проверка заявки на границе API; функция цены выбирается один раз при создании под режим стакана.
+# быстрый путь проверяет точный тип и знак, остальные случаи (подклассы int и float, bool, другие типы)
+# разбирают проверки выше
+class Validator:
+    def __init__(self, tick_size: float = None):
+        self.tick_size = tick_size
+        self.key = self._float_key if tick_size is None else self._tick_key
+
+    def id(self, value) -> int:
+        if type(value) is int:
+            if value > 0:
+                return value
+            raise ValueError(ID_ZERO)
+        return check_int('id', value)
+
+    def quantity(self, value) -> int:
+        if type(value) is int:
+            if value > 0:
+                return value
+            raise ValueError(QUANTITY_ZERO)
+        return check_int('quantity', value)
+
+    # цена проверяется первой, как и раньше
+    def order(self, price, quantity) -> tuple:
+        key = self.key(price)
+        if type(quantity) is int:
+            if quantity > 0:
+                return key, quantity
+            raise ValueError(QUANTITY_ZERO)
+        return key, check_int('quantity', quantity)
+
+    def _float_key(self, price) -> float:
+        kind = type(price)
+        if kind is float:
+            price = round(price, 2)
+        elif kind is not int:
+            return check_price('price', price)
+        if price <= 0:
+            raise ValueError(PRICE_ZERO)
+        return price
+
+    def _tick_key(self, price) -> int:
+        kind = type(price)
+        if kind is float or kind is int:
+            ticks = price / self.tick_size
+            if -2 ** 63 < ticks < 2 ** 63:
+                ticks = round(ticks)
+                if ticks > 0:
+                    return ticks
+                raise ValueError(PRICE_ZERO)
+        return check_ticks('price', price, self.tick_size)
+
+    def ids(self, values) -> list:
+        return self._ints('id', values)
+
+    # пакет заявок проверяется целиком: сначала типы и минимум по всей колонке встроенными функциями,
+    # поэлементные проверки с точным сообщением запускаются только для плохого пакета
+    def orders(self, prices, quantities, ids=None) -> tuple:
+        keys = self._keys(prices)
+        quantities = self._ints('quantity', quantities)
+        if len(quantities) != len(keys):
+            raise ValueError('<quantity> must have the same length as <price>')
+        if ids is not None:
+            ids = self._ints('id', ids)
+            if len(ids) != len(keys):
+                raise ValueError('<id> must have the same length as <price>')
+
+        return keys, quantities, ids
+
+    @staticmethod
+    def _ints(name: str, values) -> list:
+        if hasattr(values, 'dtype'):
+            return check_ints(name, values)
+        values = list(values)
+        if not values or set(map(type, values)) == {int} and min(values) > 0:
+            return values
+        return check_ints(name, values)
+
+    def _keys(self, prices) -> list:
+        if hasattr(prices, 'dtype'):
+            return check_prices('price', prices, self.tick_size)
+        prices = list(prices)
+        if not prices:
+            return prices
+        if set(map(type, prices)) <= {int, float}:
+            tick_size = self.tick_size
+            if tick_size is None:
+                keys = [round(price, 2) for price in prices]
+            elif 0 < min(prices) and max(prices) / tick_size < 2 ** 63:
+                keys = [round(price / tick_size) for price in prices]
+            else:
+                keys = None
+            if keys is not None and min(keys) > 0:
+                return keys
+        return check_prices('price', prices, self.tick_size)
+
+
+# доверенный режим для заранее проверенных внутренних потоков: значения только приводятся к ключам уровней
+class TrustedValidator(Validator):
+    def id(self, value) -> int:
+        return value
+
+    def quantity(self, value) -> int:
+        return value
+
+    def order(self, price, quantity) -> tuple:
+        return self.key(price), quantity
+
+    def _float_key(self, price) -> float:
+        return round(price, 2)
+
+    def _tick_key(self, price) -> int:
+        return round(price / self.tick_size)
+
+    def ids(self, values) -> list:
+        return _to_list(values)
+
+    def orders(self, prices, quantities, ids=None) -> tuple:
+        if self.tick_size is None:
+            if hasattr(prices, 'dtype'):
+                keys = (prices.round(2) if prices.dtype.kind == 'f' else prices).tolist()
+            else:
+                keys = [round(price, 2) for price in prices]
+        elif hasattr(prices, 'dtype'):
+            keys = (prices / self.tick_size).round().astype('int64').tolist()
+        else:
+            keys = [round(price / self.tick_size) for price in prices]
+
+        return keys, _to_list(quantities), None if ids is None else _to_list(ids)
@@ -0,0 +1,156 @@
+import sys
+import threading
+from random import Random
+
+import pytest
+
+from order_book import ConcurrentOrderBook
+
+
+@pytest.fixture()
+def fast_switching():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.mark.concurrent
+@pytest.mark.positive
+def test_readers_never_see_half_applied_batches(fast_switching):
+    # arrange
+    book = ConcurrentOrderBook()
+    stop = threading.Event()
+    errors = []
+
+    def writer(seed):
+        rnd = Random(seed)
+        while not stop.is_set():
+            # заявки ставятся и снимаются только парами, поэтому объем уровня всегда четный
+            price = rnd.randint(1, 50)
+            ids = book.set_asks([price, price], [1, 1])
+            book.set_bids([price, price], [1, 1])
+            if rnd.random() < 0.7:
+                book.del_asks(ids)
+
+    def reader(seed):
+        rnd = Random(seed)
+        while not stop.is_set():
+            snapshot = book.snapshot(depth=rnd.choice([None, 5]))
+            for side in ('asks', 'bids'):
+                prices = [level['price'] for level in snapshot[side]]
+                if prices != sorted(prices) or any(level['quantity'] % 2 for level in snapshot[side]):
+                    errors.append(snapshot)
+
+    threads = [threading.Thread(target=writer, args=(seed,)) for seed in range(2)]
+    threads += [threading.Thread(target=reader, args=(seed,)) for seed in range(3)]
+
+    # act
+    for thread in threads:
+        thread.start()
+    stop.wait(1)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # assert
+    assert errors == []
+    assert book.version % 2 == 0
+    assert book.snapshot() == {"seq": book.seq, **book.report_market_data()}
+
+
+@pytest.mark.concurrent
+@pytest.mark.positive
+def test_published_snapshot_reused_until_write():
+    # arrange
+    book = ConcurrentOrderBook()
+    book.set_ask(10, 1)
+
+    # act
+    first = book.report_market_data()
+    second = book.report_market_data()
+    book.set_bid(9, 1)
+    third = book.report_market_data()
+
+    # assert
+    assert first['asks'] is second['asks']
+    assert third['bids'] == [{"price": 9, "quantity": 1}]
+    assert book.best_bid() == {"price": 9, "quantity": 1}
+    assert book.version == 4
+
+
+@pytest.mark.concurrent
+@pytest.mark.positive
+@pytest.mark.parametrize("change", ["add", "remove"])
+def test_dense_prices_read_during_level_change_are_not_cached(change):
+    # arrange
+    book = ConcurrentOrderBook(tick_size=1, dense=16)
+    book.set_ask(10, 1)
+    book.set_ask(12, 1)
+    ladder = book.asks
+    book.report_market_data()
+    link, unlink = ladder._link, ladder._unlink
+
+    # читатель без блокировки собирает список цен, пока уровень еще не изменен
+    def read_then(method):
+        def changed(level):
+            ladder.prices
+            method(level)
+        return changed
+
+    ladder._link, ladder._unlink = read_then(link), read_then(unlink)
+
+    # act
+    if change == 'add':
+        book.set_ask(11, 1)
+    else:
+        book.del_ask(2)
+    market_data = book.report_market_data()
+
+    # assert
+    expected = [10, 11, 12] if change == 'add' else [10]
+    assert [level['price'] for level in market_data['asks']] == expected
+
+
+@pytest.mark.concurrent
+@pytest.mark.positive
+def test_arrays_and_dumps_are_consistent_under_writes(fast_switching):
+    # arrange
+    np = pytest.importorskip('numpy')
+    book = ConcurrentOrderBook(tick_size=1, dense=16)
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        rnd = Random(1)
+        while not stop.is_set():
+            # пары заявок ставятся и снимаются одним пакетом, поэтому объем уровня всегда четный
+            ids = book.set_asks([rnd.randint(1, 50)] * 2, [1, 1])
+            if rnd.random() < 0.7:
+                book.del_asks(ids)
+
+    def reader():
+        while not stop.is_set():
+            try:
+                asks = book.market_data_arrays()['asks']
+                restored = ConcurrentOrderBook.loads(book.dumps())
+            except Exception as err:
+                errors.append(err)
+                continue
+            if (asks['quantity'] % 2).any() or np.any(np.diff(asks['price']) <= 0):
+                errors.append(asks)
+            if any(level.quantity % 2 for level in restored.asks):
+                errors.append(restored.snapshot())
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(2)]
+
+    # act
+    for thread in threads:
+        thread.start()
+    stop.wait(1)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # assert
+    assert errors == []
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from order_book import Gateway, GatewayClient
+from const import Errors as Err
+
+
+async def start_gateway(**book_options):
+    gateway = Gateway(**book_options)
+    server = await gateway.start('127.0.0.1', 0)
+    return gateway, server, server.sockets[0].getsockname()[1]
+
+
+async def stop_gateway(gateway, server):
+    server.close()
+    await server.wait_closed()
+    await gateway.stop()
+
+
+@pytest.mark.gateway
+@pytest.mark.positive
+def test_gateway_add_query_cancel():
+    async def scenario():
+        gateway, server, port = await start_gateway()
+        client = await GatewayClient.connect(port=port)
+        try:
+            ask_id = await client.add('AAPL', 'ask', 10.5, 3)
+            await client.add('AAPL', 'ask', 10.5, 2)
+            bid_id = await client.add('AAPL', 'bid', 9.25, 7)
+            full = await client.query('AAPL')
+            cancelled = await client.cancel('AAPL', 'ask', ask_id)
+            missing = await client.cancel('AAPL', 'ask', ask_id)
+            top = await client.query('AAPL', depth=1)
+            return bid_id, full, cancelled, missing, top
+        finally:
+            await client.close()
+            await stop_gateway(gateway, server)
+
+    # act
+    bid_id, full, cancelled, missing, top = asyncio.run(scenario())
+
+    # assert
+    assert bid_id == 1
+    assert full == {"seq": 3, "asks": [{"price": 10.5, "quantity": 5}], "bids": [{"price": 9.25, "quantity": 7}]}
+    assert (cancelled, missing) == (1, 0)
+    assert top == {"seq": 4, "asks": [{"price": 10.5, "quantity": 2}], "bids": [{"price": 9.25, "quantity": 7}]}
+
+
+@pytest.mark.gateway
+@pytest.mark.positive
+def test_gateway_pushes_deltas_to_subscribers():
+    async def scenario():
+        gateway, server, port = await start_gateway()
+        subscriber = await GatewayClient.connect(port=port)
+        trader = await GatewayClient.connect(port=port)
+        try:
+            await subscriber.subscribe('MSFT')
+            await trader.add('MSFT', 'bid', 99, 1)
+            order_id = await trader.add('MSFT', 'bid', 99, 4)
+            await trader.add('GAZP', 'ask', 1, 1)
+            await trader.cancel('MSFT', 'bid', order_id)
+            return [await asyncio.wait_for(subscriber.deltas.get(), 1) for _ in range(3)], subscriber.deltas.empty()
+        finally:
+            await subscriber.close()
+            await trader.close()
+            await stop_gateway(gateway, server)
+
+    # act
+    deltas, drained = asyncio.run(scenario())
+
+    # assert
+    assert [(d['symbol'], d['seq'], d['side'], d['price'], d['quantity']) for d in deltas] == [
+        ('MSFT', 1, 'bid', 99, 1), ('MSFT', 2, 'bid', 99, 5), ('MSFT', 3, 'bid', 99, 1)
+    ]
+    assert drained
+
+
+@pytest.mark.gateway
+@pytest.mark.negative
+def test_gateway_reports_validation_errors():
+    async def scenario():
+        gateway, server, port = await start_gateway(tick_size=0.01)
+        client = await GatewayClient.connect(port=port)
+        try:
+            with pytest.raises(ValueError) as err:
+                await client.add('AAPL', 'ask', 0.001, 1)
+            order_id = await client.add('AAPL', 'ask', 1, 1)
+            return str(err.value), order_id
+        finally:
+            await client.close()
+            await stop_gateway(gateway, server)
+
+    # act
+    error, order_id = asyncio.run(scenario())
+
+    # assert
+    assert error == Err.PRICE_ZERO
+    assert order_id == 2
+
+
+@pytest.mark.gateway
+@pytest.mark.positive
+@pytest.mark.parametrize("record_deltas", [True, False])
+def test_gateway_pushes_trades_in_matching_mode(record_deltas):
+    async def scenario():
+        gateway, server, port = await start_gateway(matching=True, record_deltas=record_deltas)
+        subscriber = await GatewayClient.connect(port=port)
+        trader = await GatewayClient.connect(port=port)
+        try:
+            await subscriber.subscribe('MSFT')
+            ask_id = await trader.add('MSFT', 'ask', 99, 3)
+            bid_id = await trader.add('MSFT', 'bid', 100, 2)
+            trade = await asyncio.wait_for(subscriber.trades.get(), 1)
+            delta = await asyncio.wait_for(subscriber.deltas.get(), 1) if record_deltas else None
+            return ask_id, bid_id, trade, gateway.manager.book('MSFT').drain_trades(), delta
+        finally:
+            await subscriber.close()
+            await trader.close()
+            await stop_gateway(gateway, server)
+
+    # act
+    ask_id, bid_id, trade, pending, delta = asyncio.run(scenario())
+
+    # assert
+    assert trade == {"symbol": "MSFT", "price": 99, "quantity": 2, "ask_id": ask_id, "bid_id": bid_id,
+                     "aggressor": "bid"}
+    assert pending == []
+    if record_deltas:
+        assert (delta['seq'], delta['side'], delta['price'], delta['quantity']) == (1, 'ask', 99, 3)
+
+
+@pytest.mark.gateway
+@pytest.mark.negative
+def test_gateway_survives_level_overflowing_wire_quantity():
+    async def scenario():
+        gateway, server, port = await start_gateway()
+        subscriber = await GatewayClient.connect(port=port)
+        trader = await GatewayClient.connect(port=port)
+        try:
+            await subscriber.subscribe('AAPL')
+            first = await trader.add('AAPL', 'ask', 10, 2 ** 64 - 1)
+            with pytest.raises(ValueError) as err:
+                await trader.add('AAPL', 'ask', 10, 2 ** 64 - 1)
+            # уровень сверх ширины протокола, поставленный в обход шлюза, не останавливает рассылку
+            gateway.manager.book('AAPL').set_ask(11, 2 ** 64)
+            await trader.add('AAPL', 'ask', 12, 1)
+            deltas = [await asyncio.wait_for(subscriber.deltas.get(), 1) for _ in range(2)]
+            top = await trader.query('AAPL', depth=1)
+            return first, str(err.value), deltas, top
+        finally:
+            await subscriber.close()
+            await trader.close()
+            await stop_gateway(gateway, server)
+
+    # act
+    first, error, deltas, top = asyncio.run(scenario())
+
+    # assert
+    assert first == 1
+    assert error == f'<quantity> would make the level exceed {2 ** 64 - 1}'
+    assert [(d['seq'], d['price'], d['quantity']) for d in deltas] == [(1, 10, 2 ** 64 - 1), (3, 12, 1)]
+    assert top == {"seq": 3, "asks": [{"price": 10, "quantity": 2 ** 64 - 1}], "bids": []}
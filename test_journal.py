@@ -0,0 +1,330 @@
+from math import nan
+from random import Random
+
+import pytest
+
+from order_book import OrderBook, ConcurrentOrderBook
+from order_book.journal import OP_ADD, RECORDS, Journal
+from order_book.snapshot import HEADER, MAGIC, OWNERS, VERSION, _column, dumps, loads
+
+
+def fill(book: OrderBook) -> None:
+    ask_ids = [book.set_ask(10 + i / 100, i + 1) for i in range(20)]
+    book.set_bids([9.5, 9.9, 9.9], [3, 2, 1])
+    book.del_ask(ask_ids[3])
+    book.del_asks(ask_ids[5:8])
+    book.amend_ask(ask_ids[10], quantity=2)
+    book.amend_ask(ask_ids[12], price=10.5)
+    book.set_bid(10.02, 4)
+
+
+@pytest.mark.journal
+@pytest.mark.positive
+@pytest.mark.parametrize("book_options", [{}, {"tick_size": 0.01}, {"matching": True},
+                                          {"tick_size": 0.01, "dense": 16}])
+def test_snapshot_round_trip(book_options):
+    # arrange
+    book = OrderBook(**book_options)
+    fill(book)
+
+    # act
+    restored = loads(dumps(book), **book_options)
+
+    # assert
+    assert restored.snapshot() == book.snapshot()
+    assert (restored.ask_id, restored.bid_id) == (book.ask_id, book.bid_id)
+    assert [obj.id for level in restored.bids for obj in level] == [obj.id for level in book.bids for obj in level]
+
+
+@pytest.mark.journal
+@pytest.mark.positive
+@pytest.mark.parametrize("book_class", [OrderBook, ConcurrentOrderBook])
+def test_book_dumps_and_loads(book_class):
+    # arrange
+    book = book_class(tick_size=0.01, dense=16)
+    fill(book)
+    fork = book.clone()
+    fork.set_ask(10.4, 7)
+
+    # act
+    restored = book_class.loads(book.dumps())
+    restored_fork = book_class.loads(fork.dumps())
+
+    # assert
+    assert type(restored) is book_class
+    assert restored.snapshot() == book.snapshot()
+    assert restored_fork.snapshot() == fork.snapshot()
+    assert restored_fork.get_ask(fork.ask_id).quantity == 7
+    assert restored.dumps() == book.dumps()
+
+
+@pytest.mark.journal
+@pytest.mark.positive
+@pytest.mark.parametrize("book_options", [{"tick_size": 0.01}, {"matching": True}])
+def test_recover_from_snapshot_and_journal_tail(tmp_path, book_options):
+    # arrange
+    journal = Journal(str(tmp_path / 'book.wal'), str(tmp_path / 'book.snap'), group_size=4)
+    book = journal.recover(**book_options)
+    fill(book)
+    journal.checkpoint()
+    book.set_ask(10.5, 7)
+    book.del_bid(1)
+    journal.commit()
+    expect = book.snapshot()
+
+    # act
+    recovered = Journal(str(tmp_path / 'book.wal'), str(tmp_path / 'book.snap')).recover(**book_options)
+
+    # assert
+    assert recovered.snapshot() == expect
+    assert (recovered.ask_id, recovered.bid_id) == (book.ask_id, book.bid_id)
+    assert recovered.drain_trades() == []
+
+
+@pytest.mark.journal
+@pytest.mark.positive
+def test_recover_replays_only_filled_part_of_ioc_and_fok(tmp_path):
+    # arrange
+    path = str(tmp_path / 'book.wal')
+    journal = Journal(path, fsync=False)
+    book = journal.recover(matching=True)
+    book.set_ask(10, 3)
+    book.set_ask(11, 4)
+    book.set_bid(11, 5, tif='IOC')
+    book.set_bid(12, 9, tif='FOK')
+    book.set_bid(11, 2, tif='FOK')
+    journal.close()
+
+    # act
+    recovered = Journal(path, fsync=False).recover(matching=True)
+
+    # assert
+    assert recovered.snapshot() == book.snapshot() == {"seq": 5, "asks": [], "bids": []}
+
+
+@pytest.mark.journal
+@pytest.mark.positive
+def test_recover_keeps_ids_of_unfilled_ioc_and_fok(tmp_path):
+    # arrange
+    path = str(tmp_path / 'book.wal')
+    journal = Journal(path, fsync=False)
+    book = journal.recover(matching=True)
+    book.set_ask(10, 1, tif='IOC')
+    fok_id = book.set_bid(9, 5, tif='FOK')
+    journal.close()
+
+    # act
+    recovered = Journal(path, fsync=False).recover(matching=True)
+
+    # assert
+    assert (recovered.ask_id, recovered.bid_id) == (1, fok_id) == (1, 1)
+    assert recovered.set_bid(9, 1) == 2
+
+
+@pytest.mark.journal
+@pytest.mark.positive
+@pytest.mark.parametrize("book_options", [{}, {"matching": True}, {"tick_size": 0.01, "dense": 16}])
+def test_gtd_orders_keep_expiry_after_recover_and_loads(tmp_path, book_options):
+    # arrange
+    path, snapshot_path = str(tmp_path / 'book.wal'), str(tmp_path / 'book.snap')
+    journal = Journal(path, snapshot_path, fsync=False)
+    book = journal.recover(**book_options)
+    book.set_ask(10, 1, tif='GTD', expires=5)
+    book.set_ask(11, 2)
+    journal.checkpoint()
+    book.set_bid(9, 3, tif='GTD', expires=7.5)
+    journal.close()
+
+    # act
+    recovered = Journal(path, snapshot_path, fsync=False).recover(**book_options)
+    loaded = OrderBook.loads(recovered.dumps(), **book_options)
+
+    # assert
+    for restored in (recovered, loaded):
+        assert [(type(obj).__name__, obj.id) for obj in restored.expire(6)] == [("Ask", 1)]
+        assert [(type(obj).__name__, obj.id) for obj in restored.expire(8)] == [("Bid", 1)]
+        assert restored.report_market_data()['asks'] == [{"price": 11, "quantity": 2}]
+        assert restored.best_bid() is None
+
+
+@pytest.mark.journal
+@pytest.mark.positive
+@pytest.mark.parametrize("book_options", [{}, {"matching": True}, {"tick_size": 0.01, "dense": 16}])
+def test_owners_survive_recover_and_loads(tmp_path, book_options):
+    # arrange
+    long_owner = 'session-' + 'ё' * 40
+    path, snapshot_path = str(tmp_path / 'book.wal'), str(tmp_path / 'book.snap')
+    journal = Journal(path, snapshot_path, fsync=False)
+    book = journal.recover(**book_options)
+    book.set_ask(10, 1, owner='alice')
+    book.set_ask(11, 2, owner=7)
+    journal.checkpoint()
+    book.set_bids([9, 8], [3, 4], owner=long_owner)
+    book.set_ask(12, 5, owner='alice')
+    book.set_bid(7, 6)
+    journal.close()
+
+    # act
+    recovered = Journal(path, snapshot_path, fsync=False).recover(**book_options)
+    loaded = OrderBook.loads(recovered.dumps(), **book_options)
+
+    # assert
+    for restored in (recovered, loaded):
+        assert [obj.id for obj in restored.cancel_all('alice')[0]] == [1, 3]
+        assert [obj.id for obj in restored.cancel_all(7)[0]] == [2]
+        assert restored.cancel_all('7') == ([], [])
+        assert [obj.id for obj in restored.cancel_all(long_owner)[0]] == [1, 2]
+        assert restored.report_market_data() == {"asks": [], "bids": [{"price": 7, "quantity": 6}]}
+
+
+@pytest.mark.journal
+@pytest.mark.negative
+def test_journal_rejects_owner_that_cannot_be_persisted(tmp_path):
+    # arrange
+    path = str(tmp_path / 'book.wal')
+    journal = Journal(path, fsync=False)
+    book = journal.recover()
+
+    # act
+    with pytest.raises(ValueError) as err:
+        book.set_ask(10, 1, owner=('desk', 1))
+    book.set_ask(11, 1, owner='desk')
+    journal.close()
+
+    # assert
+    assert str(err.value) == '<owner> must be str or int to be persisted'
+    assert book.report_market_data()['asks'] == [{"price": 11, "quantity": 1}]
+    assert [obj.price for obj in Journal(path, fsync=False).recover().cancel_all('desk')[0]] == [11]
+
+
+@pytest.mark.journal
+@pytest.mark.positive
+@pytest.mark.parametrize("book_options", [{}, {"matching": True}, {"tick_size": 0.01, "dense": 16}])
+@pytest.mark.parametrize("seed", range(5))
+def test_recover_restores_live_seq(tmp_path, book_options, seed):
+    # arrange
+    rnd = Random(seed)
+    path = str(tmp_path / 'book.wal')
+    journal = Journal(path, fsync=False)
+    book = journal.recover(**book_options)
+    for step in range(200):
+        side = rnd.choice(('ask', 'bid'))
+        index = getattr(book, side + 's').index
+        price = rnd.randint(95, 105) / 10
+        action = rnd.random()
+        if action < 0.3 or not index:
+            tif = rnd.choice([None, 'GTD'] + (['IOC', 'FOK'] if book_options.get('matching') else []))
+            getattr(book, 'set_' + side)(price, rnd.randint(1, 5), tif=tif,
+                                         expires=step + rnd.randint(1, 20) if tif == 'GTD' else None,
+                                         owner=rnd.choice(['alice', 'bob']))
+        elif action < 0.45:
+            getattr(book, 'set_' + side + 's')([rnd.randint(95, 105) / 10 for _ in range(4)], [1, 2, 3, 4],
+                                               owner='alice')
+        elif action < 0.6:
+            getattr(book, 'del_' + side + 's')(rnd.sample(sorted(index), min(3, len(index))))
+        elif action < 0.7:
+            getattr(book, 'del_' + side)(rnd.choice(sorted(index)))
+        elif action < 0.85:
+            getattr(book, 'amend_' + side)(rnd.choice(sorted(index)), quantity=rnd.randint(1, 5), price=price)
+        elif action < 0.95:
+            book.expire(step)
+        else:
+            book.cancel_all('bob')
+    journal.close()
+
+    # act
+    recovered = Journal(path, fsync=False).recover(**book_options)
+
+    # assert
+    assert recovered.snapshot() == book.snapshot()
+    assert (recovered.ask_id, recovered.bid_id) == (book.ask_id, book.bid_id)
+
+
+@pytest.mark.journal
+@pytest.mark.negative
+def test_recover_skips_torn_record(tmp_path):
+    # arrange
+    path = str(tmp_path / 'book.wal')
+    journal = Journal(path, fsync=False)
+    book = journal.recover()
+    book.set_ask(1, 1)
+    book.set_ask(2, 2)
+    journal.close()
+    with open(path, 'ab') as file:
+        file.write(b'\x01\x02\x03')
+
+    # act
+    journal = Journal(path, fsync=False)
+    recovered = journal.recover()
+    ask_id = recovered.set_ask(3, 3)
+    journal.close()
+
+    # assert
+    assert ask_id == 3
+    assert Journal(path).recover().report_market_data() == recovered.report_market_data()
+
+
+@pytest.mark.journal
+@pytest.mark.negative
+@pytest.mark.parametrize("written, recovered, expect", [
+    ({}, {"tick_size": 0.01}, 'journal was written with tick_size=None, not 0.01'),
+    ({"tick_size": 0.01}, {}, 'journal was written with tick_size=0.01, not None'),
+    ({"tick_size": 0.01}, {"tick_size": 0.05}, 'journal was written with tick_size=0.01, not 0.05'),
+])
+def test_recover_rejects_journal_of_other_tick_mode(tmp_path, written, recovered, expect):
+    # arrange
+    path = str(tmp_path / 'book.wal')
+    journal = Journal(path, fsync=False)
+    journal.recover(**written).set_ask(10, 1)
+    journal.close()
+
+    # act
+    with pytest.raises(ValueError) as err:
+        Journal(path, fsync=False).recover(**recovered)
+
+    # assert
+    assert str(err.value) == expect
+    assert Journal(path, fsync=False).recover(**written).report_market_data()['asks'] == [{"price": 10, "quantity": 1}]
+
+
+@pytest.mark.journal
+@pytest.mark.negative
+def test_recover_rejects_journal_without_header(tmp_path):
+    # arrange
+    path = tmp_path / 'book.wal'
+    path.write_bytes(RECORDS[False].pack(1, OP_ADD, 0, 1, 10.0, 1, nan, 0, 0))
+
+    # act
+    with pytest.raises(ValueError) as err:
+        Journal(str(path), fsync=False).recover()
+
+    # assert
+    assert str(err.value) == 'not an order book journal'
+
+
+@pytest.mark.journal
+@pytest.mark.negative
+def test_loads_rejects_foreign_data():
+    # act
+    with pytest.raises(ValueError) as err:
+        loads(b'not a snapshot at all, definitely not' * 2)
+
+    # assert
+    assert str(err.value) == 'not an order book snapshot'
+
+
+@pytest.mark.journal
+@pytest.mark.negative
+@pytest.mark.parametrize("ids, prices, expect", [([1, 2], [11.0, 10.0], 'orders must be grouped by ascending price'),
+                                                 ([1, 1], [10.0, 10.0], 'order ids must be unique')])
+def test_loads_rejects_broken_order_columns(ids, prices, expect):
+    # arrange
+    data = HEADER.pack(MAGIC, VERSION, 2, 0, 0, 0, 0.0, 2, 0) + OWNERS.pack(0) + _column('q', ids) + \
+        _column('d', prices) + _column('q', [1, 1]) + _column('d', [nan, nan]) + _column('q', [0, 0])
+
+    # act
+    with pytest.raises(ValueError) as err:
+        loads(data)
+
+    # assert
+    assert str(err.value) == expect
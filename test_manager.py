@@ -0,0 +1,88 @@
+import pytest
+
+from order_book import Ask, BookManager, ShardedBookManager
+from const import Errors as Err
+
+
+SYMBOLS = ['AAPL', 'MSFT', 'GAZP', 'SBER', 'YNDX']
+
+
+@pytest.mark.manager
+@pytest.mark.positive
+def test_manager_routes_to_separate_books():
+    # arrange
+    manager = BookManager(tick_size=0.01)
+
+    # act
+    ids = [manager.set_ask(symbol, 10 + i, i + 1) for i, symbol in enumerate(SYMBOLS)]
+    manager.set_bid('AAPL', 9, 1)
+    deleted = manager.del_ask('MSFT', ids[1])
+    results = manager.execute_many([('best_ask', 'GAZP'), ('set_bid', 'SBER', 0, 1)])
+
+    # assert
+    assert ids == [1] * len(SYMBOLS)
+    assert manager.symbols == SYMBOLS
+    assert isinstance(deleted, Ask)
+    assert manager.report_market_data('MSFT') == {"asks": [], "bids": []}
+    assert manager.report_market_data('AAPL') == {"asks": [{"price": 10, "quantity": 1}],
+                                                   "bids": [{"price": 9, "quantity": 1}]}
+    assert results[0] == {"price": 12, "quantity": 3}
+    assert str(results[1]) == Err.PRICE_ZERO
+
+
+@pytest.mark.manager
+@pytest.mark.positive
+def test_sharded_manager_batches_in_submit_order():
+    # arrange
+    with ShardedBookManager(workers=2) as manager:
+        # act
+        for i, symbol in enumerate(SYMBOLS):
+            manager.submit('set_ask', symbol, 10 + i, 1)
+            manager.submit('set_ask', symbol, 10 + i, 2)
+        manager.submit('set_bid', 'AAPL', 'bad', 1)
+        results = manager.flush()
+        ask = manager.get_ask('SBER', 2)
+        market_data = manager.report_market_data('YNDX')
+        with pytest.raises(ValueError) as err:
+            manager.set_bid('AAPL', 1, 0)
+
+    # assert
+    assert results[:-1] == [1, 2] * len(SYMBOLS)
+    assert str(results[-1]) == Err.PRICE_TYPE
+    assert (ask.id, ask.price, ask.quantity) == (2, 13, 2)
+    assert market_data == {"asks": [{"price": 14, "quantity": 3}], "bids": []}
+    assert str(err.value) == Err.QUANTITY_ZERO
+
+
+@pytest.mark.manager
+@pytest.mark.negative
+def test_manager_rejects_unknown_command():
+    # arrange
+    manager = BookManager()
+
+    # act
+    with pytest.raises(ValueError) as err:
+        manager.execute('_level_changed', 'AAPL')
+
+    # assert
+    assert str(err.value).startswith('<command> must be one of')
+
+
+@pytest.mark.manager
+@pytest.mark.negative
+def test_sharded_manager_survives_malformed_command():
+    # arrange
+    with ShardedBookManager(workers=1) as manager:
+        manager.submit('set_ask', 'AAPL', 10, 1)
+        manager.submit('set_ask', 'AAPL', 1)
+
+        # act
+        results = manager.flush()
+        with pytest.raises(TypeError):
+            manager.execute('set_ask', 'AAPL', 11)
+        market_data = manager.report_market_data('AAPL')
+
+    # assert
+    assert results[0] == 1
+    assert isinstance(results[1], TypeError)
+    assert market_data == {"asks": [{"price": 10, "quantity": 1}], "bids": []}
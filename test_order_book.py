@@ -1,8 +1,9 @@
 import pytest
-from random import randint, random
+from random import Random, randint, random
 from sys import maxsize, float_info
 
-from order_book import Ask, Bid
+from order_book import Ask, Bid, OrderBook
+from order_book.metrics import Histogram
 from const import Errors as Err
 
 
@@ -116,15 +117,17 @@ def test_double_ask_positive(order_book, price, quantity):
 
     # act
     ask_id = book.set_ask(price, quantity)
-    book.set_ask(price, quantity)
+    second_id = book.set_ask(price, quantity)
     ask = book.get_ask(ask_id)
+    second = book.get_ask(second_id)
     market_data = book.report_market_data()
     asks = market_data['asks']
 
     # assert
     assert len(asks) == 1
-    assert ask.price == price
-    assert ask.quantity == quantity * 2
+    assert asks[0]['quantity'] == quantity * 2
+    assert (ask.price, ask.quantity) == (price, quantity)
+    assert (second.id, second.price, second.quantity) == (second_id, price, quantity)
 
 
 @pytest.mark.bid
@@ -137,15 +140,17 @@ def test_double_bid_positive(order_book, price, quantity):
 
     # act
     bid_id = book.set_bid(price, quantity)
-    book.set_bid(price, quantity)
+    second_id = book.set_bid(price, quantity)
     bid = book.get_bid(bid_id)
+    second = book.get_bid(second_id)
     market_data = book.report_market_data()
     bids = market_data['bids']
 
     # assert
     assert len(bids) == 1
-    assert bid.price == price
-    assert bid.quantity == quantity * 2
+    assert bids[0]['quantity'] == quantity * 2
+    assert (bid.price, bid.quantity) == (price, quantity)
+    assert (second.id, second.price, second.quantity) == (second_id, price, quantity)
 
 
 # генерируем массив случайных пар значений {"price": float, "quantity": integer}
@@ -324,3 +329,1077 @@ def test_del_bid_negative(h, order_book, bid_id, expect):
 
     # assert
     assert exception == expect
+
+
+@pytest.mark.ask
+@pytest.mark.positive
+def test_del_ask_from_deep_book(order_book):
+    # arrange
+    book = order_book
+    ids = [book.set_ask(price, 1) for price in range(1, 101)]
+
+    # act
+    deleted = [book.del_ask(ask_id) for ask_id in ids[::2]]
+    asks = book.report_market_data()['asks']
+
+    # assert
+    assert [ask.id for ask in deleted] == ids[::2]
+    assert all(book.get_ask(ask_id) is None for ask_id in ids[::2])
+    assert all(book.get_ask(ask_id).id == ask_id for ask_id in ids[1::2])
+    assert [ask['price'] for ask in asks] == list(range(2, 101, 2))
+
+
+@pytest.mark.ask
+@pytest.mark.positive
+def test_level_keeps_orders_in_fifo(order_book):
+    # arrange
+    book = order_book
+    ids = [book.set_ask(10.5, quantity) for quantity in range(1, 6)]
+
+    # act
+    book.del_ask(ids[2])
+    level = book.asks.levels[10.5]
+    asks = book.report_market_data()['asks']
+
+    # assert
+    assert [ask.id for ask in level] == ids[:2] + ids[3:]
+    assert asks == [{"price": 10.5, "quantity": 1 + 2 + 4 + 5}]
+
+    # act
+    for ask_id in ids:
+        book.del_ask(ask_id)
+
+    # assert
+    assert book.report_market_data()['asks'] == []
+    assert len(book.asks) == 0
+
+
+@pytest.mark.positive
+def test_order_objects_are_compact(order_book):
+    # arrange
+    book = order_book
+
+    # act
+    ask = book.get_ask(book.set_ask(0.005, 1))
+    bid = book.get_bid(book.set_bid(10, 1))
+
+    # assert
+    assert not hasattr(ask, '__dict__')
+    assert not hasattr(bid, '__dict__')
+    assert (ask.price, bid.price) == (0.01, 10)
+
+
+POSITIVE_TICK_SUIT = [
+    (0.01, [0.1 + 0.2, 0.3, 0.29999], 0.3),  # проверка слияния цен, отличающихся погрешностью float
+    (0.25, [10.2, 10.25, 10.3], 10.25),  # проверка округления до ближайшего шага цены
+    (5, [99, 100, 101], 100)  # проверка целого шага цены
+]
+
+
+@pytest.mark.report
+@pytest.mark.positive
+@pytest.mark.parametrize("tick_size, prices, expect",
+                         POSITIVE_TICK_SUIT)
+def test_tick_size_merges_levels(tick_size, prices, expect):
+    # arrange
+    book = OrderBook(tick_size=tick_size)
+
+    # act
+    ids = [book.set_bid(price, 1) for price in prices]
+    bids = book.report_market_data()['bids']
+
+    # assert
+    assert bids == [{"price": expect, "quantity": len(prices)}]
+    assert all(isinstance(book.get_bid(bid_id).price, int) for bid_id in ids)
+    assert book.to_price(book.get_bid(ids[0]).price) == expect
+
+
+NEGATIVE_TICK_SUIT = [
+    (0.001, Err.PRICE_ZERO),  # попытка передать цену, которая округляется до нуля тиков
+    (float_info.max, Err.PRICE_RANGE),  # попытка передать цену, не представимую в тиках
+    ("1", Err.PRICE_TYPE)  # попытка передать в Price строку
+]
+
+
+@pytest.mark.ask
+@pytest.mark.negative
+@pytest.mark.parametrize("price, expect",
+                         NEGATIVE_TICK_SUIT)
+def test_set_ask_ticks_negative(h, price, expect):
+    # arrange
+    book = OrderBook(tick_size=0.01)
+
+    # act
+    exception = h.try_to_set_ask(book, price, 1)
+
+    # assert
+    assert exception == expect
+
+
+@pytest.mark.report
+@pytest.mark.positive
+def test_book_is_silent_by_default(capsys, caplog, order_book):
+    # arrange
+    book = order_book
+    ask_id = book.set_ask(1.5, 10)
+
+    # act
+    book.get_ask(ask_id)
+    book.get_ask(ask_id + 1)
+    book.del_ask(ask_id + 1)
+    book.report_market_data()
+
+    # assert
+    assert capsys.readouterr().out == ''
+
+    # act
+    with caplog.at_level('DEBUG', logger='order_book'):
+        book.get_ask(ask_id)
+        book.del_ask(ask_id + 1)
+        book.report_market_data()
+
+    # assert
+    assert [record.getMessage().split(':')[0] for record in caplog.records] == [
+        f'Ask #{ask_id} info', f'#{ask_id + 1} is not exist', 'market data'
+    ]
+
+
+@pytest.mark.report
+@pytest.mark.positive
+def test_best_prices_and_depth(order_book):
+    # arrange
+    book = order_book
+
+    # act
+    for price in range(1, 21):
+        book.set_ask(100 + price, price)
+        book.set_bid(100 - price, price)
+    market_data = book.report_market_data(depth=3)
+
+    # assert
+    assert book.best_ask() == {"price": 101, "quantity": 1}
+    assert book.best_bid() == {"price": 99, "quantity": 1}
+    assert [ask['price'] for ask in market_data['asks']] == [101, 102, 103]
+    assert [bid['price'] for bid in market_data['bids']] == [97, 98, 99]
+    assert book.report_market_data(depth=100) == book.report_market_data()
+
+
+@pytest.mark.report
+@pytest.mark.positive
+def test_depth_snapshot_cache_invalidation(order_book):
+    # arrange
+    book = order_book
+    for price in range(1, 11):
+        book.set_ask(price, 1)
+    asks = book.report_market_data(depth=3)['asks']
+
+    # act
+    book.set_ask(50, 1)
+    deep_asks = book.report_market_data(depth=3)['asks']
+    book.set_ask(3, 5)
+    top_asks = book.report_market_data(depth=3)['asks']
+
+    # assert
+    assert deep_asks is asks
+    assert top_asks is not asks
+    assert top_asks[-1] == {"price": 3, "quantity": 6}
+
+
+@pytest.mark.report
+@pytest.mark.negative
+def test_empty_book_best_prices(order_book):
+    # arrange
+    book = order_book
+
+    # act
+    market_data = book.report_market_data(depth=5)
+
+    # assert
+    assert book.best_ask() is None
+    assert book.best_bid() is None
+    assert market_data == {"asks": [], "bids": []}
+
+
+@pytest.mark.report
+@pytest.mark.positive
+def test_deltas_rebuild_book_from_snapshot():
+    # arrange
+    book = OrderBook(record_deltas=True)
+    book.set_ask(10, 5)
+    book.set_bid(9, 5)
+    snapshot = book.snapshot()
+    book.drain_deltas()
+
+    # act
+    ask_id = book.set_ask(10, 3)
+    book.set_ask(11, 1)
+    book.del_bid(1)
+    book.del_ask(ask_id)
+    deltas = book.drain_deltas()
+    levels = {(side[:-1], level['price']): level['quantity']
+              for side in ('asks', 'bids') for level in snapshot[side]}
+    for delta in deltas:
+        levels[delta['side'], delta['price']] = delta['quantity']
+
+    # assert
+    assert [delta['seq'] for delta in deltas] == list(range(snapshot['seq'] + 1, book.seq + 1))
+    assert deltas[-2:] == [
+        {"seq": book.seq - 1, "side": "bid", "price": 9, "quantity": 0},
+        {"seq": book.seq, "side": "ask", "price": 10, "quantity": 5}
+    ]
+    assert {key: quantity for key, quantity in levels.items() if quantity} == {('ask', 10): 5, ('ask', 11): 1}
+    assert book.drain_deltas() == []
+
+
+@pytest.mark.report
+@pytest.mark.negative
+def test_drain_deltas_when_not_recorded(order_book):
+    # arrange
+    book = order_book
+
+    # act
+    with pytest.raises(ValueError) as err:
+        book.drain_deltas()
+
+    # assert
+    assert 'record_deltas=True' in str(err.value)
+
+
+@pytest.mark.bid
+@pytest.mark.positive
+def test_matching_bid_sweeps_asks_by_price_time():
+    # arrange
+    book = OrderBook(matching=True)
+    first = book.set_ask(10, 5)
+    second = book.set_ask(10, 5)
+    third = book.set_ask(11, 5)
+    book.set_ask(12, 5)
+
+    # act
+    bid_id = book.set_bid(11, 12)
+    trades = book.drain_trades()
+    market_data = book.report_market_data()
+
+    # assert
+    assert [(t['price'], t['quantity'], t['ask_id']) for t in trades] == [
+        (10, 5, first), (10, 5, second), (11, 2, third)
+    ]
+    assert all((t['bid_id'], t['aggressor']) == (bid_id, 'bid') for t in trades)
+    assert market_data == {"asks": [{"price": 11, "quantity": 3}, {"price": 12, "quantity": 5}], "bids": []}
+    assert book.get_bid(bid_id) is None
+    assert book.get_ask(first) is None
+    assert book.get_ask(third).quantity == 3
+
+
+@pytest.mark.ask
+@pytest.mark.positive
+def test_matching_ask_rests_remainder():
+    # arrange
+    book = OrderBook(matching=True)
+    bid_id = book.set_bid(9.5, 4)
+    book.set_bid(9, 4)
+
+    # act
+    ask_id = book.set_ask(9.5, 10)
+    trades = book.drain_trades()
+
+    # assert
+    assert trades == [{"price": 9.5, "quantity": 4, "ask_id": ask_id, "bid_id": bid_id, "aggressor": "ask"}]
+    assert book.best_ask() == {"price": 9.5, "quantity": 6}
+    assert book.best_bid() == {"price": 9, "quantity": 4}
+    assert book.drain_trades() == []
+
+
+@pytest.mark.bid
+@pytest.mark.positive
+def test_ioc_bid_fills_and_drops_remainder():
+    # arrange
+    book = OrderBook(matching=True)
+    ask_id = book.set_ask(10, 3)
+    book.set_ask(11, 5)
+
+    # act
+    bid_id = book.set_bid(10, 5, tif='IOC')
+    trades = book.drain_trades()
+
+    # assert
+    assert trades == [{"price": 10, "quantity": 3, "ask_id": ask_id, "bid_id": bid_id, "aggressor": "bid"}]
+    assert book.get_bid(bid_id) is None
+    assert book.report_market_data() == {"asks": [{"price": 11, "quantity": 5}], "bids": []}
+
+
+@pytest.mark.ask
+@pytest.mark.positive
+@pytest.mark.parametrize("quantity, filled", [(8, 8), (9, 0)])
+def test_fok_ask_fills_fully_or_not_at_all(quantity, filled):
+    # arrange
+    book = OrderBook(matching=True)
+    book.set_bid(10, 3)
+    book.set_bid(9, 5)
+    book.set_bid(8, 5)
+
+    # act
+    ask_id = book.set_ask(9, quantity, tif='FOK')
+    trades = book.drain_trades()
+
+    # assert
+    assert sum(t['quantity'] for t in trades) == filled
+    assert book.get_ask(ask_id) is None
+    assert book.best_ask() is None
+
+
+@pytest.mark.ask
+@pytest.mark.positive
+def test_gtd_orders_expire_through_cancel_path():
+    # arrange
+    book = OrderBook(record_deltas=True)
+    early = book.set_ask(10, 1, tif='GTD', expires=100)
+    late = book.set_ask(10, 2, tif='GTD', expires=200)
+    cancelled = book.set_ask(11, 3, tif='GTD', expires=100)
+    day = book.set_ask(12, 4)
+    book.del_ask(cancelled)
+    book.drain_deltas()
+
+    # act
+    first = book.expire(150)
+    second = book.expire(150)
+    third = book.expire(200)
+
+    # assert
+    assert [ask.id for ask in first] == [early]
+    assert second == []
+    assert [ask.id for ask in third] == [late]
+    assert [(d['price'], d['quantity']) for d in book.drain_deltas()] == [(10, 2), (10, 0)]
+    assert book.report_market_data()['asks'] == [{"price": 12, "quantity": 4}]
+    assert book.get_ask(day) is not None
+
+
+TIF_NEGATIVE_SUIT = [
+    ({"tif": 'DAY'}, Err.TIF_VALUE),  # неизвестный режим
+    ({"tif": 'GTD'}, Err.EXPIRES_MISSING),  # GTD без времени истечения
+    ({"tif": 'GTC', "expires": 100}, Err.EXPIRES_UNEXPECTED),  # время истечения не для GTD
+    ({"expires": 100}, Err.EXPIRES_UNEXPECTED),  # время истечения без tif
+    ({"tif": 'GTD', "expires": '100'}, '<expires> must be Float or Integer'),  # время истечения строкой
+    ({"tif": 'IOC'}, Err.TIF_MATCHING)  # IOC в стакане без сведения
+]
+
+
+@pytest.mark.bid
+@pytest.mark.negative
+@pytest.mark.parametrize("options, expect", TIF_NEGATIVE_SUIT)
+def test_set_bid_tif_negative(order_book, options, expect):
+    # act
+    with pytest.raises(ValueError) as err:
+        order_book.set_bid(10, 1, **options)
+
+    # assert
+    assert str(err.value) == expect
+    assert order_book.report_market_data() == {"asks": [], "bids": []}
+
+
+@pytest.mark.ask
+@pytest.mark.negative
+@pytest.mark.parametrize("options", [{"expires": 100}, {"tif": 'GTC', "expires": 100}])
+def test_set_ask_expires_requires_gtd(order_book, options):
+    # act
+    with pytest.raises(ValueError) as err:
+        order_book.set_ask(10, 1, **options)
+    ask_id = order_book.set_ask(10, 1, tif='GTD', expires=100)
+
+    # assert
+    assert str(err.value) == Err.EXPIRES_UNEXPECTED
+    assert [obj.id for obj in order_book.expire(100)] == [ask_id]
+    assert order_book.report_market_data() == {"asks": [], "bids": []}
+
+
+@pytest.mark.report
+@pytest.mark.positive
+def test_many_levels_stay_sorted_after_inserts_and_removals():
+    # arrange
+    rnd = Random(12)
+    book = OrderBook(matching=True)
+    ids = {"ask": [], "bid": []}
+    prices = {"ask": {}, "bid": {}}
+
+    for step in range(6000):
+        # act
+        side = rnd.choice(("ask", "bid"))
+        if rnd.random() < 0.7 or not ids[side]:
+            price = rnd.randint(10001, 20000) if side == 'ask' else rnd.randint(1, 10000)
+            ids[side].append((getattr(book, 'set_' + side)(price, 1), price))
+            prices[side][price] = prices[side].get(price, 0) + 1
+        else:
+            by_id, price = ids[side].pop(rnd.randrange(len(ids[side])))
+            getattr(book, 'del_' + side)(by_id)
+            prices[side][price] -= 1
+            if not prices[side][price]:
+                del prices[side][price]
+        if step % 500:
+            continue
+
+        # assert
+        asks, bids = sorted(prices['ask']), sorted(prices['bid'])
+        assert [level['price'] for level in book.report_market_data()['asks']] == asks
+        assert [level['price'] for level in book.report_market_data()['bids']] == bids
+        assert [level['price'] for level in book.report_market_data(depth=5)['bids']] == bids[-5:]
+        assert [(book.best_ask() or {}).get('price'), (book.best_bid() or {}).get('price')] == \
+            [asks[0] if asks else None, bids[-1] if bids else None]
+
+    # снятие заявок пакетом и исполнение встречной заявкой удаляют уровни из середины и с края списка
+    book.del_asks([by_id for by_id, _ in ids['ask'][::3]])
+    book.set_bid(15000, 10 ** 6)
+    remaining = {price for _, price in ids['ask'][1::3] + ids['ask'][2::3] if price > 15000}
+    assert [level['price'] for level in book.report_market_data()['asks']] == sorted(remaining)
+
+
+def linear_depth(levels: list, quantity: int) -> tuple:
+    filled, notional = 0, 0
+    for level in levels:
+        take = min(level['quantity'], quantity - filled)
+        filled += take
+        notional += take * level['price']
+        if filled == quantity:
+            return level['price'], notional / quantity
+    return None, None
+
+
+@pytest.mark.report
+@pytest.mark.positive
+@pytest.mark.parametrize("tick_size", [None, 0.01])
+def test_depth_queries_match_linear_sums(tick_size):
+    # arrange
+    rnd = Random(7)
+    book = OrderBook(tick_size=tick_size)
+    ids = {"ask": [], "bid": []}
+    book.depth_up_to(10, 'ask')
+    book.depth_up_to(10, 'bid')
+
+    for step in range(600):
+        # act
+        side = rnd.choice(("ask", "bid"))
+        action = rnd.random()
+        if action < 0.6 or not ids[side]:
+            price = rnd.randint(900, 1100) / 100 if side == 'ask' else rnd.randint(700, 950) / 100
+            setter = book.set_ask if side == 'ask' else book.set_bid
+            ids[side].append(setter(price, rnd.randint(1, 20)))
+        elif action < 0.8:
+            by_id = ids[side].pop(rnd.randrange(len(ids[side])))
+            (book.del_ask if side == 'ask' else book.del_bid)(by_id)
+        else:
+            by_id = rnd.choice(ids[side])
+            (book.amend_ask if side == 'ask' else book.amend_bid)(by_id, quantity=rnd.randint(1, 20))
+        if step % 7:
+            continue
+
+        # assert
+        market_data = book.report_market_data()
+        asks, bids = market_data['asks'], market_data['bids'][::-1]
+        limit = rnd.randint(900, 1100) / 100
+        assert book.depth_up_to(limit, 'ask') == sum(l['quantity'] for l in asks if l['price'] <= limit)
+        assert book.depth_up_to(limit, 'bid') == sum(l['quantity'] for l in bids if l['price'] >= limit)
+        for side_name, levels in (("ask", asks), ("bid", bids)):
+            quantity = rnd.randint(1, 300)
+            price, vwap = linear_depth(levels, quantity)
+            assert book.price_for_quantity(quantity, side_name) == price
+            assert book.sweep_vwap(quantity, side_name) == (None if vwap is None else pytest.approx(vwap))
+
+
+@pytest.mark.report
+@pytest.mark.positive
+@pytest.mark.parametrize("tick_size, ticks", [(None, 2000), (0.01, 2000), (0.01, 10 ** 7)])
+def test_depth_queries_follow_new_levels(tick_size, ticks):
+    # arrange
+    rnd = Random(11)
+    book = OrderBook(tick_size=tick_size)
+    ids = {"ask": [book.set_ask(rnd.randint(1, ticks) / 100, 1) for _ in range(200)],
+           "bid": [book.set_bid(rnd.randint(1, ticks) / 100, 1) for _ in range(200)]}
+    book.depth_up_to(10, 'ask')
+    book.depth_up_to(10, 'bid')
+
+    for step in range(3000):
+        # act
+        side = rnd.choice(("ask", "bid"))
+        if rnd.random() < 0.8 or not ids[side]:
+            setter = book.set_ask if side == 'ask' else book.set_bid
+            ids[side].append(setter(rnd.randint(1, ticks) / 100, rnd.randint(1, 20)))
+        else:
+            by_id = ids[side].pop(rnd.randrange(len(ids[side])))
+            (book.del_ask if side == 'ask' else book.del_bid)(by_id)
+        if step % 50:
+            continue
+
+        # assert
+        market_data = book.report_market_data()
+        asks, bids = market_data['asks'], market_data['bids'][::-1]
+        limit = rnd.randint(1, ticks) / 100
+        assert book.depth_up_to(limit, 'ask') == sum(l['quantity'] for l in asks if l['price'] <= limit)
+        assert book.depth_up_to(limit, 'bid') == sum(l['quantity'] for l in bids if l['price'] >= limit)
+        for side_name, levels in (("ask", asks), ("bid", bids)):
+            quantity = rnd.randint(1, 10000)
+            price, vwap = linear_depth(levels, quantity)
+            assert book.price_for_quantity(quantity, side_name) == price
+            assert book.sweep_vwap(quantity, side_name) == (None if vwap is None else pytest.approx(vwap))
+
+
+@pytest.mark.report
+@pytest.mark.negative
+def test_depth_queries_negative(order_book):
+    # arrange
+    order_book.set_ask(10, 5)
+
+    # act
+    with pytest.raises(ValueError) as err:
+        order_book.depth_up_to(10, 'sell')
+
+    # assert
+    assert str(err.value) == "<side> must be 'ask' or 'bid'"
+    assert order_book.price_for_quantity(6) is None
+    assert order_book.sweep_vwap(6) is None
+    assert order_book.depth_up_to(9.99) == 0
+    with pytest.raises(ValueError):
+        order_book.price_for_quantity(0)
+
+
+@pytest.mark.positive
+def test_cancel_all_by_owner():
+    # arrange
+    book = OrderBook(record_deltas=True)
+    first = book.set_ask(10, 1, owner='alice')
+    book.set_ask(10, 2, owner='bob')
+    book.set_ask(11, 3, owner='alice')
+    bid_ids = book.set_bids([9, 8], [4, 5], owner='alice')
+    book.drain_deltas()
+
+    # act
+    removed, deltas = book.cancel_all('alice', side='ask', price_range=(10, 10.5))
+    rest, rest_deltas = book.cancel_all('alice')
+
+    # assert
+    assert [obj.id for obj in removed] == [first]
+    assert deltas == [{"seq": 6, "side": "ask", "price": 10, "quantity": 2}]
+    assert sorted((obj.__class__.__name__, obj.id) for obj in rest) == [("Ask", 3), ("Bid", 1), ("Bid", 2)]
+    assert book.drain_deltas() == deltas + rest_deltas
+    assert book.report_market_data() == {"asks": [{"price": 10, "quantity": 2}], "bids": []}
+    assert book.cancel_all('alice') == ([], [])
+    assert bid_ids == [1, 2]
+
+
+@pytest.mark.positive
+def test_cancel_all_skips_filled_and_cancelled_orders():
+    # arrange
+    book = OrderBook(matching=True)
+    filled = book.set_ask(10, 2, owner='alice')
+    cancelled = book.set_ask(11, 2, owner='alice')
+    partial = book.set_ask(12, 5, owner='alice')
+    book.set_bid(10, 2)
+    book.del_ask(cancelled)
+    book.set_bid(12, 1)
+
+    # act
+    removed, _ = book.cancel_all('alice')
+
+    # assert
+    assert [(obj.id, obj.quantity) for obj in removed] == [(partial, 4)]
+    assert book.get_ask(filled) is None
+    assert book.best_ask() is None
+
+
+@pytest.mark.negative
+@pytest.mark.parametrize("options, expect",
+                         [({"side": "sell"}, "<side> must be 'ask' or 'bid'"),
+                          ({"price_range": (11, 10)}, '<price_range> must be (min, max)'),
+                          ({"price_range": (0, 10)}, Err.PRICE_ZERO)])
+def test_cancel_all_negative(order_book, options, expect):
+    # arrange
+    order_book.set_ask(10, 1, owner='alice')
+
+    # act
+    with pytest.raises(ValueError) as err:
+        order_book.cancel_all('alice', **options)
+
+    # assert
+    assert str(err.value) == expect
+    assert order_book.best_ask() == {"price": 10, "quantity": 1}
+
+
+@pytest.mark.ask
+@pytest.mark.positive
+def test_amend_ask_quantity_keeps_or_loses_priority(order_book):
+    # arrange
+    first = order_book.set_ask(10, 5)
+    second = order_book.set_ask(10, 5)
+    third = order_book.set_ask(10, 5)
+
+    # act
+    order_book.amend_ask(first, quantity=2)
+    order_book.amend_ask(second, quantity=7)
+    queue = [(obj.id, obj.quantity) for obj in order_book.asks.levels[10]]
+
+    # assert
+    assert queue == [(first, 2), (third, 5), (second, 7)]
+    assert order_book.best_ask() == {"price": 10, "quantity": 14}
+
+
+@pytest.mark.bid
+@pytest.mark.positive
+def test_amend_bid_price_moves_order_between_levels(order_book):
+    # arrange
+    first = order_book.set_bid(9, 5)
+    second = order_book.set_bid(9.5, 3)
+
+    # act
+    bid = order_book.amend_bid(first, quantity=4, price=9.5)
+    market_data = order_book.report_market_data()
+
+    # assert
+    assert (bid.id, bid.price, bid.quantity) == (first, 9.5, 4)
+    assert market_data == {"asks": [], "bids": [{"price": 9.5, "quantity": 7}]}
+    assert [obj.id for obj in order_book.bids.levels[9.5]] == [second, first]
+
+
+@pytest.mark.bid
+@pytest.mark.positive
+def test_amend_bid_crossing_price_matches():
+    # arrange
+    book = OrderBook(matching=True)
+    ask_id = book.set_ask(10, 3)
+    bid_id = book.set_bid(9, 5)
+
+    # act
+    bid = book.amend_bid(bid_id, price=10)
+    trades = book.drain_trades()
+
+    # assert
+    assert trades == [{"price": 10, "quantity": 3, "ask_id": ask_id, "bid_id": bid_id, "aggressor": "bid"}]
+    assert bid.quantity == 2
+    assert book.report_market_data() == {"asks": [], "bids": [{"price": 10, "quantity": 2}]}
+
+
+@pytest.mark.ask
+@pytest.mark.negative
+@pytest.mark.parametrize("by_id, quantity, price, expect",
+                         [(1, None, None, Err.AMEND_EMPTY),
+                          (1, 0, None, Err.QUANTITY_ZERO),
+                          (1, None, 'a', Err.PRICE_TYPE),
+                          ('1', 1, None, Err.ID_TYPE)])
+def test_amend_ask_negative(order_book, by_id, quantity, price, expect):
+    # arrange
+    order_book.set_ask(10, 5)
+
+    # act
+    with pytest.raises(ValueError) as err:
+        order_book.amend_ask(by_id, quantity, price)
+
+    # assert
+    assert str(err.value) == expect
+    assert order_book.amend_ask(2, quantity=1) is None
+
+
+@pytest.mark.ask
+@pytest.mark.positive
+@pytest.mark.parametrize("order_objects",
+                         [POSITIVE_MARKET_DATA_SUIT])
+def test_set_asks_batch_matches_single_inserts(order_objects):
+    # arrange
+    single, batch = OrderBook(), OrderBook()
+    prices = [obj['price'] for obj in order_objects]
+    quantities = [obj['quantity'] for obj in order_objects]
+    single.set_ask(50, 1)
+    batch.set_ask(50, 1)
+
+    # act
+    for price, quantity in zip(prices, quantities):
+        single.set_ask(price, quantity)
+    ids = batch.set_asks(prices, quantities)
+
+    # assert
+    assert ids == list(range(2, len(prices) + 2))
+    assert batch.ask_id == single.ask_id
+    assert batch.report_market_data() == single.report_market_data()
+
+
+@pytest.mark.bid
+@pytest.mark.positive
+def test_set_bids_with_ids_and_del_bids(order_book):
+    # arrange
+    book = order_book
+
+    # act
+    book.set_bids([1, 2, 2, 3], [1, 2, 3, 4], ids=[10, 4, 7, 1])
+    next_id = book.set_bid(5, 1)
+    removed = book.del_bids([4, 7, 1, 999])
+
+    # assert
+    assert next_id == 11
+    assert [bid.id for bid in removed] == [4, 7, 1]
+    assert book.report_market_data()['bids'] == [{"price": 1, "quantity": 1}, {"price": 5, "quantity": 1}]
+
+
+NEGATIVE_BATCH_SUIT = [
+    ([1, 2], [1, 0], None, Err.QUANTITY_ZERO),  # попытка передать в пакете нулевое количество
+    ([1, "2"], [1, 1], None, Err.PRICE_TYPE),  # попытка передать в пакете строку в качестве цены
+    ([1, 2], [1], None, '<quantity> must have the same length as <price>'),  # разная длина цен и количеств
+    ([1, 2], [1, 1], [5, 5], '<id> must be unique'),  # повторяющиеся id в пакете
+    ([1, 2], [1, 1], [1, 2], '<id> must be unique'),  # id уже стоящей в стакане заявки
+    ([1, 2], [1, True], None, Err.QUANTITY_TYPE),  # попытка передать в пакете bool в качестве количества
+    ([1, -2.5], [1, 1], None, Err.PRICE_ZERO),  # отрицательная цена в пакете
+    ([1, 2], [1, 1], [3, 0], Err.ID_ZERO)  # нулевой id в пакете
+]
+
+
+@pytest.mark.ask
+@pytest.mark.negative
+@pytest.mark.parametrize("prices, quantities, ids, expect",
+                         NEGATIVE_BATCH_SUIT)
+def test_set_asks_batch_negative(order_book, prices, quantities, ids, expect):
+    # arrange
+    book = order_book
+    book.set_ask(7, 7)
+
+    # act
+    with pytest.raises(ValueError) as err:
+        book.set_asks(prices, quantities, ids)
+
+    # assert
+    assert str(err.value) == expect
+    assert book.report_market_data()['asks'] == [{"price": 7, "quantity": 7}]
+
+
+@pytest.mark.positive
+@pytest.mark.parametrize("capacity, matching", [(8, False), (8, True), (256, True)])
+def test_dense_book_matches_sorted_book(capacity, matching):
+    # arrange
+    rnd = Random(capacity)
+    sorted_book = OrderBook(tick_size=0.01, matching=matching, record_deltas=True)
+    dense_book = OrderBook(tick_size=0.01, matching=matching, record_deltas=True, dense=capacity)
+    ids = {"ask": [], "bid": []}
+    mid = 1000
+
+    for step in range(1500):
+        # act
+        # цена дрейфует и иногда прыгает далеко за окно, чтобы окно перестраивалось и уровни уходили за его края
+        mid = max(500, mid + rnd.randint(-3, 3) + (rnd.randint(-200, 200) if rnd.random() < 0.01 else 0))
+        side = rnd.choice(("ask", "bid"))
+        if rnd.random() < 0.6 or not ids[side]:
+            offset = rnd.randint(0, 30) if rnd.random() < 0.9 else rnd.randint(0, 300)
+            price = (mid + offset if side == 'ask' else mid - offset) / 100
+            quantity = rnd.randint(1, 10)
+            ids[side].append(getattr(sorted_book, 'set_' + side)(price, quantity))
+            getattr(dense_book, 'set_' + side)(price, quantity)
+        else:
+            by_id = ids[side].pop(rnd.randrange(len(ids[side])))
+            for book in (sorted_book, dense_book):
+                getattr(book, 'del_' + side)(by_id)
+        if step % 11:
+            continue
+
+        # assert
+        depth = rnd.randint(1, 5)
+        assert dense_book.snapshot() == sorted_book.snapshot()
+        assert dense_book.report_market_data(depth) == sorted_book.report_market_data(depth)
+        assert (dense_book.best_ask(), dense_book.best_bid()) == (sorted_book.best_ask(), sorted_book.best_bid())
+        assert dense_book.drain_deltas() == sorted_book.drain_deltas()
+        assert dense_book.drain_trades() == sorted_book.drain_trades()
+
+
+@pytest.mark.negative
+def test_dense_book_requires_tick_size():
+    # act
+    with pytest.raises(ValueError) as err:
+        OrderBook(dense=1024)
+
+    # assert
+    assert str(err.value) == '<dense> requires <tick_size>'
+
+
+@pytest.mark.positive
+@pytest.mark.parametrize("tick_size", [None, 0.01])
+def test_trusted_book_matches_checked_book(tick_size):
+    # arrange
+    checked = OrderBook(tick_size=tick_size)
+    trusted = OrderBook(tick_size=tick_size, trusted=True)
+
+    # act
+    for book in (checked, trusted):
+        ask_id = book.set_ask(10.05, 3)
+        book.set_bid(9.95, 2)
+        book.set_asks([10.1, 10.05], [1, 4])
+        book.set_bids([9.9, 9.95], [5, 1], ids=[100, 101])
+        book.amend_ask(ask_id, quantity=2)
+        book.del_bids([100])
+
+    # assert
+    assert trusted.snapshot() == checked.snapshot()
+    assert trusted.get_ask(ask_id).price == checked.get_ask(ask_id).price
+
+
+@pytest.mark.positive
+@pytest.mark.parametrize("as_array", [False, True])
+def test_trusted_book_rounds_prices_like_checked_book(as_array):
+    # arrange
+    prices = [0.1 + 0.2, 0.30001, 0.3, 0.306]
+    if as_array:
+        prices = pytest.importorskip('numpy').array(prices)
+    checked = OrderBook()
+    trusted = OrderBook(trusted=True)
+
+    # act
+    for book in (checked, trusted):
+        ask_id = book.set_ask(0.1 + 0.2, 1)
+        book.set_asks(prices, [1, 2, 3, 4])
+        book.set_bid(0.20001, 5)
+        book.amend_ask(ask_id, price=0.30002)
+
+    # assert
+    assert trusted.snapshot() == checked.snapshot()
+    assert trusted.report_market_data()['asks'] == [{"price": 0.3, "quantity": 7}, {"price": 0.31, "quantity": 4}]
+    assert trusted.depth_up_to(0.30004) == checked.depth_up_to(0.30004) == 7
+
+
+@pytest.mark.negative
+def test_trusted_book_skips_checks():
+    # arrange
+    book = OrderBook(trusted=True)
+
+    # act
+    ask_id = book.set_ask(10, 0)
+
+    # assert
+    assert book.get_ask(ask_id).quantity == 0
+
+
+@pytest.mark.ask
+@pytest.mark.positive
+def test_set_asks_from_numpy_arrays(order_book):
+    # arrange
+    np = pytest.importorskip('numpy')
+    book = order_book
+
+    # act
+    ids = book.set_asks(np.array([2.005, 1.0, 2.0]), np.array([1, 2, 3]))
+    with pytest.raises(ValueError) as err:
+        book.set_asks(np.array([1.0]), np.array([0]))
+
+    # assert
+    assert ids == [1, 2, 3]
+    assert str(err.value) == Err.QUANTITY_ZERO
+    assert book.report_market_data()['asks'] == [{"price": 1.0, "quantity": 2}, {"price": 2.0, "quantity": 4}]
+
+
+@pytest.mark.report
+@pytest.mark.positive
+@pytest.mark.parametrize("tick_size", [None, 0.01])
+def test_market_data_arrays(tick_size):
+    # arrange
+    np = pytest.importorskip('numpy')
+    book = OrderBook(tick_size=tick_size)
+    book.set_asks([10.01, 10.02, 10.01, 10.5], [1, 2, 3, 4])
+    book.set_bids([9.99, 9.5], [5, 6])
+
+    # act
+    arrays = book.market_data_arrays()
+    top = book.market_data_arrays(depth=1)
+    asks = arrays['asks']
+
+    # assert
+    assert asks.dtype.names == ('price', 'quantity')
+    assert asks.tolist() == [(a['price'], a['quantity']) for a in book.report_market_data()['asks']]
+    assert arrays['bids'].tolist() == [(9.5, 6), (9.99, 5)]
+    assert top['bids'].tolist() == [(9.99, 5)]
+    assert np.isclose((asks['price'] * asks['quantity']).sum() / asks['quantity'].sum(), 10.208)
+
+
+@pytest.mark.report
+@pytest.mark.positive
+def test_metrics_count_operations_and_errors(h, order_book):
+    # arrange
+    book = order_book
+    metrics = book.enable_metrics()
+
+    # act
+    ask_id = book.set_ask(10, 5)
+    book.set_bid(9, 5)
+    book.del_ask(ask_id)
+    h.try_to_set_bid(book, 0, 5)
+    book.report_market_data(depth=1)
+    exported = metrics.export()
+    text = metrics.to_text()
+
+    # assert
+    assert exported['operations']['set_bid']['count'] == 2
+    assert exported['operations']['set_bid']['errors'] == 1
+    assert exported['operations']['del_ask']['p50_ns'] > 0
+    assert exported['gauges'] == {"ask_levels": 0, "bid_levels": 1, "ask_orders": 0, "bid_orders": 1, "seq": 3}
+    assert 'order_book_operations_total{op="set_ask"} 1\n' in text
+    assert 'order_book_errors_total{op="set_bid"} 1\n' in text
+    assert 'order_book_latency_seconds_count{op="report_market_data"} 1\n' in text
+
+    # act
+    book.disable_metrics()
+
+    # assert
+    assert book.metrics is None
+    assert 'set_ask' not in vars(book)
+
+
+@pytest.mark.positive
+def test_histogram_quantiles_precision():
+    # arrange
+    histogram = Histogram()
+
+    # act
+    for value in range(1, 100001):
+        histogram.record(value)
+
+    # assert
+    assert histogram.count == 100000
+    assert (histogram.min, histogram.max) == (1, 100000)
+    for q in (0.5, 0.9, 0.99):
+        assert abs(histogram.quantile(q) - q * 100000) / (q * 100000) < 2 ** -4
+
+
+def book_state(book: OrderBook) -> tuple:
+    orders = [(obj.id, obj.price, obj.quantity) for side in (book.asks, book.bids) for level in side for obj in level]
+    return book.snapshot(), orders
+
+
+def scenario(book: OrderBook, rnd: Random) -> None:
+    for _ in range(300):
+        action = rnd.random()
+        side = rnd.choice(('ask', 'bid'))
+        index = getattr(book, side + 's').index
+        if action < 0.4 or not index:
+            price = rnd.randint(95, 105) if side == 'ask' else rnd.randint(90, 100)
+            getattr(book, 'set_' + side)(price / 10, rnd.randint(1, 9))
+        elif action < 0.5:
+            getattr(book, 'set_' + side + 's')([rnd.randint(90, 105) / 10 for _ in range(3)], [1, 2, 3])
+        elif action < 0.75:
+            getattr(book, 'amend_' + side)(rnd.choice(list(index)), quantity=rnd.randint(1, 9))
+        elif action < 0.85:
+            getattr(book, 'amend_' + side)(rnd.choice(list(index)), price=rnd.randint(90, 105) / 10)
+        elif action < 0.95:
+            getattr(book, 'del_' + side)(rnd.choice(list(index)))
+        else:
+            getattr(book, 'del_' + side + 's')(rnd.sample(list(index), min(3, len(index))))
+
+
+@pytest.mark.positive
+@pytest.mark.parametrize("book_options", [{}, {"tick_size": 0.1, "dense": 8}, {"matching": True}])
+def test_clone_is_isolated_from_original(book_options):
+    # arrange
+    rnd = Random(7)
+    book = OrderBook(**book_options)
+    scenario(book, rnd)
+    before = book_state(book)
+
+    # act
+    fork = book.clone()
+    scenario(fork, rnd)
+
+    # assert
+    assert book_state(book) == before
+
+    # act
+    forked = book_state(fork)
+    scenario(book, rnd)
+
+    # assert
+    assert book_state(fork) == forked
+    assert book.seq > before[0]['seq']
+
+
+@pytest.mark.positive
+@pytest.mark.parametrize("book_options", [{}, {"tick_size": 0.1, "dense": 8}, {"matching": True}])
+def test_orders_fetched_before_clone_follow_the_original(book_options):
+    # arrange
+    book = OrderBook(**book_options)
+    ask_id = book.set_ask(10, 5)
+    book.set_ask(10, 1)
+    bid_id = book.set_bid(9, 4)
+    ask, bid = book.get_ask(ask_id), book.get_bid(bid_id)
+    level = next(iter(book.asks))
+
+    # act
+    fork = book.clone()
+    book.amend_ask(ask_id, quantity=3)
+    book.amend_bid(bid_id, price=8)
+    fork.amend_ask(ask_id, quantity=2)
+
+    # assert
+    assert (ask.quantity, bid.price) == (3, book.to_ticks(8) if book.tick_size else 8)
+    assert book.get_ask(ask_id) is ask and book.get_bid(bid_id) is bid
+    assert next(iter(book.asks)) is level and level.quantity == 4
+    assert fork.get_ask(ask_id) is not ask
+    assert fork.report_market_data() == {"asks": [{"price": 10, "quantity": 3}], "bids": [{"price": 9, "quantity": 4}]}
+    assert book.report_market_data() == {"asks": [{"price": 10, "quantity": 4}], "bids": [{"price": 8, "quantity": 4}]}
+
+
+@pytest.mark.positive
+@pytest.mark.parametrize("book_options", [{}, {"tick_size": 0.1, "dense": 8}, {"matching": True}])
+def test_clones_of_clones_stay_isolated(book_options):
+    # arrange
+    rnd = Random(3)
+    book = OrderBook(**book_options)
+    scenario(book, rnd)
+    fork = book.clone()
+    scenario(fork, rnd)
+    nested, sibling = fork.clone(), book.clone()
+    states = [book_state(clone) for clone in (fork, nested, sibling)]
+
+    # act
+    scenario(book, rnd)
+
+    # assert
+    assert [book_state(clone) for clone in (fork, nested, sibling)] == states
+
+    # act
+    original = book_state(book)
+    scenario(fork, rnd)
+
+    # assert
+    assert book_state(book) == original
+    assert [book_state(clone) for clone in (nested, sibling)] == states[1:]
+
+
+@pytest.mark.positive
+def test_clone_matches_book_replayed_with_same_operations():
+    # arrange
+    book = OrderBook(matching=True)
+    scenario(book, Random(1))
+    replayed = OrderBook(matching=True)
+    scenario(replayed, Random(1))
+
+    # act
+    fork = book.clone()
+    scenario(fork, Random(2))
+    scenario(replayed, Random(2))
+    trades = fork.drain_trades()
+
+    # assert
+    assert trades
+    assert replayed.drain_trades()[-len(trades):] == trades
+    assert book_state(fork) == book_state(replayed)
+
+
+@pytest.mark.positive
+def test_clone_copies_owners_and_expiry_timers():
+    # arrange
+    book = OrderBook(record_deltas=True)
+    book.set_ask(10, 1, owner='alice')
+    book.set_ask(11, 2, tif='GTD', expires=5, owner='alice')
+    book.set_bid(9, 3, owner='bob')
+    metrics = book.enable_metrics()
+
+    # act
+    fork = book.clone()
+    removed, _ = fork.cancel_all('alice')
+    expired = book.expire(10)
+
+    # assert
+    assert [obj.id for obj in removed] == [1, 2]
+    assert [obj.id for obj in expired] == [2]
+    assert fork.expire(10) == []
+    assert book.get_ask(1).quantity == 1
+    assert fork.metrics is None and fork.journal is None
+    assert [delta['price'] for delta in fork.drain_deltas()] == [10, 11]
+    assert metrics.export()['operations']['expire']['count'] == 1
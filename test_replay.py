@@ -0,0 +1,79 @@
+from random import Random
+
+import pytest
+
+from order_book import OrderBook
+from order_book.replay import ASK, BID, EventWriter, Replay
+
+
+def write_events(path: str, count: int, block_size: int) -> OrderBook:
+    # параллельно с записью применяем события к эталонному стакану
+    rnd = Random(11)
+    expect = OrderBook()
+    resting = {ASK: [], BID: []}
+    with EventWriter(path, block_size=block_size) as writer:
+        for i in range(count):
+            side = rnd.choice((ASK, BID))
+            ts = 1000 + i * 10
+            if resting[side] and rnd.random() < 0.3:
+                order_id = resting[side].pop(rnd.randrange(len(resting[side])))
+                writer.delete(ts, side, order_id)
+                (expect.del_bid if side == BID else expect.del_ask)(order_id)
+            else:
+                price, quantity = rnd.randint(90, 110) / 10, rnd.randint(1, 50)
+                writer.add(ts, side, i + 1, price, quantity)
+                (expect.set_bids if side == BID else expect.set_asks)([price], [quantity], [i + 1])
+                resting[side].append(i + 1)
+    return expect
+
+
+@pytest.mark.replay
+@pytest.mark.positive
+def test_replay_matches_direct_application(tmp_path):
+    # arrange
+    path = str(tmp_path / 'events.bin')
+    expect = write_events(path, 1000, block_size=64)
+    book = OrderBook()
+
+    # act
+    replay = Replay(book, path, snapshot_every=250, depth=5)
+    snapshots = list(replay)
+
+    # assert
+    assert replay.events == 1000
+    assert replay.events_per_sec > 0
+    assert [snapshot['events'] for snapshot in snapshots] == [250, 500, 750, 1000]
+    assert snapshots[-1]['asks'] == expect.report_market_data(depth=5)['asks']
+    assert book.report_market_data() == expect.report_market_data()
+
+
+@pytest.mark.replay
+@pytest.mark.positive
+def test_replay_snapshots_by_timestamp(tmp_path):
+    # arrange
+    path = str(tmp_path / 'events.bin')
+    write_events(path, 100, block_size=7)
+
+    # act
+    snapshots = list(Replay(OrderBook(), path, snapshot_interval=200))
+    stats = Replay(OrderBook(), path, snapshot_interval=200).run()
+
+    # assert
+    assert [snapshot['ts'] for snapshot in snapshots] == list(range(1200, 2000, 200))
+    assert [snapshot['events'] for snapshot in snapshots] == [20, 40, 60, 80]
+    assert (stats['events'], stats['snapshots']) == (100, 4)
+
+
+@pytest.mark.replay
+@pytest.mark.negative
+def test_replay_rejects_foreign_file(tmp_path):
+    # arrange
+    path = tmp_path / 'events.bin'
+    path.write_bytes(b'definitely not events')
+
+    # act
+    with pytest.raises(ValueError) as err:
+        list(Replay(OrderBook(), str(path)))
+
+    # assert
+    assert str(err.value) == 'not an order book event file'